@@ -1,21 +1,43 @@
-import io
+import collections
+import contextlib
+import datetime
+import hashlib
 import json
 import logging
 import os
+import resource
+import signal
+import subprocess
+import sys
 import tempfile
 import zipfile
+from collections.abc import Callable, Iterator
+from pathlib import Path
 
 import polars as pl
-import requests
+from sqlalchemy import delete, exists, func, select, text, tuple_
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.decl_api import DeclarativeAttributeIntercept
 
-from ..models.models import Calendar, Segment, Stop, Trip, TripSegment
+from ..config import FeedConfig, settings
+from ..models.models import (
+    Calendar,
+    GtfsMetadata,
+    Segment,
+    Stop,
+    Trip,
+    TripSegment,
+    VehicleLocation,
+)
+from ..utils import metrics, partitions, table_swap
 from ..utils.db import BaseDatabase
+from ..utils.gtfs_cache import GtfsCache
+from ..utils.helpers import service_day_cache
+from ..utils.http import get_client
 from ..utils.logger import MyLogger, log
+from ..utils.shapes import snap_stops
 
-GTFS_URL = "https://gtfs.at.govt.nz/gtfs.zip"
 FILES_NEEDED = {
     "routes.txt",
     "trips.txt",
@@ -24,21 +46,196 @@ FILES_NEEDED = {
     "shapes.txt",
     "calendar.txt",
 }
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Tables returned by _build_dataframes, in order, as named by the build worker
+BUILD_OUTPUTS = ("relevant_trips", "trip_segments", "key_segments", "calendar", "stops")
+# Directory containing the `app` package, for running `python -m app...`
+APP_ROOT = Path(__file__).resolve().parents[2]
+# Table groups and the inputs (file hashes, journeys) they are built from. Only the
+# groups whose inputs changed since the last applied feed are rebuilt.
+DERIVED_INPUTS = {
+    "calendar": ("sha256:calendar.txt",),
+    "network": (
+        "sha256:stops.txt",
+        "sha256:stop_times.txt",
+        "sha256:trips.txt",
+        "sha256:shapes.txt",
+        "sha256:JOURNEYS",
+        "network_scope",
+    ),
+}
+
+# Tables replaced together by the "swap" load mode, parents before children
+SWAP_MODELS = (Calendar, Stop, Trip, Segment, TripSegment)
+# Columns holding feed IDs, prefixed with the feed's namespace
+ID_COLUMNS = (
+    "stop_id",
+    "trip_id",
+    "route_id",
+    "service_id",
+    "shape_id",
+    "segment_id",
+    "start_stop_id",
+    "end_stop_id",
+)
+# pg_advisory_lock key held while a swap-mode refresh loads and swaps, as each
+# feed's swap carries over the other feeds' live rows, and while ensure_schema
+# migrates
+SWAP_LOCK_KEY = 0x67746673
+
+# PostgreSQL's wire protocol allows at most 65535 bind parameters per statement
+MAX_BIND_PARAMS = 65_535
+PYTHON_DTYPES = {str: pl.String, int: pl.Int64, float: pl.Float64}
+
+
+def diff_rows(
+    new: pl.DataFrame, current: pl.DataFrame, key: list[str]
+) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """Compare two versions of a table by primary key and per-row hash.
+
+    Returns the rows of `new` that are not in `current`, the rows of `new` whose
+    hash differs from the `current` row with the same key, and the keys of the
+    `current` rows missing from `new`.
+    """
+    row_hash = pl.struct(new.columns).hash().alias("row_hash")
+    inserts = new.join(current, on=key, how="anti")
+    updates = (
+        new.with_columns(row_hash)
+        .join(current.select(*key, row_hash.alias("current_hash")), on=key, how="inner")
+        .filter(pl.col("row_hash") != pl.col("current_hash"))
+        .select(new.columns)
+    )
+    stale = current.join(new, on=key, how="anti").select(key)
+    return inserts, updates, stale
+
+
+def match_journeys(trip_stop_codes: pl.DataFrame, journeys: list[tuple]) -> pl.Series:
+    """Trip ids whose stop codes include every stop of at least one journey.
+
+    Joins the trip stop rows to the journeys on stop_code and keeps the (trip,
+    journey) pairs that hit every distinct stop of the journey, so the work scales
+    with the matching rows rather than trips x journeys.
+    """
+    stop_code_dtype = trip_stop_codes.schema["stop_code"]
+    journey_stops = (
+        pl.DataFrame(
+            {
+                "journey": [i for i, journey in enumerate(journeys) for _ in journey],
+                "stop_code": [str(code) for journey in journeys for code in journey],
+            }
+        )
+        .with_columns(pl.col("stop_code").cast(stop_code_dtype, strict=False))
+        .unique()
+        .with_columns(journey_len=pl.len().over("journey"))
+    )
+    return (
+        trip_stop_codes.lazy()
+        .select("trip_id", "stop_code")
+        .join(journey_stops.lazy(), on="stop_code")
+        .group_by("trip_id", "journey")
+        .agg(pl.col("stop_code").n_unique(), pl.first("journey_len"))
+        .filter(pl.col("stop_code") == pl.col("journey_len"))
+        .collect()
+        .get_column("trip_id")
+        .unique(maintain_order=True)
+    )
+
+
+def namespace_ids(df: pl.DataFrame, namespace: str) -> pl.DataFrame:
+    """Prefix the ID columns of `df` with "`namespace`:", unless it is empty."""
+    if not namespace:
+        return df
+    return df.with_columns(
+        pl.concat_str(pl.lit(f"{namespace}:"), pl.col(col).cast(pl.String)).alias(col)
+        for col in ID_COLUMNS
+        if col in df.columns
+    )
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
 
 class Controller(BaseDatabase):
-    def __init__(self) -> None:
+    """Refreshes one GTFS feed, by default the first in `settings.gtfs_feeds`.
+
+    Its rows carry the feed's name in `feed_id` and its namespace on their IDs, and
+    every read, write and delete is limited to them, so feeds never touch each
+    other's data.
+    """
+
+    def __init__(self, feed: FeedConfig | None = None) -> None:
         super().__init__()
         self.logger: logging.Logger = MyLogger().get_logger()
+        self.feed = feed or settings.gtfs_feeds[0]
+        self.refresh_stats: dict[str, float] = {}
+        self._schema_ready = False
+        # Called with the name of each refresh phase as it starts
+        self.on_progress: Callable[[str], None] = lambda phase: None
+        self.cache = GtfsCache(
+            str(Path(settings.gtfs_cache_dir) / self.feed.name),
+            settings.gtfs_cache_max_versions,
+        )
+        metrics.register(
+            f"gtfs_refresh:{self.feed.name}", lambda: dict(self.refresh_stats)
+        )
 
     @log
-    def _download_gtfs(self, data_path: str) -> None:
+    def _download_gtfs(
+        self, data_path: str, previous: dict[str, str]
+    ) -> dict[str, str] | None:
+        """Stream the GTFS zip to `data_path`/gtfs.zip and verify it.
+
+        Sends the validators stored from the last applied feed, and returns None if
+        the server answers 304 Not Modified. Otherwise returns the new validators
+        and the archive's sha256.
+        """
+        archive = Path(data_path) / "gtfs.zip"
+        headers = {}
+        if "etag" in previous:
+            headers["If-None-Match"] = previous["etag"]
+        if "last_modified" in previous:
+            headers["If-Modified-Since"] = previous["last_modified"]
+
         self.logger.info("Downloading GTFS zip...")
-        response = requests.get(GTFS_URL, timeout=60)
-        response.raise_for_status()
+        digest = hashlib.sha256()
+        with (
+            get_client(self.feed.url).stream(
+                "GET", self.feed.url, headers=headers, timeout=60
+            ) as response,
+            archive.open("wb") as f,
+        ):
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+            expected = response.headers.get("Content-Length")
+            received = response.num_bytes_downloaded
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "archive_sha256": digest.hexdigest(),
+            }
+
+        if expected is not None and int(expected) != received:
+            raise RuntimeError(
+                f"GTFS download truncated: got {received} of {expected} bytes"
+            )
+        if not zipfile.is_zipfile(archive):
+            raise RuntimeError("GTFS download is not a valid zip archive")
+        self.refresh_stats["download_bytes"] = archive.stat().st_size
+        return {key: value for key, value in validators.items() if value is not None}
 
+    @log
+    def _extract_gtfs(self, data_path: str) -> dict[str, str]:
+        """Extract only FILES_NEEDED from the archive and return their sha256s."""
+        archive = Path(data_path) / "gtfs.zip"
         self.logger.info("Extracting required GTFS files...")
-        with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        # Reading each member checks its CRC, so a corrupt file fails here
+        with zipfile.ZipFile(archive) as zf:
             available = set(zf.namelist())
             for filename in FILES_NEEDED:
                 if filename in available:
@@ -47,28 +244,127 @@ class Controller(BaseDatabase):
                     raise RuntimeError(
                         f"Required GTFS file not found in zip: {filename}"
                     )
+        archive.unlink()
 
-    @log
-    def _build_dataframes(
-        self, data_path: str
-    ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
-        """Process GTFS files and return (relevant_trips, segments, key_segments).
+        hashes = {}
+        for filename in FILES_NEEDED:
+            with (Path(data_path) / filename).open("rb") as f:
+                hashes[f"sha256:{filename}"] = hashlib.file_digest(
+                    f, "sha256"
+                ).hexdigest()
+        return hashes
 
-        Three-phase approach to avoid peak memory from a full-dataset shapes join:
-          Phase 1 — scan stop_times + stops (no shapes) to find candidate trip_ids
-                     whose stop sets are supersets of at least one journey.
-          Phase 2 — run the full shapes join only for candidate trips (~100x smaller).
-          Phase 3 — reuse Phase 1 data to find all trips traversing key segments
-                     (no shapes needed for this).
+    def ensure_schema(self) -> None:
+        """Bring databases initialised from an older init.sql up to date.
+
+        Adds gtfs_metadata, segments.length_m, and the feed_id columns with the
+        rows already there given to the first feed, which was the only one before
+        feeds were added. vehicle_locations' primary key gains feed_id, as vehicle
+        ids are only unique within a feed.
         """
-        journeys = [tuple(j) for j in json.loads(os.environ["JOURNEYS"])]
+        if self._schema_ready:
+            return
+        first = settings.gtfs_feeds[0].name
+        with self.get_session() as session:
+            # Workers start together, so one migrates while the others wait and
+            # then find it done. Released at commit.
+            session.execute(select(func.pg_advisory_xact_lock(SWAP_LOCK_KEY)))
+            GtfsMetadata.__table__.create(session.connection(), checkfirst=True)
+            with_feed = set(
+                session.scalars(
+                    text(
+                        "SELECT table_name FROM information_schema.columns "
+                        "WHERE table_schema = 'public' AND column_name = 'feed_id'"
+                    )
+                )
+            )
+            for name in [m.__tablename__ for m in SWAP_MODELS]:
+                if name in with_feed:
+                    continue
+                # The default only fills in the existing rows
+                session.execute(
+                    text(
+                        f"ALTER TABLE {name} ADD COLUMN feed_id VARCHAR(255) NOT NULL "
+                        f"DEFAULT '{first}'"
+                    )
+                )
+                session.execute(
+                    text(f"ALTER TABLE {name} ALTER COLUMN feed_id DROP DEFAULT")
+                )
+                session.execute(
+                    text(f"CREATE INDEX idx_{name}_feed_id ON {name} (feed_id)")
+                )
+            if partitions.TABLE not in with_feed:
+                partitions.add_feed_id(session, first)
+            session.execute(
+                text(
+                    "ALTER TABLE segments "
+                    "ADD COLUMN IF NOT EXISTS length_m DOUBLE PRECISION"
+                )
+            )
+            # Metadata keys are "<feed>/<key>", older ones have no feed
+            session.execute(
+                text(
+                    "UPDATE gtfs_metadata SET key = :prefix || key "
+                    "WHERE position('/' in key) = 0"
+                ),
+                {"prefix": f"{first}/"},
+            )
+            session.commit()
+        self._schema_ready = True
+
+    def applied_at(self) -> datetime.datetime | None:
+        """When this feed's GTFS data was last refreshed, if ever."""
+        self.ensure_schema()
+        with self.get_session() as session:
+            return session.scalar(
+                select(GtfsMetadata.updated_at).where(
+                    GtfsMetadata.key == f"{self.feed.name}/archive_sha256"
+                )
+            )
+
+    def _load_metadata(self) -> dict[str, str]:
+        prefix = f"{self.feed.name}/"
+        with self.get_session() as session:
+            rows = session.execute(
+                select(GtfsMetadata.key, GtfsMetadata.value).where(
+                    GtfsMetadata.key.startswith(prefix)
+                )
+            ).all()
+        return {key.removeprefix(prefix): value for key, value in rows}
+
+    def _save_metadata(self, session: Session, values: dict[str, str]) -> None:
+        self._upsert(
+            session,
+            GtfsMetadata,
+            pl.DataFrame(
+                {
+                    "key": [f"{self.feed.name}/{key}" for key in values],
+                    "value": list(values.values()),
+                },
+                schema={"key": pl.String, "value": pl.String},
+            ),
+        )
 
-        from pathlib import Path
+    def _journeys(self) -> str:
+        """The feed's journeys as JSON, from its config or else JOURNEYS."""
+        if self.feed.journeys is not None:
+            return json.dumps(self.feed.journeys)
+        return os.environ["JOURNEYS"]
 
-        p = Path(data_path)
+    def _changed_tables(
+        self, previous: dict[str, str], current: dict[str, str]
+    ) -> set[str]:
+        """Table groups with an input that differs from the last applied feed."""
+        return {
+            group
+            for group, inputs in DERIVED_INPUTS.items()
+            if any(previous.get(key) != current.get(key) for key in inputs)
+        }
 
-        calendar = pl.read_csv(
-            p / "calendar.txt",
+    def _read_calendar(self, p: Path) -> pl.DataFrame:
+        return pl.read_parquet(
+            p / "calendar.parquet",
             columns=[
                 "service_id",
                 "monday",
@@ -81,11 +377,31 @@ class Controller(BaseDatabase):
             ],
         )
 
+    @log
+    def _build_dataframes(
+        self, p: Path
+    ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+        """Return (relevant_trips, segments, key_segments, calendar, stops).
+
+        Three-phase approach to avoid peak memory from a full-dataset shapes join:
+          Phase 1 — scan stop_times + stops (no shapes) to find candidate trip_ids
+                     whose stop sets are supersets of at least one journey.
+          Phase 2 — run the full shapes join only for candidate trips (~100x smaller).
+          Phase 3 — reuse Phase 1 data to find all trips traversing key segments
+                     (no shapes needed for this).
+        """
+        if settings.gtfs_network_scope == "full":
+            return self._build_full_network(p)
+
+        journeys = [tuple(j) for j in json.loads(self._journeys())]
+
+        calendar = self._read_calendar(p)
+
         # ------------------------------------------------------------------
         # Phase 1: lightweight scan — stop_times + stops only, no shapes
         # ------------------------------------------------------------------
-        stops_minimal = pl.read_csv(
-            p / "stops.txt",
+        stops_minimal = pl.read_parquet(
+            p / "stops.parquet",
             columns=[
                 "stop_id",
                 "location_type",
@@ -98,26 +414,19 @@ class Controller(BaseDatabase):
 
         # (trip_id, stop_id, stop_sequence, stop_code) for every trip
         trip_stop_codes = (
-            pl.scan_csv(p / "stop_times.txt")
+            pl.scan_parquet(p / "stop_times.parquet")
             .select(["trip_id", "stop_id", "stop_sequence"])
             .join(stops_minimal.lazy().select(["stop_id", "stop_code"]), on="stop_id")
             .collect()
         )
 
-        # Trips whose stop-code set is a superset of at least one journey
-        journey_stop_sets = [set(j) for j in journeys]
-        trip_stop_groups = trip_stop_codes.group_by("trip_id").agg(pl.col("stop_code"))
-        candidate_trip_ids = [
-            row["trip_id"]
-            for row in trip_stop_groups.iter_rows(named=True)
-            if any(jset.issubset(set(row["stop_code"])) for jset in journey_stop_sets)
-        ]
+        candidate_trip_ids = match_journeys(trip_stop_codes, journeys).to_list()
         self.logger.info(f"Candidate trips for key journeys: {len(candidate_trip_ids)}")
 
         # ------------------------------------------------------------------
         # Phase 2: full join (including shapes) for candidate trips only
         # ------------------------------------------------------------------
-        trips_df = pl.read_csv(p / "trips.txt")
+        trips_df = pl.read_parquet(p / "trips.parquet")
         candidate_trips_df = trips_df.filter(
             pl.col("trip_id").is_in(candidate_trip_ids)
         )
@@ -138,19 +447,28 @@ class Controller(BaseDatabase):
         ).unique()
 
         shapes_candidate = (
-            pl.scan_csv(p / "shapes.txt")
+            pl.scan_parquet(p / "shapes.parquet")
             .filter(pl.col("shape_id").is_in(candidate_shape_ids))
             .collect()
         )
 
+        # Shape points rarely sit exactly on stops, so snap each stop to the nearest
+        # point of its trip's shape rather than joining on equal coordinates
+        snapped = snap_stops(
+            stops_candidate, shapes_candidate, settings.gtfs_snap_max_distance_m
+        )
+        unsnapped = stops_candidate.select("shape_id", "stop_id").n_unique() - len(
+            snapped
+        )
+        if unsnapped:
+            self.logger.warning(
+                f"{unsnapped} stops are over {settings.gtfs_snap_max_distance_m}m "
+                "from their trip's shape and were left out"
+            )
+
         trip_stops = candidate_trips_df.join(
             stops_candidate, on="trip_id", how="left"
-        ).join(
-            shapes_candidate,
-            how="inner",
-            left_on=["shape_id", "stop_lat", "stop_lon"],
-            right_on=["shape_id", "shape_pt_lat", "shape_pt_lon"],
-        )
+        ).join(snapped, on=["shape_id", "stop_id"], how="inner")
 
         trip_info = trip_stops[
             [
@@ -164,16 +482,24 @@ class Controller(BaseDatabase):
                 "stop_lat",
                 "stop_lon",
                 "stop_sequence",
+                "shape_dist_traveled",
             ]
         ].unique()
 
         trip_info = (
             trip_info.with_columns(
                 stop=pl.struct(
-                    ["stop_id", "stop_code", "stop_lat", "stop_lon", "stop_sequence"]
+                    [
+                        "stop_id",
+                        "stop_code",
+                        "stop_lat",
+                        "stop_lon",
+                        "stop_sequence",
+                        "shape_dist_traveled",
+                    ]
                 )
             )
-            .drop(["stop_code", "stop_lat", "stop_lon"])
+            .drop(["stop_code", "stop_lat", "stop_lon", "shape_dist_traveled"])
             .sort(by=["trip_id", "stop_sequence"], descending=False)
         )
 
@@ -181,7 +507,8 @@ class Controller(BaseDatabase):
             trip_info.with_columns(
                 stops=pl.col.stop.over("trip_id", mapping_strategy="join")
             )
-            .drop("stop_sequence", "stop")
+            # One row per trip, each carrying its ordered list of stops
+            .drop("stop_id", "stop_sequence", "stop")
             .unique()
         )
 
@@ -209,12 +536,16 @@ class Controller(BaseDatabase):
                 start_lon=pl.col("stops").list.eval(
                     pl.element().struct.field("stop_lon")
                 ),
+                start_dist=pl.col("stops").list.eval(
+                    pl.element().struct.field("shape_dist_traveled")
+                ),
             )
             .with_columns(
                 end_stop=pl.col.start_stop.list.eval(pl.element().shift(-1)),
                 end_stop_id=pl.col.start_stop_id.list.eval(pl.element().shift(-1)),
                 end_lat=pl.col.start_lat.list.eval(pl.element().shift(-1)),
                 end_lon=pl.col.start_lon.list.eval(pl.element().shift(-1)),
+                end_dist=pl.col.start_dist.list.eval(pl.element().shift(-1)),
             )
             .explode(
                 [
@@ -226,14 +557,18 @@ class Controller(BaseDatabase):
                     pl.col.end_lat,
                     pl.col.start_lon,
                     pl.col.end_lon,
+                    pl.col.start_dist,
+                    pl.col.end_dist,
                 ]
             )
             .filter(pl.col.end_stop.is_not_null())
             .with_columns(
                 segment_id=pl.col.start_stop.cast(str)
                 + pl.lit("-")
-                + pl.col.end_stop.cast(str)
+                + pl.col.end_stop.cast(str),
+                length_m=pl.col.end_dist - pl.col.start_dist,
             )
+            .drop("stops")
         )
 
         key_segment_ids = list(
@@ -267,14 +602,145 @@ class Controller(BaseDatabase):
 
         return relevant_trips, segments, key_segments, calendar, stops
 
+    @log
+    def _build_full_network(
+        self, p: Path
+    ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+        """Return the same tables as `_build_dataframes`, for every trip in the feed.
+
+        Every consecutive stop pair of every trip is a segment, so no journey
+        matching or shapes are needed. stop_times is only ever scanned, and the
+        segment pairs are built with the streaming engine, so memory stays bounded
+        by the output rather than by the intermediate joins. Trips whose service is
+        not in calendar.txt are left out, as trips need their calendar row.
+        """
+        calendar = self._read_calendar(p)
+        stops_all = pl.scan_parquet(p / "stops.parquet").select(
+            "stop_id", "location_type", "stop_code", "stop_lat", "stop_lon", "stop_name"
+        )
+        relevant_trips = (
+            pl.scan_parquet(p / "trips.parquet")
+            .select("trip_id", "route_id", "service_id", "direction_id", "shape_id")
+            .join(calendar.lazy().select("service_id"), on="service_id", how="semi")
+            .unique("trip_id")
+            .collect()
+        )
+
+        trip_stop_pairs = (
+            pl.scan_parquet(p / "stop_times.parquet")
+            .select("trip_id", "stop_id", "stop_sequence")
+            .join(relevant_trips.lazy().select("trip_id"), on="trip_id", how="semi")
+            .join(stops_all.select("stop_id", "stop_code"), on="stop_id")
+            .sort("trip_id", "stop_sequence")
+            .with_columns(
+                end_stop_id=pl.col("stop_id").shift(-1).over("trip_id"),
+                end_stop_code=pl.col("stop_code").shift(-1).over("trip_id"),
+            )
+            .filter(pl.col("end_stop_id").is_not_null())
+            .select(
+                "trip_id",
+                start_stop_id="stop_id",
+                end_stop_id="end_stop_id",
+                segment_id=pl.col("stop_code").cast(str)
+                + pl.lit("-")
+                + pl.col("end_stop_code").cast(str),
+            )
+            .collect(engine="streaming")
+        )
+        self.logger.info(
+            f"Full network: {relevant_trips.height} trips, "
+            f"{trip_stop_pairs.height} trip stop pairs"
+        )
+
+        segments = trip_stop_pairs.select("trip_id", "segment_id").unique()
+        # No shapes are read, so segment lengths are unknown
+        all_segments = (
+            trip_stop_pairs.select("segment_id", "start_stop_id", "end_stop_id")
+            .unique("segment_id")
+            .with_columns(length_m=pl.lit(None, pl.Float64))
+        )
+        stop_ids = pl.concat(
+            [all_segments["start_stop_id"], all_segments["end_stop_id"]]
+        ).unique()
+        stops = stops_all.filter(pl.col("stop_id").is_in(stop_ids)).unique().collect()
+        return relevant_trips, segments, all_segments, calendar, stops
+
+    def _build(
+        self, p: Path
+    ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+        """Run `_build_dataframes` here or in a worker, per `gtfs_build_mode`."""
+        if settings.gtfs_build_mode == "inline":
+            return self._build_dataframes(p)
+        return self._build_in_worker(p)
+
+    @log
+    def _build_in_worker(
+        self, p: Path
+    ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+        """Build in a child process with capped Polars threads and address space.
+
+        Keeps the joins over stop_times and shapes from competing with the API for
+        CPU, and an out-of-memory build kills the worker rather than the API. The
+        worker is killed if this is interrupted, e.g. by `RefreshWorker.stop`.
+        """
+        env = {
+            **os.environ,
+            "POLARS_MAX_THREADS": str(settings.gtfs_build_max_threads),
+        }
+        with tempfile.TemporaryDirectory() as out:
+            # In its own process group, so a cancelled refresh can kill all of it.
+            # stdout is inherited, stderr (its logging) is forwarded to our log.
+            with subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "app.utils.build_worker",
+                    str(p),
+                    out,
+                    self.feed.name,
+                ],
+                cwd=APP_ROOT,
+                env=env,
+                stderr=subprocess.PIPE,
+                text=True,
+                start_new_session=True,
+            ) as process:
+                stderr: collections.deque[str] = collections.deque(maxlen=50)
+                try:
+                    for line in process.stderr:
+                        self.logger.info(f"build worker: {line.rstrip()}")
+                        stderr.append(line)
+                    # The worker's own rusage, where RUSAGE_CHILDREN would give the
+                    # largest of every child this process has had
+                    _, status, usage = os.wait4(process.pid, 0)
+                except BaseException:
+                    os.killpg(process.pid, signal.SIGKILL)
+                    process.wait()
+                    raise
+                process.returncode = os.waitstatus_to_exitcode(status)
+            if process.returncode != 0:
+                raise RuntimeError(
+                    f"GTFS build worker exited with {process.returncode}: "
+                    f"{''.join(stderr)[-2000:]}"
+                )
+            self.refresh_stats["build_peak_rss_mb"] = usage.ru_maxrss / 1024
+            return tuple(
+                pl.read_ipc(Path(out) / f"{name}.arrow") for name in BUILD_OUTPUTS
+            )
+
     def _upsert(
-        self, session: Session, model: DeclarativeAttributeIntercept, rows: list[dict]
+        self, session: Session, model: DeclarativeAttributeIntercept, rows: pl.DataFrame
     ) -> None:
-        """Insert rows, updating all non-PK columns on conflict."""
-        if not rows:
+        """Insert rows, updating all non-PK columns on conflict.
+
+        Rows are sent in slices of `settings.gtfs_upsert_chunk_rows`, and each
+        multi-row INSERT stays under PostgreSQL's bind parameter limit, so memory
+        use does not grow with the size of the table.
+        """
+        if rows.is_empty():
             return
 
-        stmt = insert(model).values(rows)
+        stmt = insert(model)
 
         # Check if there are any non primary key rows that need to be updated
         pk_cols = {col.name for col in model.__table__.primary_key}
@@ -289,28 +755,136 @@ class Controller(BaseDatabase):
         else:
             stmt = stmt.on_conflict_do_nothing(index_elements=list(pk_cols))
 
-        session.execute(stmt)
+        # executemany batches rows into multi-row VALUES pages of this many rows
+        page_rows = min(settings.gtfs_upsert_chunk_rows, MAX_BIND_PARAMS // rows.width)
+        stmt = stmt.execution_options(insertmanyvalues_page_size=page_rows)
+        for chunk in rows.iter_slices(n_rows=page_rows):
+            session.execute(stmt, chunk.to_dicts())
 
     @log
-    def refresh_gtfs(self) -> dict[str, int]:
-        """Download GTFS data and refresh trips, trip_segments, and segments tables."""
+    def refresh_gtfs(self, force: bool = False) -> dict[str, int]:
+        """Download GTFS data and refresh trips, trip_segments, and segments tables.
+
+        Skips the run when the feed is unchanged since the last applied one (304, or
+        the same archive hash), and only rebuilds the table groups in
+        DERIVED_INPUTS whose input files, journeys or network scope changed. `force`
+        ignores the stored metadata and rebuilds everything.
+        """
+        rss_before = peak_rss_mb()
+        self.ensure_schema()
+        previous = {} if force else self._load_metadata()
+        journeys_hash = hashlib.sha256(self._journeys().encode()).hexdigest()
+        config_changed = (
+            previous.get("sha256:JOURNEYS") != journeys_hash
+            or previous.get("network_scope") != settings.gtfs_network_scope
+        )
         with tempfile.TemporaryDirectory() as tmp:
-            self._download_gtfs(tmp)
+            self.on_progress("downloading")
+            validators = self._download_gtfs(tmp, previous)
+            if validators is None and config_changed:
+                # The feed is the one already applied, rebuild it from the cache
+                if previous.get("archive_sha256") in self.cache:
+                    validators = {
+                        key: previous[key]
+                        for key in ("etag", "last_modified", "archive_sha256")
+                        if key in previous
+                    }
+                else:
+                    validators = self._download_gtfs(tmp, {})
+            if not config_changed and (
+                validators is None
+                or validators["archive_sha256"] == previous.get("archive_sha256")
+            ):
+                self.refresh_stats["skipped_unchanged"] = (
+                    self.refresh_stats.get("skipped_unchanged", 0) + 1
+                )
+                self.logger.info("GTFS feed unchanged, skipping refresh")
+                # Remember new validators so the next run can get a 304
+                if validators is not None:
+                    with self.get_session() as session:
+                        self._save_metadata(session, validators)
+                        session.commit()
+                return {}
+
+            version = validators["archive_sha256"]
+            if version in self.cache:
+                self.refresh_stats["cache_hits"] = (
+                    self.refresh_stats.get("cache_hits", 0) + 1
+                )
+            else:
+                self.on_progress("extracting")
+                self.cache.store(version, tmp, self._extract_gtfs(tmp))
+
+        current = {
+            **validators,
+            **self.cache.hashes(version),
+            "sha256:JOURNEYS": journeys_hash,
+            "network_scope": settings.gtfs_network_scope,
+        }
+        changed = self._changed_tables(previous, current)
+        if changed and settings.gtfs_load_mode == "swap":
+            # Shadow tables start empty, so a swap needs every table rebuilt
+            changed = set(DERIVED_INPUTS)
+        self.logger.info(f"GTFS table groups to rebuild: {sorted(changed)}")
+        data_path = self.cache.open(version)
+        self.on_progress("building")
+        if "network" in changed:
             relevant_trips, trip_segments_df, key_segments, calendar, stops = (
-                self._build_dataframes(tmp)
+                self._build(data_path)
             )
+        elif "calendar" in changed:
+            calendar = self._read_calendar(data_path)
+
+        self.on_progress("writing")
+        if "calendar" in changed:
+            assert calendar["service_id"].n_unique() == calendar.shape[0]
+            calendar = self._feed_rows(calendar)
+        if "network" in changed:
+            network = self._network_tables(
+                relevant_trips, trip_segments_df, key_segments, stops
+            )
+        if changed and settings.gtfs_load_mode == "swap":
+            counts = self._swap_gtfs([(Calendar, calendar), *network], current)
+        else:
+            counts = {}
+            with self.get_session() as session:
+                if "calendar" in changed:
+                    counts |= self._sync_table(session, Calendar, calendar)
+                if "network" in changed:
+                    counts |= self._write_network(session, network)
+                self._save_metadata(session, current)
+                session.commit()
+        service_day_cache.invalidate()
 
+        self.refresh_stats |= {f"last_{name}": count for name, count in counts.items()}
+        self.refresh_stats["peak_rss_mb"] = peak_rss_mb()
+        self.logger.info(
+            f"GTFS refresh complete: {counts}, peak RSS "
+            f"{self.refresh_stats['peak_rss_mb']:.0f} MiB "
+            f"(was {rss_before:.0f} MiB before the refresh)"
+        )
+        return counts
+
+    def _network_tables(
+        self,
+        relevant_trips: pl.DataFrame,
+        trip_segments_df: pl.DataFrame,
+        key_segments: pl.DataFrame,
+        stops: pl.DataFrame,
+    ) -> list[tuple[DeclarativeAttributeIntercept, pl.DataFrame]]:
+        """The network tables' rows, parents before children."""
         self.logger.info(
             f"GTFS processed: {len(relevant_trips)} trips, "
             f"{len(trip_segments_df)} trip-segment mappings, "
             f"{key_segments.select('segment_id').n_unique()} unique segments"
         )
 
-        unique_segments = key_segments.select(
-            "segment_id", "start_stop_id", "end_stop_id"
-        ).unique(subset=["segment_id"])
+        # Trips on different shapes share a segment, so keep its median length
+        unique_segments = key_segments.group_by("segment_id").agg(
+            pl.col("start_stop_id", "end_stop_id").first(),
+            pl.col("length_m").median(),
+        )
 
-        assert calendar["service_id"].n_unique() == calendar.shape[0]
         assert stops["stop_id"].n_unique() == stops.shape[0]
         assert relevant_trips["trip_id"].n_unique() == relevant_trips.shape[0]
         assert unique_segments["segment_id"].n_unique() == unique_segments.shape[0]
@@ -318,20 +892,257 @@ class Controller(BaseDatabase):
             trip_segments_df[["segment_id", "trip_id"]].n_unique()
             == trip_segments_df.shape[0]
         )
+        return [
+            (model, self._feed_rows(rows))
+            for model, rows in (
+                (Stop, stops.unique()),
+                (Trip, relevant_trips),
+                (Segment, unique_segments),
+                (TripSegment, trip_segments_df),
+            )
+        ]
+
+    def _feed_rows(self, rows: pl.DataFrame) -> pl.DataFrame:
+        """Namespace the IDs of rows built from this feed and tag them with it."""
+        return namespace_ids(rows, self.feed.namespace).with_columns(
+            feed_id=pl.lit(self.feed.name)
+        )
 
+    def _write_network(
+        self,
+        session: Session,
+        tables: list[tuple[DeclarativeAttributeIntercept, pl.DataFrame]],
+    ) -> dict[str, int]:
+        # Parents before children, so inserted rows find their foreign keys. Deleting
+        # a stale trip or segment cascades to its trip_segments. Stops are kept.
+        counts = {}
+        for model, rows in tables:
+            counts |= self._sync_table(
+                session, model, rows, delete_stale=model is not Stop
+            )
+        return counts
+
+    @contextlib.contextmanager
+    def _swap_lock(self) -> Iterator[None]:
+        """Hold the swap advisory lock, so feeds swap one at a time."""
+        with self.engine.connect() as conn:
+            conn.execute(select(func.pg_advisory_lock(SWAP_LOCK_KEY)))
+            try:
+                yield
+            finally:
+                conn.execute(select(func.pg_advisory_unlock(SWAP_LOCK_KEY)))
+
+    @log
+    def _swap_gtfs(
+        self,
+        tables: list[tuple[DeclarativeAttributeIntercept, pl.DataFrame]],
+        metadata: dict[str, str],
+    ) -> dict[str, int]:
+        """Load `tables` into a shadow schema and swap them in for the live tables.
+
+        The shadow tables get this feed's new rows and the other feeds' live rows.
+        Each step commits on its own, so no transaction stays open while rows are
+        loaded or indexes built, and readers of the live tables only wait for the
+        renames in the final swap. Writes to vehicle_locations wait for it too. The replaced tables are archived for
+        `rollback_gtfs`, keeping `gtfs_swap_keep_versions` of them.
+        """
+        names = [model.__tablename__ for model, _ in tables]
+        shadow = table_swap.version_schema(table_swap.SHADOW_PREFIX)
+        with self._swap_lock():
+            with self.get_session() as session:
+                # Left behind by refreshes that failed before their swap
+                table_swap.drop_schemas(
+                    session, table_swap.list_schemas(session, table_swap.SHADOW_PREFIX)
+                )
+                table_swap.create_shadow(session, shadow, names)
+                session.commit()
+            try:
+                with self.get_session() as session:
+                    for model, rows in tables:
+                        table_swap.copy_rows(session, shadow, model.__tablename__, rows)
+                    self._carry_live_rows(session, shadow, names)
+                    session.commit()
+                self.on_progress("indexing")
+                with self.get_session() as session:
+                    table_swap.build_indexes(session, shadow, names)
+                    session.commit()
+                self.on_progress("swapping")
+                with self.get_session() as session:
+                    # Locations written since the carry may refer to trips the
+                    # new feed dropped. Holding writes off until the swap commits
+                    # lets the recheck catch them all, so the foreign key validates.
+                    session.execute(
+                        text(
+                            "SET LOCAL lock_timeout = "
+                            f"'{settings.gtfs_swap_lock_timeout}'"
+                        )
+                    )
+                    session.execute(
+                        text(f"LOCK TABLE {partitions.TABLE} IN SHARE MODE")
+                    )
+                    self._carry_referenced_trips(session, shadow)
+                    to_validate = table_swap.swap(
+                        session,
+                        shadow,
+                        table_swap.version_schema(table_swap.ARCHIVE_PREFIX),
+                        names,
+                        settings.gtfs_swap_lock_timeout,
+                    )
+                    self._save_metadata(session, metadata)
+                    session.commit()
+            except Exception:
+                with self.get_session() as session:
+                    table_swap.drop_schemas(session, [shadow])
+                    session.commit()
+                raise
+
+        with self.get_session() as session:
+            self._validate(session, to_validate)
+            archives = table_swap.list_schemas(session, table_swap.ARCHIVE_PREFIX)
+            table_swap.drop_schemas(
+                session, archives[settings.gtfs_swap_keep_versions :]
+            )
+            session.commit()
+        return {name: rows.shape[0] for (_, rows), name in zip(tables, names)}
+
+    def _carry_live_rows(self, session: Session, shadow: str, names: list[str]) -> None:
+        """Copy the live rows the shadow tables must keep into them.
+
+        Those are the other feeds' rows, and this feed's trips that
+        vehicle_locations refers to, see `_carry_referenced_trips`.
+        """
+        for name in names:
+            session.execute(
+                text(
+                    f'INSERT INTO "{shadow}".{name} SELECT * FROM public.{name} '
+                    "WHERE feed_id <> :feed"
+                ),
+                {"feed": self.feed.name},
+            )
+        self._carry_referenced_trips(session, shadow)
+
+    def _carry_referenced_trips(self, session: Session, shadow: str) -> None:
+        """Copy this feed's trips that vehicle_locations refers to into the shadow.
+
+        vehicle_locations keeps a foreign key to trips, so trips that have left the
+        feed are carried over with their calendar rows, as `_delete_rows` keeps
+        them in place. Trips the shadow already has are skipped, so this can run
+        again to pick up locations written since.
+        """
+        session.execute(
+            text(
+                f'INSERT INTO "{shadow}".trips SELECT * FROM public.trips t '
+                "WHERE t.feed_id = :feed AND EXISTS "
+                "(SELECT 1 FROM vehicle_locations vl WHERE vl.trip_id = t.trip_id) "
+                f'AND NOT EXISTS (SELECT 1 FROM "{shadow}".trips n '
+                "WHERE n.trip_id = t.trip_id)"
+            ),
+            {"feed": self.feed.name},
+        )
+        session.execute(
+            text(
+                f'INSERT INTO "{shadow}".calendar SELECT * FROM public.calendar c '
+                f'WHERE c.service_id IN (SELECT service_id FROM "{shadow}".trips) '
+                f'AND NOT EXISTS (SELECT 1 FROM "{shadow}".calendar n '
+                "WHERE n.service_id = c.service_id)"
+            )
+        )
+
+    def _validate(
+        self, session: Session, constraints: list[tuple[str, str, str, list[str]]]
+    ) -> None:
+        """Validate the foreign keys a swap re-created, once it has committed.
+
+        The swap is applied by then, so a constraint that fails is logged rather
+        than failing the refresh. It stays NOT VALID, which still checks new rows.
+        """
+        for name in table_swap.validate(session, constraints):
+            self.logger.error(
+                f"GTFS tables were swapped in, but existing rows fail {name}, "
+                "which is left NOT VALID"
+            )
+
+    @log
+    def rollback_gtfs(self) -> str:
+        """Swap the most recently archived GTFS tables back in, with their metadata.
+
+        Archives hold every feed's tables, so this rolls back all feeds. The tables
+        being replaced are archived in turn, so calling this again undoes
+        the rollback. Returns the archive that was restored.
+        """
+        names = [model.__tablename__ for model in SWAP_MODELS]
+        with self._swap_lock(), self.get_session() as session:
+            archives = table_swap.list_schemas(session, table_swap.ARCHIVE_PREFIX)
+            if not archives:
+                raise RuntimeError("No archived GTFS tables to roll back to")
+            to_validate = table_swap.swap(
+                session,
+                archives[0],
+                table_swap.version_schema(table_swap.ARCHIVE_PREFIX),
+                names,
+                settings.gtfs_swap_lock_timeout,
+            )
+            session.commit()
         with self.get_session() as session:
-            self._upsert(session, Calendar, calendar.to_dicts())
-            self._upsert(session, Stop, stops.unique().to_dicts())
-            self._upsert(session, Trip, relevant_trips.to_dicts())
-            self._upsert(session, Segment, unique_segments.to_dicts())
-            self._upsert(session, TripSegment, trip_segments_df.to_dicts())
+            self._validate(session, to_validate)
             session.commit()
+        service_day_cache.invalidate()
+        self.logger.info(f"Rolled GTFS tables back to {archives[0]}")
+        return archives[0]
+
+    def _sync_table(
+        self,
+        session: Session,
+        model: DeclarativeAttributeIntercept,
+        rows: pl.DataFrame,
+        delete_stale: bool = False,
+    ) -> dict[str, int]:
+        """Bring `model`'s table in line with `rows`, per `settings.gtfs_load_mode`.
 
-        counts = {
-            "stops": stops.shape[0],
-            "trips": relevant_trips.shape[0],
-            "trip_segments": trip_segments_df.shape[0],
-            "segments": unique_segments.shape[0],
+        "diff" reads the table's current rows, writes only new and changed rows, and
+        with `delete_stale` deletes rows that are no longer in the feed. "upsert"
+        writes every row and never deletes.
+        """
+        name = model.__tablename__
+        if settings.gtfs_load_mode == "upsert":
+            self._upsert(session, model, rows)
+            return {name: rows.shape[0]}
+
+        table = model.__table__
+        key = [col.name for col in table.primary_key]
+        schema = {
+            col: PYTHON_DTYPES[table.c[col].type.python_type] for col in rows.columns
         }
-        self.logger.info(f"GTFS refresh complete: {counts}")
-        return counts
+        current = pl.read_database(
+            select(*(table.c[col] for col in rows.columns)).where(
+                table.c.feed_id == self.feed.name
+            ),
+            session.connection(),
+            schema_overrides=schema,
+        )
+        inserts, updates, stale = diff_rows(rows.cast(schema), current, key)
+        self._upsert(session, model, pl.concat([inserts, updates]))
+        deleted = self._delete_rows(session, model, stale) if delete_stale else 0
+
+        return {
+            f"{name}_inserted": inserts.shape[0],
+            f"{name}_updated": updates.shape[0],
+            f"{name}_deleted": deleted,
+            f"{name}_unchanged": rows.shape[0] - inserts.shape[0] - updates.shape[0],
+        }
+
+    def _delete_rows(
+        self, session: Session, model: DeclarativeAttributeIntercept, keys: pl.DataFrame
+    ) -> int:
+        """Delete rows by primary key, keeping trips vehicle_locations refers to."""
+        if keys.is_empty():
+            return 0
+        table = model.__table__
+        columns = [table.c[col] for col in keys.columns]
+        if len(columns) == 1:
+            stmt = delete(table).where(columns[0].in_(keys.to_series().to_list()))
+        else:
+            stmt = delete(table).where(tuple_(*columns).in_(keys.rows()))
+        if model is Trip:
+            stmt = stmt.where(~exists().where(VehicleLocation.trip_id == Trip.trip_id))
+        return session.execute(stmt).rowcount
@@ -0,0 +1,88 @@
+import datetime
+import logging
+
+import polars as pl
+from sqlalchemy import text
+
+from ..config import settings
+from ..utils import partitions
+from ..utils.db import BaseDatabase
+from ..utils.location_archive import LocationArchive, read_rows
+from ..utils.logger import MyLogger, log
+
+
+class Controller(BaseDatabase):
+    """Historical vehicle locations, across the Parquet archive and the database.
+
+    Partitions past `vehicle_location_archive_after_days` are moved to the archive
+    by `archive_partitions`. `read_locations` reads a time range from both.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.logger: logging.Logger = MyLogger().get_logger()
+        self.archive = LocationArchive(settings.vehicle_location_archive_dir)
+
+    def _archive_table(self, table: str) -> int:
+        """Export a detached partition to the archive, then drop it."""
+        with self.get_session() as session:
+            exported = self.archive.export(session, table)
+        with self.get_session() as session:
+            session.execute(text(f"DROP TABLE {table}"))
+            session.commit()
+        return exported
+
+    @log
+    def archive_partitions(self) -> dict[str, int]:
+        """Move the partitions ending before the archive age to Parquet.
+
+        Partitions are detached first, so the database stops serving their rows
+        before they are exported. Tables already detached are archived too once
+        their newest row is past the age, which also picks up a run that failed
+        between detaching and dropping. Returns the rows archived per table.
+        """
+        if settings.vehicle_location_archive_after_days is None:
+            return {}
+        today = datetime.datetime.now(partitions.TIMEZONE).date()
+        cutoff = partitions.epoch(
+            today
+            - datetime.timedelta(days=settings.vehicle_location_archive_after_days)
+        )
+        with self.get_session() as session:
+            session.execute(
+                text(
+                    "SET LOCAL lock_timeout = "
+                    f"'{settings.vehicle_location_partition_lock_timeout}'"
+                )
+            )
+            partitions.detach_partitions(session, cutoff)
+            session.commit()
+            tables = []
+            for table in partitions.detached_partitions(session):
+                newest = session.scalar(text(f"SELECT max(timestamp) FROM {table}"))
+                if newest is None or newest < cutoff:
+                    tables.append(table)
+        return {table: self._archive_table(table) for table in tables}
+
+    def read_locations(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> pl.DataFrame:
+        """Vehicle locations observed from `start` up to `end`, oldest first.
+
+        Rows come from the archive and the database alike, in the archive's
+        schema. A row in both, left by an interrupted archive run, appears once.
+        """
+        lower, upper = int(start.timestamp()), int(end.timestamp())
+        # Rows archived before there were feeds belong to the first
+        archived = (
+            self.archive.scan(lower, upper)
+            .with_columns(pl.col("feed_id").fill_null(settings.gtfs_feeds[0].name))
+            .collect()
+        )
+        with self.get_session() as session:
+            live = read_rows(session, partitions.TABLE, lower, upper)
+        return (
+            pl.concat([archived, live])
+            .unique(["id", "timestamp", "feed_id"], keep="first", maintain_order=True)
+            .sort("timestamp")
+        )
@@ -2,14 +2,53 @@ import logging
 import os
 
 import pytz
-from sqlalchemy import select
+from sqlalchemy import Select, select
 
 from ..models.models import Trip as TripModel
 from ..schemas.trips import Trip
-from ..utils.db import BaseDatabase
+from ..utils.db import AsyncBaseDatabase, BaseDatabase
+from ..utils.helpers import service_day_cache
 from ..utils.logger import MyLogger, log
 
 
+def trips_query(
+    route_id: str | None = None,
+    service_id: str | None = None,
+    direction_id: str | None = None,
+    shape_id: str | None = None,
+    limit: int | None = None,
+    offset: int | None = 0,
+) -> Select:
+    """Build the filtered trips query shared by the sync and async controllers."""
+    query = select(TripModel)
+
+    if route_id is not None:
+        route_ids = [rid.strip() for rid in route_id.split(",")]
+        query = query.where(TripModel.route_id.in_(route_ids))
+
+    if service_id is not None:
+        service_ids = [sid.strip() for sid in service_id.split(",")]
+        query = query.where(TripModel.service_id.in_(service_ids))
+
+    if direction_id is not None:
+        direction_ids = [int(did.strip()) for did in direction_id.split(",")]
+        query = query.where(TripModel.direction_id.in_(direction_ids))
+
+    if shape_id is not None:
+        shape_ids = [shid.strip() for shid in shape_id.split(",")]
+        query = query.where(TripModel.shape_id.in_(shape_ids))
+
+    query = query.order_by(TripModel.trip_id)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    if offset:
+        query = query.offset(offset)
+
+    return query
+
+
 class Controller(BaseDatabase):
     def __init__(self) -> None:
         super().__init__()
@@ -24,6 +63,7 @@ class Controller(BaseDatabase):
         with self.get_session() as session:
             session.add(TripModel(**trip.model_dump()))
             session.commit()
+        service_day_cache.invalidate()
 
     @log
     def get_trips(
@@ -34,7 +74,7 @@ class Controller(BaseDatabase):
         shape_id: str | None = None,
         limit: int | None = None,
         offset: int | None = 0,
-    ) -> list[dict]:
+    ) -> list[Trip]:
         """
         Get trips with optional filtering.
 
@@ -47,39 +87,16 @@ class Controller(BaseDatabase):
             offset: Number of results to skip (for pagination)
 
         Returns:
-            List of trip dictionaries
+            List of trips
         """
         with self.get_session() as session:
-            query = select(TripModel)
-
-            if route_id is not None:
-                route_ids = [rid.strip() for rid in route_id.split(",")]
-                query = query.where(TripModel.route_id.in_(route_ids))
-
-            if service_id is not None:
-                service_ids = [sid.strip() for sid in service_id.split(",")]
-                query = query.where(TripModel.service_id.in_(service_ids))
-
-            if direction_id is not None:
-                direction_ids = [int(did.strip()) for did in direction_id.split(",")]
-                query = query.where(TripModel.direction_id.in_(direction_ids))
-
-            if shape_id is not None:
-                shape_ids = [shid.strip() for shid in shape_id.split(",")]
-                query = query.where(TripModel.shape_id.in_(shape_ids))
-
-            query = query.order_by(TripModel.trip_id)
-
-            if limit is not None:
-                query = query.limit(limit)
-
-            if offset:
-                query = query.offset(offset)
-
+            query = trips_query(
+                route_id, service_id, direction_id, shape_id, limit, offset
+            )
             return [Trip.model_validate(t) for t in session.scalars(query).all()]
 
     @log
-    def get_trip(self, trip_id: str) -> dict | None:
+    def get_trip(self, trip_id: str) -> Trip | None:
         """
         Get a single trip by ID.
 
@@ -87,7 +104,7 @@ class Controller(BaseDatabase):
             trip_id: The trip ID to retrieve
 
         Returns:
-            Trip dictionary or None if not found
+            The trip, or None if not found
         """
         with self.get_session() as session:
             trip = session.get(TripModel, trip_id)
@@ -98,7 +115,7 @@ class Controller(BaseDatabase):
     @log
     def update_trip(self, trip_id: str, trip: Trip) -> bool:
         """
-        Update an existing trip.
+        Update an existing trip. Its feed is left as it is.
 
         Args:
             trip_id: The trip ID to update
@@ -111,10 +128,14 @@ class Controller(BaseDatabase):
             existing = session.get(TripModel, trip_id)
             if existing is None:
                 return False
-            for key, value in trip.model_dump().items():
+            # A trip stays in its feed, whatever the update says
+            for key, value in trip.model_dump(
+                exclude_unset=True, exclude={"feed_id"}
+            ).items():
                 setattr(existing, key, value)
             session.commit()
-            return True
+        service_day_cache.invalidate()
+        return True
 
     @log
     def delete_trip(self, trip_id: str) -> bool:
@@ -133,4 +154,70 @@ class Controller(BaseDatabase):
                 return False
             session.delete(trip)
             session.commit()
-            return True
+        service_day_cache.invalidate()
+        return True
+
+
+class AsyncController(AsyncBaseDatabase):
+    """Trips controller for the API routes, which must not block the event loop."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.logger: logging.Logger = MyLogger().get_logger()
+
+    @log
+    async def create_trip(self, trip: Trip) -> None:
+        async with self.get_session() as session:
+            session.add(TripModel(**trip.model_dump()))
+            await session.commit()
+        service_day_cache.invalidate()
+
+    @log
+    async def get_trips(
+        self,
+        route_id: str | None = None,
+        service_id: str | None = None,
+        direction_id: str | None = None,
+        shape_id: str | None = None,
+        limit: int | None = None,
+        offset: int | None = 0,
+    ) -> list[Trip]:
+        """Get trips with optional filtering, see `Controller.get_trips`."""
+        query = trips_query(route_id, service_id, direction_id, shape_id, limit, offset)
+        async with self.get_session() as session:
+            trips = (await session.scalars(query)).all()
+        return [Trip.model_validate(t) for t in trips]
+
+    @log
+    async def get_trip(self, trip_id: str) -> Trip | None:
+        async with self.get_session() as session:
+            trip = await session.get(TripModel, trip_id)
+        if trip is None:
+            return None
+        return Trip.model_validate(trip)
+
+    @log
+    async def update_trip(self, trip_id: str, trip: Trip) -> bool:
+        async with self.get_session() as session:
+            existing = await session.get(TripModel, trip_id)
+            if existing is None:
+                return False
+            # A trip stays in its feed, whatever the update says
+            for key, value in trip.model_dump(
+                exclude_unset=True, exclude={"feed_id"}
+            ).items():
+                setattr(existing, key, value)
+            await session.commit()
+        service_day_cache.invalidate()
+        return True
+
+    @log
+    async def delete_trip(self, trip_id: str) -> bool:
+        async with self.get_session() as session:
+            trip = await session.get(TripModel, trip_id)
+            if trip is None:
+                return False
+            await session.delete(trip)
+            await session.commit()
+        service_day_cache.invalidate()
+        return True
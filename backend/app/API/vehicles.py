@@ -1,27 +1,161 @@
+import asyncio
+import datetime
+import io
 import logging
 import os
+from dataclasses import dataclass
 
+import httpx
+import polars as pl
+import psycopg2
 import pytz
-import requests
+from google.transit import gtfs_realtime_pb2
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
 
-from ..API.trips import Controller as TripController
+from ..config import FeedConfig, settings
 from ..models.models import VehicleLocation as VehicleLocationModel
 from ..schemas.vehicles import VehicleData, VehicleLocation, VehicleStop
+from ..utils import metrics, partitions
 from ..utils.db import BaseDatabase
-from ..utils.helpers import get_service_id
+from ..utils.feed_tables import (
+    VEHICLE_LOCATION_SCHEMA,
+    join_vehicle_locations,
+    trip_update_table,
+    vehicle_table,
+)
+from ..utils.gtfs_realtime import decode_vehicle_locations, parse_feed
+from ..utils.helpers import service_day_cache
+from ..utils.http import get_async_client, run_async
 from ..utils.logger import MyLogger, log
+from ..utils.write_behind import WriteBehindQueue
+from .gtfs import namespace_ids
 
-trip_con = TripController()
+FEEDS = ("vehiclelocations", "tripupdates")
+STAGING_TABLE = "vehicle_locations_staging"
+
+
+@dataclass
+class FeedState:
+    """The last ingested version of a realtime feed, used for conditional polling."""
+
+    payload: dict | gtfs_realtime_pb2.FeedMessage | None = None
+    timestamp: float | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def conditional_headers(self) -> dict[str, str]:
+        if self.payload is None:
+            return {}
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def is_same_version(self, other: "FeedState") -> bool:
+        return other is self or (
+            self.timestamp is not None and self.timestamp == other.timestamp
+        )
+
+
+def realtime_urls(feed: FeedConfig) -> dict[str, str]:
+    return {
+        "vehiclelocations": feed.vehicle_positions_url,
+        "tripupdates": feed.trip_updates_url,
+    }
+
+
+def realtime_format(feed: FeedConfig) -> str:
+    return feed.realtime_format or settings.realtime_feed_format
 
 
 class Controller(BaseDatabase):
-    def __init__(self) -> None:
+    """Polls the realtime feeds of `feeds`, by default every GTFS feed that has them."""
+
+    def __init__(self, feeds: list[FeedConfig] | None = None) -> None:
         super().__init__()
         self.logger: logging.Logger = MyLogger().get_logger()
         self.tz: pytz.BaseTzInfo = pytz.timezone("Pacific/Auckland")
-        self.realtime_api = "https://api.at.govt.nz/realtime/legacy"
+        self.feeds = [
+            feed
+            for feed in (settings.gtfs_feeds if feeds is None else feeds)
+            if feed.has_realtime
+        ]
         self.headers = {"Ocp-Apim-Subscription-Key": os.environ["SUBSCRIPTION_KEY"]}
+        self.feed_states = {
+            (feed.name, endpoint): FeedState()
+            for feed in self.feeds
+            for endpoint in FEEDS
+        }
+        self.ingest_stats = {"polls": 0, "skipped_unchanged": 0, "not_modified": 0}
+        metrics.register("vehicle_ingest", lambda: dict(self.ingest_stats))
+        self.write_queue = WriteBehindQueue(
+            self._write_locations,
+            VEHICLE_LOCATION_SCHEMA,
+            max_batches=settings.write_behind_max_batches,
+            batch_rows=settings.write_behind_batch_rows,
+            flush_interval=settings.write_behind_flush_interval,
+            put_timeout=settings.write_behind_put_timeout,
+            spill_path=settings.write_behind_spill_path,
+        )
+        metrics.register("write_behind", self.write_queue.stats)
+
+    def _insert_rows(self, locations: pl.DataFrame) -> None:
+        with self.get_session() as session:
+            session.execute(
+                insert(VehicleLocationModel).on_conflict_do_nothing(
+                    index_elements=["id", "timestamp", "feed_id"]
+                ),
+                locations.to_dicts(),
+            )
+            session.commit()
+
+    def _copy_rows(self, locations: pl.DataFrame) -> None:
+        """COPY rows into a staging table, then merge them in one INSERT.
+
+        The staging table is a temporary copy of vehicle_locations' current shape,
+        made per batch and dropped on commit, so it follows schema changes and
+        concurrent writers never see each other's rows.
+        """
+        buffer = io.BytesIO()
+        locations.write_csv(
+            buffer, include_header=False, datetime_format="%Y-%m-%dT%H:%M:%S%.f%:z"
+        )
+        buffer.seek(0)
+        columns = ", ".join(locations.columns)
+
+        copy = f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+        with self.get_session() as session:
+            session.execute(
+                text(
+                    f"CREATE TEMP TABLE {STAGING_TABLE} "
+                    "(LIKE vehicle_locations INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+            )
+            cursor = session.connection().connection.cursor()
+            # Raised as SQLAlchemy errors, like those of every other statement
+            try:
+                cursor.copy_expert(copy, buffer)
+            except psycopg2.Error as e:
+                raise DBAPIError.instance(copy, None, e, psycopg2.Error) from e
+            session.execute(
+                text(
+                    f"INSERT INTO vehicle_locations ({columns}) "
+                    f"SELECT {columns} FROM {STAGING_TABLE} "
+                    "ON CONFLICT (id, timestamp, feed_id) DO NOTHING"
+                )
+            )
+            session.commit()
+
+    def _write_locations(self, locations: pl.DataFrame) -> None:
+        if settings.vehicle_location_writer == "copy":
+            self._copy_rows(locations)
+        else:
+            self._insert_rows(locations)
 
     @log
     def create_vehicle_locations(
@@ -31,32 +165,54 @@ class Controller(BaseDatabase):
         if not vehicle_locations:
             return
 
-        with self.get_session() as session:
-            session.execute(
-                insert(VehicleLocationModel).on_conflict_do_nothing(
-                    index_elements=["id", "timestamp"]
-                ),
+        self._write_locations(
+            pl.DataFrame(
                 [location.model_dump() for location in vehicle_locations],
+                schema=VEHICLE_LOCATION_SCHEMA,
             )
-            session.commit()
+        )
 
-    @log
-    def save_vehicle_locations(self) -> int:
-        service_ids = get_service_id()
-        filtered_trips = trip_con.get_trips(service_id=",".join(service_ids))
-        if not len(filtered_trips):
-            return 0
-        trip_ids = {t.trip_id for t in filtered_trips}
-        vehicle_locations_res = requests.get(
-            f"{self.realtime_api}/vehiclelocations", headers=self.headers, timeout=15
-        ).json()
-        trip_updates_res = requests.get(
-            f"{self.realtime_api}/tripupdates", headers=self.headers, timeout=15
-        ).json()
+    async def _fetch_feed(self, feed: FeedConfig, endpoint: str) -> FeedState:
+        """Conditionally fetch an endpoint, returning the cached state if unchanged."""
+        url = realtime_urls(feed)[endpoint]
+        state = self.feed_states[feed.name, endpoint]
+        headers = {**self.headers, **state.conditional_headers()}
+        if realtime_format(feed) == "protobuf":
+            headers["Accept"] = "application/x-protobuf"
+        response = await get_async_client(url).get(url, headers=headers)
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            self.ingest_stats["not_modified"] += 1
+            return state
+        response.raise_for_status()
+        if realtime_format(feed) == "protobuf":
+            payload = parse_feed(response.content)
+            # Unset proto3 fields read as 0, which must not match another unset one
+            timestamp = payload.header.timestamp or None
+        else:
+            payload = response.json()
+            timestamp = payload.get("response", {}).get("header", {}).get("timestamp")
+        return FeedState(
+            payload=payload,
+            timestamp=timestamp,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
 
-        self.logger.info(vehicle_locations_res)
-        self.logger.info(trip_updates_res)
+    async def _fetch_feeds(self) -> dict[tuple[str, str], FeedState]:
+        """Fetch every feed's vehicle positions and trip updates concurrently."""
+        requests = [(feed, endpoint) for feed in self.feeds for endpoint in FEEDS]
+        states = await asyncio.gather(
+            *(self._fetch_feed(feed, endpoint) for feed, endpoint in requests)
+        )
+        return {
+            (feed.name, endpoint): state
+            for (feed, endpoint), state in zip(requests, states, strict=True)
+        }
 
+    def _parse_json_feeds(
+        self, vehicle_locations_res: dict, trip_updates_res: dict, trip_ids: set[str]
+    ) -> list[VehicleLocation]:
+        """Validate the legacy JSON feeds into vehicle locations for `trip_ids`."""
         vehicle_data: dict[str, VehicleData] = {}
         for item in vehicle_locations_res["response"]["entity"]:
             if item.get("vehicle", {}).get("trip"):
@@ -99,8 +255,105 @@ class Controller(BaseDatabase):
                     )
                 except Exception as e:
                     self.logger.warning(f"Failed to create vehicle location: {e}")
+        return vehicle_locations
+
+    @log
+    def maintain_partitions(self) -> dict[str, list[str]]:
+        """Create the coming vehicle_locations partitions and detach expired ones."""
+        with self.get_session() as session:
+            changes = partitions.maintain(
+                session,
+                datetime.datetime.now(partitions.TIMEZONE).date(),
+                settings.vehicle_location_partition_interval,
+                settings.vehicle_location_partitions_ahead,
+                settings.vehicle_location_detach_after_days,
+                settings.vehicle_location_partition_lock_timeout,
+            )
+            session.commit()
+        self.logger.info(f"vehicle_locations partitions: {changes}")
+        return changes
+
+    def _feed_locations(
+        self,
+        feed: FeedConfig,
+        vehicle_locations_res: dict | gtfs_realtime_pb2.FeedMessage,
+        trip_updates_res: dict | gtfs_realtime_pb2.FeedMessage,
+        trip_ids: frozenset[str],
+    ) -> pl.DataFrame:
+        """One feed's `vehicle_locations` rows, with its namespace on their IDs."""
+        # Stored trip IDs carry the namespace, the realtime feed's do not
+        prefix = f"{feed.namespace}:" if feed.namespace else ""
+        feed_trip_ids = {
+            trip_id.removeprefix(prefix)
+            for trip_id in trip_ids
+            if trip_id.startswith(prefix)
+        }
+        if realtime_format(feed) == "protobuf":
+            locations = pl.DataFrame(
+                decode_vehicle_locations(
+                    vehicle_locations_res, trip_updates_res, feed_trip_ids
+                ),
+                schema=VEHICLE_LOCATION_SCHEMA,
+            )
+        elif settings.realtime_json_parser == "columnar":
+            locations = join_vehicle_locations(
+                vehicle_table(vehicle_locations_res),
+                trip_update_table(trip_updates_res),
+                feed_trip_ids,
+            )
+        else:
+            self.logger.info(vehicle_locations_res)
+            self.logger.info(trip_updates_res)
+            locations = pl.DataFrame(
+                [
+                    location.model_dump()
+                    for location in self._parse_json_feeds(
+                        vehicle_locations_res, trip_updates_res, feed_trip_ids
+                    )
+                ],
+                schema=VEHICLE_LOCATION_SCHEMA,
+            )
+        return namespace_ids(locations, feed.namespace).with_columns(
+            feed_id=pl.lit(feed.name)
+        )
+
+    @log
+    def save_vehicle_locations(self) -> int:
+        trip_ids = service_day_cache.get().trip_ids
+        if not trip_ids or not self.feeds:
+            return 0
+        self.ingest_stats["polls"] += 1
+        feed_states = run_async(self._fetch_feeds())
+        changed = [
+            feed
+            for feed in self.feeds
+            if not all(
+                self.feed_states[feed.name, endpoint].is_same_version(
+                    feed_states[feed.name, endpoint]
+                )
+                for endpoint in FEEDS
+            )
+        ]
+        if not changed:
+            self.ingest_stats["skipped_unchanged"] += 1
+            self.logger.info("Realtime feeds unchanged since last poll, skipping")
+            return 0
+        locations = pl.concat(
+            self._feed_locations(
+                feed,
+                feed_states[feed.name, "vehiclelocations"].payload,
+                feed_states[feed.name, "tripupdates"].payload,
+                trip_ids,
+            )
+            for feed in changed
+        )
 
-        if vehicle_locations:
-            self.create_vehicle_locations(vehicle_locations)
+        if len(locations) and settings.write_behind_enabled:
+            self.write_queue.put(locations)
+        elif len(locations):
+            self._write_locations(locations)
 
-        return len(vehicle_locations)
+        # Only remember what was fetched once it is queued or written, so a failure
+        # is retried on the next poll instead of being skipped as unchanged.
+        self.feed_states.update(feed_states)
+        return len(locations)
@@ -1,5 +1,41 @@
+from typing import Literal
+
+from pydantic import BaseModel, field_validator, model_validator
 from pydantic_settings import BaseSettings
 
+AT_REALTIME_API = "https://api.at.govt.nz/realtime/legacy"
+
+
+class FeedConfig(BaseModel):
+    """A GTFS feed: where to fetch it, when to refresh it, and how to namespace it."""
+
+    name: str
+    url: str
+    # Cron "minute hour day month day_of_week", None uses UPDATE_TRIPS_TIME
+    schedule: str | None = None
+    # IDs are stored as "<namespace>:<id>" so feeds cannot collide, "" keeps them as-is
+    namespace: str = ""
+    # Stop-code journeys for the "journeys" network scope, None reads JOURNEYS
+    journeys: list[list] | None = None
+    # Realtime endpoints, polled together; None ingests no realtime data for the feed.
+    # The rows' trip, route and stop IDs are stored with the feed's namespace.
+    vehicle_positions_url: str | None = None
+    trip_updates_url: str | None = None
+    # "json" or "protobuf", None reads REALTIME_FEED_FORMAT
+    realtime_format: Literal["json", "protobuf"] | None = None
+
+    @model_validator(mode="after")
+    def _both_realtime_urls(self) -> "FeedConfig":
+        if (self.vehicle_positions_url is None) != (self.trip_updates_url is None):
+            raise ValueError(
+                f"GTFS feed {self.name} needs both realtime URLs or neither"
+            )
+        return self
+
+    @property
+    def has_realtime(self) -> bool:
+        return self.vehicle_positions_url is not None
+
 
 class Settings(BaseSettings):
     app_name: str = "BusAPI"
@@ -7,5 +43,87 @@ class Settings(BaseSettings):
 
     debug: bool = False
 
+    # Shared by every controller in the process, see utils/db.get_engine
+    db_pool_size: int = 5
+    db_max_overflow: int = 5
+    db_pool_timeout: float = 30
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+
+    http_timeout: float = 15
+    http_max_connections_per_host: int = 10
+    http_keepalive_expiry: float = 120
+    http_retries: int = 3
+    http_backoff_factor: float = 0.5
+
+    # "protobuf" reads the binary GTFS-Realtime feeds, "json" the legacy JSON ones
+    realtime_feed_format: Literal["json", "protobuf"] = "json"
+    # How JSON feeds are parsed: "columnar" Polars tables or per-entity "pydantic"
+    realtime_json_parser: Literal["columnar", "pydantic"] = "columnar"
+    # "copy" streams rows through an unlogged staging table, "insert" uses executemany
+    vehicle_location_writer: Literal["copy", "insert"] = "copy"
+    # vehicle_locations is range-partitioned on timestamp, by Auckland day or week.
+    # Partitions are made this many periods ahead, on this cron schedule.
+    vehicle_location_partition_interval: Literal["day", "week"] = "week"
+    vehicle_location_partitions_ahead: int = 2
+    vehicle_location_partition_schedule: str = "0 2 * * *"
+    # Partitions ending longer ago than this are detached, None keeps them all
+    vehicle_location_detach_after_days: int | None = None
+    vehicle_location_partition_lock_timeout: str = "5s"
+    # Partitions ending longer ago than this are moved to Parquet files under
+    # vehicle_location_archive_dir and dropped, None keeps them in the database
+    vehicle_location_archive_after_days: int | None = None
+    vehicle_location_archive_dir: str = "archive/vehicle_locations"
+
+    # Refreshed and stored independently; existing single-feed data belongs to the first
+    gtfs_feeds: list[FeedConfig] = [
+        FeedConfig(
+            name="at",
+            url="https://gtfs.at.govt.nz/gtfs.zip",
+            vehicle_positions_url=f"{AT_REALTIME_API}/vehiclelocations",
+            trip_updates_url=f"{AT_REALTIME_API}/tripupdates",
+        )
+    ]
+    # "background" refreshes GTFS in a worker process while the API serves the data
+    # already in the database, "blocking" finishes the refresh before serving
+    gtfs_startup_refresh: Literal["background", "blocking", "off"] = "background"
+    # "process" runs the Polars GTFS build in a child process with its own limits
+    gtfs_build_mode: Literal["process", "inline"] = "process"
+    gtfs_build_max_threads: int = 2
+    gtfs_build_memory_limit_mb: int | None = 8192
+    # "journeys" builds segments for trips covering JOURNEYS, "full" for every trip
+    gtfs_network_scope: Literal["journeys", "full"] = "journeys"
+    # Furthest a stop may be from the nearest point of its trip's shape
+    gtfs_snap_max_distance_m: float = 100.0
+    # "diff" writes only changed GTFS rows and deletes stale ones, "upsert" rewrites all,
+    # "swap" loads shadow tables and swaps them in for the live ones
+    gtfs_load_mode: Literal["diff", "upsert", "swap"] = "diff"
+    gtfs_swap_keep_versions: int = 2
+    gtfs_swap_lock_timeout: str = "5s"
+    gtfs_upsert_chunk_rows: int = 5_000
+    # Parsed GTFS feeds are kept as Parquet, one directory per feed version
+    gtfs_cache_dir: str = "cache/gtfs"
+    gtfs_cache_max_versions: int = 3
+
+    # Polls hand rows to a background writer instead of committing inline
+    write_behind_enabled: bool = True
+    write_behind_max_batches: int = 60
+    write_behind_batch_rows: int = 20_000
+    write_behind_flush_interval: float = 1.0
+    write_behind_put_timeout: float = 5.0
+    write_behind_spill_path: str | None = "spill/vehicle_locations.ndjson"
+
+    @field_validator("gtfs_feeds")
+    @classmethod
+    def _unique_feeds(cls, feeds: list[FeedConfig]) -> list[FeedConfig]:
+        for field in ("name", "namespace"):
+            values = [getattr(feed, field) for feed in feeds]
+            if len(set(values)) != len(values):
+                raise ValueError(f"GTFS feeds need unique {field}s, got {values}")
+        return feeds
+
+    def feed(self, name: str) -> FeedConfig:
+        return next(feed for feed in self.gtfs_feeds if feed.name == name)
+
 
 settings = Settings()
@@ -0,0 +1,57 @@
+from fastapi import FastAPI, Response, status
+from fastapi.middleware.cors import CORSMiddleware
+
+from .config import settings
+from .router.trips import router as TripsRouter
+from .router.vehicles import gtfs_cons, refresh_workers
+from .router.vehicles import router as VehicleRouter
+from .utils import metrics
+from .utils.logger import MyLogger
+
+app = FastAPI()
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.cors_allow_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+logger = MyLogger().get_logger()
+
+app.include_router(VehicleRouter, prefix="/vehicles")
+app.include_router(TripsRouter, prefix="/trips")
+
+
+@app.get("/health")
+def health_check() -> dict[str, str]:
+    return {"status": "healthy"}
+
+
+@app.get("/ready")
+def readiness_check(response: Response) -> dict:
+    """Ready once every GTFS feed is loaded. Reports their age and any running refresh.
+
+    `gtfs_applied_at` is that of the feed loaded longest ago.
+    """
+    feeds = {
+        name: {
+            "gtfs_applied_at": gtfs_con.applied_at(),
+            "refresh": refresh_workers[name].status(),
+        }
+        for name, gtfs_con in gtfs_cons.items()
+    }
+    applied = [feed["gtfs_applied_at"] for feed in feeds.values()]
+    ready = None not in applied
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "ready": ready,
+        "gtfs_applied_at": min(applied) if ready else None,
+        "feeds": feeds,
+    }
+
+
+@app.get("/metrics")
+def get_metrics() -> dict:
+    return metrics.snapshot()
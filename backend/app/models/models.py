@@ -29,10 +29,14 @@ class Calendar(Base):
     friday = Column(Integer, nullable=False)
     saturday = Column(Integer, nullable=False)
     sunday = Column(Integer, nullable=False)
+    feed_id = Column(String(255), nullable=False)
 
     trips = relationship("Trip", back_populates="calendar")
 
-    __table_args__ = (Index("idx_calendar_service_id", "service_id"),)
+    __table_args__ = (
+        Index("idx_calendar_service_id", "service_id"),
+        Index("idx_calendar_feed_id", "feed_id"),
+    )
 
 
 class Stop(Base):
@@ -43,6 +47,9 @@ class Stop(Base):
     stop_lat = Column(Double, nullable=False)
     stop_lon = Column(Double, nullable=False)
     stop_name = Column(String(255), nullable=False)
+    feed_id = Column(String(255), nullable=False)
+
+    __table_args__ = (Index("idx_stops_feed_id", "feed_id"),)
 
 
 class Segment(Base):
@@ -51,9 +58,14 @@ class Segment(Base):
     segment_id = Column(String(255), primary_key=True)
     start_stop_id = Column(String(255), ForeignKey("stops.stop_id"), nullable=False)
     end_stop_id = Column(String(255), ForeignKey("stops.stop_id"), nullable=False)
+    feed_id = Column(String(255), nullable=False)
+    # Metres along the shape between the two stops, None for the full-network scope
+    length_m = Column(Double, nullable=True)
 
     trip_segments = relationship("TripSegment", back_populates="segment")
 
+    __table_args__ = (Index("idx_segments_feed_id", "feed_id"),)
+
 
 class Trip(Base):
     __tablename__ = "trips"
@@ -66,6 +78,7 @@ class Trip(Base):
     created_at = Column(
         TIMESTAMP(timezone=True), server_default=text("CURRENT_TIMESTAMP")
     )
+    feed_id = Column(String(255), nullable=False)
 
     calendar = relationship("Calendar", back_populates="trips")
     vehicle_locations = relationship("VehicleLocation", back_populates="trip")
@@ -75,6 +88,7 @@ class Trip(Base):
         Index("idx_trips_trip_id", "trip_id"),
         Index("idx_trips_route_id", "route_id"),
         Index("idx_trips_service_id", "service_id"),
+        Index("idx_trips_feed_id", "feed_id"),
     )
 
 
@@ -107,6 +121,8 @@ class VehicleLocation(Base):
     created_at = Column(
         TIMESTAMP(timezone=True), server_default=text("CURRENT_TIMESTAMP")
     )
+    # Vehicle ids are only unique within a feed
+    feed_id = Column(String(255), nullable=False, primary_key=True)
     location = Column(
         Geography(geometry_type="POINT", srid=4326),
         nullable=True,
@@ -119,8 +135,17 @@ class VehicleLocation(Base):
         Index("idx_vehicle_locations_trip_id", "trip_id"),
         Index("idx_vehicle_locations_route_id", "route_id"),
         Index("idx_vehicle_locations_timestamp", "timestamp"),
+        # Added to databases made before it by utils/partitions.maintain
+        Index(
+            "idx_vehicle_locations_timestamp_brin",
+            "timestamp",
+            postgresql_using="brin",
+            postgresql_with={"autosummarize": "on"},
+        ),
         Index("idx_vehicle_locations_start_time", "start_time"),
         Index("idx_vehicle_locations_location", "location", postgresql_using="gist"),
+        # Partitions are created by utils/partitions.maintain
+        {"postgresql_partition_by": "RANGE (timestamp)"},
     )
 
 
@@ -131,6 +156,7 @@ class TripSegment(Base):
     segment_id = Column(
         String(255), ForeignKey("segments.segment_id"), primary_key=True
     )
+    feed_id = Column(String(255), nullable=False)
 
     trip = relationship("Trip", back_populates="trip_segments")
     segment = relationship("Segment", back_populates="trip_segments")
@@ -138,4 +164,19 @@ class TripSegment(Base):
     __table_args__ = (
         Index("idx_trip_segments_trip_id", "trip_id"),
         Index("idx_trip_segments_segment_id", "segment_id"),
+        Index("idx_trip_segments_feed_id", "feed_id"),
+    )
+
+
+class GtfsMetadata(Base):
+    """Key/value state of the last applied GTFS feed (HTTP validators, file hashes)."""
+
+    __tablename__ = "gtfs_metadata"
+
+    key = Column(String(255), primary_key=True)
+    value = Column(String, nullable=False)
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        server_default=text("CURRENT_TIMESTAMP"),
+        onupdate=text("CURRENT_TIMESTAMP"),
     )
@@ -1,13 +1,13 @@
 import pytz
 from fastapi import APIRouter, HTTPException, Query
 
-from ..API.trips import Controller
+from ..API.trips import AsyncController
 from ..schemas.trips import Trip
 from ..utils.logger import MyLogger
 
 logger = MyLogger().get_logger()
 
-con = Controller()
+con = AsyncController()
 
 tz = pytz.timezone("Pacific/Auckland")
 
@@ -16,7 +16,7 @@ router = APIRouter()
 
 @router.post("")
 async def create(trip: Trip) -> None:
-    return con.create_trip(trip)
+    return await con.create_trip(trip)
 
 
 @router.get("")
@@ -27,8 +27,8 @@ async def get_trips(
     shape_id: str | None = Query(None, description="Filter by shape ID"),
     limit: int | None = Query(None, description="Maximum number of results"),
     offset: int | None = Query(0, description="Number of results to skip"),
-) -> list[dict]:
-    return con.get_trips(
+) -> list[Trip]:
+    return await con.get_trips(
         route_id=route_id,
         service_id=service_id,
         direction_id=direction_id,
@@ -39,8 +39,8 @@ async def get_trips(
 
 
 @router.get("/{trip_id}")
-async def get_trip(trip_id: str) -> dict:
-    trip = con.get_trip(trip_id)
+async def get_trip(trip_id: str) -> Trip:
+    trip = await con.get_trip(trip_id)
     if trip is None:
         raise HTTPException(status_code=404, detail="Trip not found")
     return trip
@@ -48,7 +48,7 @@ async def get_trip(trip_id: str) -> dict:
 
 @router.put("/{trip_id}")
 async def update_trip(trip_id: str, trip: Trip) -> dict:
-    success = con.update_trip(trip_id, trip)
+    success = await con.update_trip(trip_id, trip)
     if not success:
         raise HTTPException(status_code=404, detail="Trip not found")
     return {"message": "Trip updated successfully", "trip_id": trip_id}
@@ -56,7 +56,7 @@ async def update_trip(trip_id: str, trip: Trip) -> dict:
 
 @router.delete("/{trip_id}")
 async def delete_trip(trip_id: str) -> dict:
-    success = con.delete_trip(trip_id)
+    success = await con.delete_trip(trip_id)
     if not success:
         raise HTTPException(status_code=404, detail="Trip not found")
     return {"message": "Trip deleted successfully", "trip_id": trip_id}
@@ -5,15 +5,23 @@ from contextlib import asynccontextmanager
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler
 from fastapi import APIRouter
+from sqlalchemy.exc import SQLAlchemyError
 
 from ..API.gtfs import Controller as GtfsController
+from ..API.history import Controller as HistoryController
 from ..API.vehicles import Controller
+from ..config import settings
+from ..utils.db import dispose_async_engines, dispose_engines
+from ..utils.http import close_clients
 from ..utils.logger import MyLogger
+from ..utils.refresh_worker import RefreshWorker
 
 logger = MyLogger().get_logger()
 
 con = Controller()
-gtfs_con = GtfsController()
+history_con = HistoryController()
+gtfs_cons = {feed.name: GtfsController(feed) for feed in settings.gtfs_feeds}
+refresh_workers = {feed.name: RefreshWorker(feed.name) for feed in settings.gtfs_feeds}
 
 tz = pytz.timezone("Pacific/Auckland")
 
@@ -23,9 +31,14 @@ def save_data() -> None:
     con.save_vehicle_locations()
 
 
-def refresh_gtfs() -> None:
-    logger.info("Running weekly GTFS refresh")
-    gtfs_con.refresh_gtfs()
+def maintain_partitions() -> None:
+    con.maintain_partitions()
+    history_con.archive_partitions()
+
+
+def refresh_gtfs(feed: str) -> None:
+    logger.info(f"Running scheduled GTFS refresh of {feed}")
+    refresh_workers[feed].run()
 
 
 @asynccontextmanager
@@ -43,27 +56,63 @@ async def lifespan(_: APIRouter) -> AsyncGenerator[None, None]:
         day_of_week=wday,
     )
 
-    update_minute, update_hour, update_day, update_month, update_wday = (
-        os.environ["UPDATE_TRIPS_TIME"].strip('"').split(" ")
-    )
+    for feed in settings.gtfs_feeds:
+        schedule = feed.schedule or os.environ["UPDATE_TRIPS_TIME"]
+        update_minute, update_hour, update_day, update_month, update_wday = (
+            schedule.strip('"').split(" ")
+        )
+        scheduler.add_job(
+            refresh_gtfs,
+            "cron",
+            args=(feed.name,),
+            minute=update_minute,
+            hour=update_hour,
+            day=update_day,
+            month=update_month,
+            day_of_week=update_wday,
+        )
+
+    schedule = settings.vehicle_location_partition_schedule
+    minute, hour, day, month, wday = schedule.split(" ")
     scheduler.add_job(
-        refresh_gtfs,
+        maintain_partitions,
         "cron",
-        minute=update_minute,
-        hour=update_hour,
-        day=update_day,
-        month=update_month,
-        day_of_week=update_wday,
+        minute=minute,
+        hour=hour,
+        day=day,
+        month=month,
+        day_of_week=wday,
     )
 
+    # Bring an older database up to date before anything writes to it
+    gtfs_cons[settings.gtfs_feeds[0].name].ensure_schema()
+    # Partitions must exist before the first save. Rows with no partition yet go to
+    # the default one, so a failure here (e.g. the lock timeout) is left to the job
+    try:
+        con.maintain_partitions()
+    except SQLAlchemyError:
+        logger.warning("Partition maintenance failed at startup, the cron job retries")
     scheduler.start()
     logger.info(f"Scheduler started with cron: {os.environ['SAVE_TIME']} (NZ timezone)")
 
-    logger.info("Running GTFS refresh on startup...")
-    gtfs_con.refresh_gtfs()
+    if settings.gtfs_startup_refresh == "blocking":
+        logger.info("Running GTFS refresh on startup...")
+        for gtfs_con in gtfs_cons.values():
+            gtfs_con.refresh_gtfs()
+    elif settings.gtfs_startup_refresh == "background":
+        # Serve from the data already in the database while the refreshes run
+        logger.info("Starting GTFS refresh in the background...")
+        for refresh_worker in refresh_workers.values():
+            refresh_worker.start()
 
     yield
     scheduler.shutdown()  # Clean shutdown on app stop
+    for refresh_worker in refresh_workers.values():
+        refresh_worker.stop()
+    con.write_queue.close()
+    close_clients()
+    dispose_engines()
+    await dispose_async_engines()
 
 
 router = APIRouter(lifespan=lifespan)
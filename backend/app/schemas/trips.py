@@ -1,10 +1,13 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+
+from ..config import settings
 
 
 class Trip(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     trip_id: str
+    feed_id: str = Field(default_factory=lambda: settings.gtfs_feeds[0].name)
     route_id: str
     service_id: str
     direction_id: int
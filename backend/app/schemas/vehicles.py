@@ -11,6 +11,7 @@ from pydantic import (
     model_validator,
 )
 
+from ..config import settings
 from ..utils.logger import MyLogger
 
 logger = MyLogger().get_logger()
@@ -245,6 +246,7 @@ class VehicleLocation(BaseModel):
     label: str
     license_plate: str | None
     delay: int
+    feed_id: str = Field(default_factory=lambda: settings.gtfs_feeds[0].name)
 
     @classmethod
     def from_vehicle_data_and_stop(
@@ -0,0 +1,30 @@
+"""Entry point for building GTFS tables in a separate process.
+
+Run as `python -m app.utils.build_worker <feed dir> <output dir> <feed name>` by
+`API/gtfs.Controller._build_in_worker`, with POLARS_MAX_THREADS already in the
+environment so it applies before Polars starts its thread pool. Writes each
+built table to `<output dir>/<name>.arrow` as Arrow IPC.
+"""
+
+import resource
+import sys
+from pathlib import Path
+
+from ..API.gtfs import BUILD_OUTPUTS, Controller
+from ..config import settings
+
+
+def main() -> None:
+    feed_dir, out_dir = (Path(arg) for arg in sys.argv[1:3])
+    feed = settings.feed(sys.argv[3])
+    if settings.gtfs_build_memory_limit_mb:
+        limit = settings.gtfs_build_memory_limit_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    tables = Controller(feed)._build_dataframes(feed_dir)
+    for name, table in zip(BUILD_OUTPUTS, tables, strict=True):
+        table.write_ipc(out_dir / f"{name}.arrow")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,171 @@
+import contextvars
 import os
+import threading
+import time
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
+from sqlalchemy import exc as sa_exc
 from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
+
+from ..config import settings
+from . import metrics
+
+# Set while a checkout is being timed. A ContextVar rather than a thread local, as
+# async checkouts from different tasks interleave on the same thread.
+_timing_checkout: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "timing_checkout", default=False
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        # QueuePool._do_get retries by calling itself, only time the outer call
+        if _timing_checkout.get():
+            return super()._do_get()
+        token = _timing_checkout.set(True)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            self.checkout_stats["timeouts"] += 1
+            raise
+        finally:
+            _timing_checkout.reset(token)
+            waited = time.perf_counter() - start
+            self.checkout_stats["checkouts"] += 1
+            self.checkout_stats["wait_seconds_total"] += waited
+            self.checkout_stats["wait_seconds_max"] = max(
+                self.checkout_stats["wait_seconds_max"], waited
+            )
+
+    def recreate(self) -> "TimedQueuePool":
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            **self.checkout_stats,
+        }
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """TimedQueuePool for asyncio engines."""
+
+
+_engines: dict[str, Engine] = {}
+_async_engines: dict[str, AsyncEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def database_url(drivername: str = "postgresql+psycopg2") -> URL:
+    return URL.create(
+        drivername=drivername,
+        host=os.environ["POSTGRES_HOST"],
+        port=int(os.environ["POSTGRES_PORT"]),
+        database=os.environ["POSTGRES_DB"],
+        username=os.environ["POSTGRES_USER"],
+        password=os.environ["POSTGRES_PW"],
+    )
+
+
+def get_engine(url: URL | None = None) -> Engine:
+    """Return the process-wide engine for `url`, creating it on first use."""
+    url = url or database_url()
+    key = url.render_as_string(hide_password=False)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(
+                url,
+                poolclass=TimedQueuePool,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_timeout=settings.db_pool_timeout,
+                pool_pre_ping=settings.db_pool_pre_ping,
+                pool_recycle=settings.db_pool_recycle,
+                connect_args={"options": "-c timezone=Pacific/Auckland"},
+            )
+        return _engines[key]
+
+
+def get_async_engine(url: URL | None = None) -> AsyncEngine:
+    """Return the process-wide asyncpg engine for `url`, creating it on first use."""
+    url = url or database_url("postgresql+asyncpg")
+    key = url.render_as_string(hide_password=False)
+    with _engines_lock:
+        if key not in _async_engines:
+            _async_engines[key] = create_async_engine(
+                url,
+                poolclass=TimedAsyncQueuePool,
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_timeout=settings.db_pool_timeout,
+                pool_pre_ping=settings.db_pool_pre_ping,
+                pool_recycle=settings.db_pool_recycle,
+                connect_args={"server_settings": {"timezone": "Pacific/Auckland"}},
+            )
+        return _async_engines[key]
+
+
+def dispose_engines() -> None:
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+
+
+async def dispose_async_engines() -> None:
+    with _engines_lock:
+        engines = list(_async_engines.values())
+    for engine in engines:
+        await engine.dispose()
+
+
+def get_pool_stats() -> dict[str, dict[str, float]]:
+    return {
+        engine.url.render_as_string(hide_password=True): engine.pool.stats()
+        for engine in [*_engines.values(), *_async_engines.values()]
+    }
+
+
+metrics.register("db_pool", get_pool_stats)
 
 
 class BaseDatabase:
     def __init__(self) -> None:
-        self.engine = create_engine(
-            URL.create(
-                drivername="postgresql+psycopg2",
-                host=os.environ["POSTGRES_HOST"],
-                port=int(os.environ["POSTGRES_PORT"]),
-                database=os.environ["POSTGRES_DB"],
-                username=os.environ["POSTGRES_USER"],
-                password=os.environ["POSTGRES_PW"],
-            ),
-            connect_args={"options": "-c timezone=Pacific/Auckland"},
-        )
+        self.engine = get_engine()
         self.Session = sessionmaker(bind=self.engine)
 
     def get_session(self) -> Session:
         return self.Session()
+
+
+class AsyncBaseDatabase:
+    def __init__(self) -> None:
+        self.engine = get_async_engine()
+        self.Session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    def get_session(self) -> AsyncSession:
+        return self.Session()
@@ -0,0 +1,203 @@
+from collections.abc import Collection
+
+import polars as pl
+
+TZ = "Pacific/Auckland"
+
+# (dtype, required) for each flattened feed column. A required
+# column that is missing or fails to cast drops its row, as a validation error on
+# the Pydantic models would; an optional one only drops it if a value is present
+# but cannot be cast.
+VEHICLE_COLUMNS: dict[str, tuple[pl.DataType, bool]] = {
+    "id": (pl.Int64, True),
+    "trip_id": (pl.String, True),
+    "occupancy_status": (pl.Int64, False),
+    "bearing": (pl.Float64, False),
+    "latitude": (pl.Float64, True),
+    "longitude": (pl.Float64, True),
+    "speed": (pl.Float64, True),
+    "timestamp": (pl.Int64, True),
+    "start_date": (pl.String, True),
+    "start_time": (pl.String, True),
+    "route_id": (pl.String, True),
+    "direction_id": (pl.Int64, False),
+}
+STOP_COLUMNS: dict[str, tuple[pl.DataType, bool]] = {
+    "is_deleted": (pl.Boolean, True),
+    "trip_id": (pl.String, True),
+    "route_id": (pl.String, True),
+    "direction_id": (pl.Int64, False),
+    "schedule_relationship": (pl.Int64, False),
+    "start_date": (pl.String, True),
+    "start_time": (pl.String, True),
+    "stop_sequence": (pl.Int64, True),
+    "stop_id": (pl.String, True),
+    "stop_schedule_relationship": (pl.Int64, False),
+    "departure_delay": (pl.Int64, False),
+    "departure_time": (pl.Int64, False),
+    "departure_uncertainty": (pl.Int64, False),
+    "vehicle_id": (pl.String, False),
+    "label": (pl.String, False),
+    "license_plate": (pl.String, False),
+    "timestamp": (pl.Int64, True),
+    "delay": (pl.Int64, True),
+}
+# Columns each `vehicle_locations` row takes from the trip update side of the join
+STOP_FIELDS = [
+    "is_deleted",
+    "schedule_relationship",
+    "stop_sequence",
+    "stop_id",
+    "stop_schedule_relationship",
+    "departure_delay",
+    "departure_time",
+    "departure_uncertainty",
+    "vehicle_id",
+    "label",
+    "license_plate",
+    "delay",
+]
+VEHICLE_LOCATION_COLUMNS = [
+    "id",
+    "trip_id",
+    "occupancy_status",
+    "bearing",
+    "latitude",
+    "longitude",
+    "speed",
+    "timestamp",
+    "start_time",
+    "route_id",
+    "direction_id",
+    "schedule_relationship",
+    "is_deleted",
+    "stop_sequence",
+    "stop_id",
+    "stop_schedule_relationship",
+    "departure_delay",
+    "departure_time",
+    "departure_uncertainty",
+    "vehicle_id",
+    "label",
+    "license_plate",
+    "delay",
+]
+
+# The parsers give VEHICLE_LOCATION_COLUMNS, the feed is added as rows are stored
+VEHICLE_LOCATION_SCHEMA: dict[str, pl.DataType] = {
+    **{
+        column: (
+            pl.Datetime("us", TZ)
+            if column == "start_time"
+            else {**STOP_COLUMNS, **VEHICLE_COLUMNS}[column][0]
+        )
+        for column in VEHICLE_LOCATION_COLUMNS
+    },
+    "feed_id": pl.String,
+}
+
+
+def _build_table(
+    columns: dict[str, tuple[pl.DataType, bool]], values: dict[str, list]
+) -> pl.DataFrame:
+    """Cast raw column lists and drop the rows Pydantic validation would reject."""
+    series, invalid = [], []
+    for name, (dtype, required) in columns.items():
+        raw = values[name]
+        typed = pl.Series(name, raw, dtype=dtype, strict=False)
+        series.append(typed)
+        if required:
+            invalid.append(typed.is_null())
+        elif typed.null_count() != raw.count(None):
+            invalid.append(typed.is_null() & pl.Series([v is not None for v in raw]))
+    table = pl.DataFrame(series)
+    if invalid:
+        table = table.filter(~pl.any_horizontal(invalid))
+    return table.with_columns(
+        start_time=pl.concat_str("start_date", "start_time", separator=" ")
+        .str.strptime(pl.Datetime("us"), "%Y%m%d %H:%M:%S", strict=False)
+        .dt.replace_time_zone(TZ, ambiguous="latest", non_existent="null")
+    ).filter(pl.col("start_time").is_not_null())
+
+
+def vehicle_table(payload: dict) -> pl.DataFrame:
+    """Flatten the vehicle positions feed into a typed table in one pass."""
+    values: dict[str, list] = {name: [] for name in VEHICLE_COLUMNS}
+    for item in payload["response"]["entity"]:
+        vehicle = item.get("vehicle") or {}
+        trip = vehicle.get("trip")
+        if not trip:
+            continue
+        position = vehicle.get("position") or {}
+        values["id"].append(item.get("id"))
+        values["trip_id"].append(trip.get("trip_id"))
+        values["occupancy_status"].append(vehicle.get("occupancy_status"))
+        values["bearing"].append(position.get("bearing"))
+        values["latitude"].append(position.get("latitude"))
+        values["longitude"].append(position.get("longitude"))
+        values["speed"].append(position.get("speed"))
+        values["timestamp"].append(vehicle.get("timestamp"))
+        values["start_date"].append(trip.get("start_date"))
+        values["start_time"].append(trip.get("start_time"))
+        values["route_id"].append(trip.get("route_id"))
+        values["direction_id"].append(trip.get("direction_id"))
+    return _build_table(VEHICLE_COLUMNS, values)
+
+
+def trip_update_table(payload: dict) -> pl.DataFrame:
+    """Flatten the trip updates feed (first stop time update only) in one pass."""
+    values: dict[str, list] = {name: [] for name in STOP_COLUMNS}
+    for item in payload["response"]["entity"]:
+        trip_update = item.get("trip_update")
+        if not trip_update:
+            continue
+        stu = trip_update.get("stop_time_update")
+        if isinstance(stu, list):
+            stu = stu[0] if stu else {}
+        stu = stu or {}
+        trip = trip_update.get("trip") or {}
+        departure = stu.get("departure") or {}
+        vehicle = trip_update.get("vehicle") or {}
+        values["is_deleted"].append(item.get("is_deleted", False))
+        values["trip_id"].append(trip.get("trip_id"))
+        values["route_id"].append(trip.get("route_id"))
+        values["direction_id"].append(trip.get("direction_id"))
+        values["schedule_relationship"].append(trip.get("schedule_relationship"))
+        values["start_date"].append(trip.get("start_date"))
+        values["start_time"].append(trip.get("start_time"))
+        values["stop_sequence"].append(stu.get("stop_sequence"))
+        values["stop_id"].append(stu.get("stop_id"))
+        values["stop_schedule_relationship"].append(stu.get("schedule_relationship"))
+        values["departure_delay"].append(departure.get("delay"))
+        values["departure_time"].append(departure.get("time"))
+        values["departure_uncertainty"].append(departure.get("uncertainty"))
+        values["vehicle_id"].append(vehicle.get("id"))
+        values["label"].append(vehicle.get("label"))
+        values["license_plate"].append(vehicle.get("license_plate"))
+        values["timestamp"].append(trip_update.get("timestamp"))
+        values["delay"].append(trip_update.get("delay"))
+    return _build_table(STOP_COLUMNS, values)
+
+
+def join_vehicle_locations(
+    vehicles: pl.DataFrame, trip_updates: pl.DataFrame, trip_ids: Collection[str]
+) -> pl.DataFrame:
+    """Join positions to trip updates for the active trips as `vehicle_locations` rows.
+
+    Like the per-entity path, the last valid entity per trip wins, and a row needs
+    both a position and a trip update naming a vehicle id and label.
+    """
+    active = pl.col("trip_id").is_in(list(trip_ids))
+    vehicles = vehicles.filter(active).unique(
+        subset="trip_id", keep="last", maintain_order=True
+    )
+    stops = (
+        trip_updates.filter(active)
+        .unique(subset="trip_id", keep="last", maintain_order=True)
+        .select("trip_id", *STOP_FIELDS)
+    )
+    return (
+        vehicles.join(stops, on="trip_id", how="inner", maintain_order="left")
+        .filter(pl.col("vehicle_id").is_not_null(), pl.col("label").is_not_null())
+        .select(VEHICLE_LOCATION_COLUMNS)
+    )
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import polars as pl
+
+from .logger import MyLogger
+
+HASHES_FILE = "hashes.json"
+
+
+class GtfsCache:
+    """Versioned on-disk cache of parsed GTFS tables as Parquet.
+
+    Each feed version (the archive's sha256) gets a directory holding one
+    `<table>.parquet` per GTFS file and the sha256 of each source file. Only the
+    `max_versions` most recently used versions are kept.
+    """
+
+    def __init__(self, root: str, max_versions: int) -> None:
+        self.logger = MyLogger().get_logger()
+        self.root = Path(root)
+        self.max_versions = max_versions
+        self._lock = threading.Lock()
+
+    def _path(self, version: str) -> Path:
+        return self.root / version
+
+    def __contains__(self, version: str | None) -> bool:
+        return version is not None and (self._path(version) / HASHES_FILE).exists()
+
+    def store(self, version: str, csv_dir: str, hashes: dict[str, str]) -> Path:
+        """Convert the GTFS .txt files in `csv_dir` to Parquet under `version`."""
+        path = self._path(version)
+        partial = path.with_name(f"{version}.partial")
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir(parents=True)
+        for csv in Path(csv_dir).glob("*.txt"):
+            # Streams the CSV, so large files like stop_times are never fully loaded
+            pl.scan_csv(csv).sink_parquet(partial / f"{csv.stem}.parquet")
+        (partial / HASHES_FILE).write_text(json.dumps(hashes))
+        with self._lock:
+            shutil.rmtree(path, ignore_errors=True)
+            partial.rename(path)
+        self.logger.info(f"Cached GTFS version {version[:12]} as Parquet")
+        self.evict()
+        return path
+
+    def open(self, version: str) -> Path:
+        """Return the directory of a cached version and mark it as recently used."""
+        path = self._path(version)
+        os.utime(path)
+        return path
+
+    def hashes(self, version: str) -> dict[str, str]:
+        return json.loads((self._path(version) / HASHES_FILE).read_text())
+
+    def evict(self) -> None:
+        """Delete all but the `max_versions` most recently used versions."""
+        with self._lock:
+            versions = sorted(
+                (p for p in self.root.iterdir() if (p / HASHES_FILE).exists()),
+                key=lambda p: p.stat().st_mtime,
+                reverse=True,
+            )
+            for path in versions[self.max_versions :]:
+                self.logger.info(f"Evicting cached GTFS version {path.name[:12]}")
+                shutil.rmtree(path, ignore_errors=True)
@@ -1,42 +1,109 @@
 import datetime
+import functools
+import itertools
+import threading
+from dataclasses import dataclass
 
 import holidays
 from pytz import timezone
 from sqlalchemy import select
 
-from ..models.models import Calendar
+from ..models.models import Calendar, Trip
+from ..utils import metrics
 from ..utils.db import BaseDatabase
 
 db = BaseDatabase()
 
+tz = timezone("Pacific/Auckland")
+DAYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
 
-def get_service_id() -> list[str]:
-    """Get the current service-id to find what trips are running.
+
+@functools.lru_cache(maxsize=4)
+def _nz_holidays(year: int) -> holidays.HolidayBase:
+    return holidays.NZ(years=year)
+
+
+def _service_day(today: datetime.date) -> str:
+    """The calendar day whose services run on `today`.
 
     Public holidays get treated as sunday's - at least for the inner link. The holidays
     function doesn't work for anniversary holidays, but I can live with 364/365 days
     correct.
     """
-    tz = timezone("Pacific/Auckland")
-    today = datetime.datetime.now(tz=tz).date()
-    nz_holidays = holidays.NZ()
-
-    days = [
-        "monday",
-        "tuesday",
-        "wednesday",
-        "thursday",
-        "friday",
-        "saturday",
-        "sunday",
-    ]
-    day = "sunday" if today in nz_holidays else days[today.weekday()]
-
-    with db.get_session() as session:
-        return (
-            session.execute(
-                select(Calendar.service_id).where(getattr(Calendar, day) == 1)
+    return "sunday" if today in _nz_holidays(today.year) else DAYS[today.weekday()]
+
+
+@dataclass(frozen=True)
+class ServiceDay:
+    date: datetime.date
+    service_ids: tuple[str, ...]
+    trip_ids: frozenset[str]
+
+
+class ServiceDayCache:
+    """The service_ids and trip_ids running on the current NZ day.
+
+    Loaded once per day, or again after `invalidate` when the GTFS tables change.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._current: ServiceDay | None = None
+        # Bumped by `invalidate`, so a load it overlapped is not kept
+        self._generations = itertools.count()
+        self._generation = next(self._generations)
+        self.loads = 0
+
+    def _load(self, today: datetime.date) -> ServiceDay:
+        day = _service_day(today)
+        with db.get_session() as session:
+            service_ids = tuple(
+                session.execute(
+                    select(Calendar.service_id).where(getattr(Calendar, day) == 1)
+                ).scalars()
             )
-            .scalars()
-            .all()
-        )
+            trip_ids = frozenset(
+                session.execute(
+                    select(Trip.trip_id).where(Trip.service_id.in_(service_ids))
+                ).scalars()
+            )
+        self.loads += 1
+        return ServiceDay(today, service_ids, trip_ids)
+
+    def get(self) -> ServiceDay:
+        today = datetime.datetime.now(tz=tz).date()
+        current = self._current
+        if current is not None and current.date == today:
+            return current
+        with self._lock:
+            while self._current is None or self._current.date != today:
+                generation = self._generation
+                loaded = self._load(today)
+                # Invalidated mid-load, it may have read the tables before the change
+                if generation == self._generation:
+                    self._current = loaded
+            return self._current
+
+    def invalidate(self) -> None:
+        self._generation = next(self._generations)
+        self._current = None
+
+    def stats(self) -> dict:
+        current = self._current
+        return {
+            "loads": self.loads,
+            "date": current and current.date.isoformat(),
+            "trip_ids": current and len(current.trip_ids),
+        }
+
+
+service_day_cache = ServiceDayCache()
+metrics.register("service_day", service_day_cache.stats)
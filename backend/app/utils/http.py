@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+from collections.abc import Coroutine
+from dataclasses import asdict, dataclass
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..config import settings
+from . import metrics
+
+RETRY_METHODS = {"GET", "HEAD"}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_loop: asyncio.AbstractEventLoop | None = None
+_clients: dict[str, httpx.Client] = {}
+_async_clients: dict[str, httpx.AsyncClient] = {}
+_stats: dict[str, "HostStats"] = {}
+_lock = threading.Lock()
+
+
+@dataclass
+class HostStats:
+    """Counters for one host's connection pool."""
+
+    requests: int = 0
+    new_connections: int = 0
+    retries: int = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return self.requests - self.new_connections
+
+    def on_trace(self, event: str) -> None:
+        # httpcore only emits connect_tcp when the pool has no idle connection to
+        # hand out, so every request without one went over a reused connection.
+        if event == "connection.connect_tcp.started":
+            self.new_connections += 1
+
+    def as_dict(self) -> dict[str, int]:
+        return {**asdict(self), "reused_connections": self.reused_connections}
+
+
+def _backoff(attempt: int) -> float:
+    return settings.http_backoff_factor * 2**attempt
+
+
+def _should_retry(request: httpx.Request, attempt: int) -> bool:
+    return request.method in RETRY_METHODS and attempt < settings.http_retries
+
+
+class _RetryTransport(httpx.BaseTransport):
+    """Keep-alive transport that retries idempotent requests with backoff."""
+
+    def __init__(self, stats: HostStats, **kwargs: Any) -> None:
+        self._stats = stats
+        self._transport = httpx.HTTPTransport(**kwargs)
+
+    def _trace(self, event: str, _: dict) -> None:
+        self._stats.on_trace(event)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = self._trace
+        attempt = 0
+        while True:
+            self._stats.requests += 1
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError:
+                if not _should_retry(request, attempt):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or not _should_retry(
+                    request, attempt
+                ):
+                    return response
+                response.close()
+            self._stats.retries += 1
+            time.sleep(_backoff(attempt))
+            attempt += 1
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class _AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of `_RetryTransport`."""
+
+    def __init__(self, stats: HostStats, **kwargs: Any) -> None:
+        self._stats = stats
+        self._transport = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def _trace(self, event: str, _: dict) -> None:
+        self._stats.on_trace(event)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = self._trace
+        attempt = 0
+        while True:
+            self._stats.requests += 1
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError:
+                if not _should_retry(request, attempt):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or not _should_retry(
+                    request, attempt
+                ):
+                    return response
+                await response.aclose()
+            self._stats.retries += 1
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.http_max_connections_per_host,
+        max_keepalive_connections=settings.http_max_connections_per_host,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+
+
+def _host_stats(host: str) -> HostStats:
+    if host not in _stats:
+        _stats[host] = HostStats()
+    return _stats[host]
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) the event loop that owns the pooled async clients.
+
+    The scheduler jobs are synchronous and run on APScheduler worker threads, so the
+    loop lives on its own daemon thread and outlives any single poll. That way the
+    keep-alive connections in the client pools survive between polls.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="http-event-loop", daemon=True
+            ).start()
+        return _loop
+
+
+def run_async[T](coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine on the shared HTTP event loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def get_client(url: str) -> httpx.Client:
+    """Shared keep-alive client for the host of `url`.
+
+    Each host gets its own pool, so `http_max_connections_per_host` is enforced per
+    host rather than across every upstream.
+    """
+    host = _host(url)
+    with _lock:
+        if host not in _clients:
+            _clients[host] = httpx.Client(
+                timeout=settings.http_timeout,
+                transport=_RetryTransport(_host_stats(host), limits=_limits()),
+            )
+        return _clients[host]
+
+
+def get_async_client(url: str) -> httpx.AsyncClient:
+    """Async variant of `get_client`; only await it from `run_async` coroutines."""
+    host = _host(url)
+    with _lock:
+        if host not in _async_clients:
+            _async_clients[host] = httpx.AsyncClient(
+                timeout=settings.http_timeout,
+                transport=_AsyncRetryTransport(_host_stats(host), limits=_limits()),
+            )
+        return _async_clients[host]
+
+
+def close_clients() -> None:
+    """Close every pooled client, e.g. on application shutdown."""
+    with _lock:
+        clients = list(_clients.values())
+        async_clients = list(_async_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+    for client in clients:
+        client.close()
+    for async_client in async_clients:
+        run_async(async_client.aclose())
+
+
+def get_stats() -> dict[str, dict[str, int]]:
+    """Per-host request, new-connection, reused-connection and retry counters."""
+    return {host: stats.as_dict() for host, stats in _stats.items()}
+
+
+metrics.register("http", get_stats)
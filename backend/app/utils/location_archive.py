@@ -0,0 +1,117 @@
+"""Cold storage for vehicle_locations partitions as Parquet.
+
+Rows are kept one file per source table per Auckland day, under
+`<root>/date=<YYYY-MM-DD>/<table>.parquet`, so a time range only opens the files
+of the days it covers. `read_rows` gives rows from the database in the same
+schema, so archived and live rows can be combined.
+"""
+
+import datetime
+import io
+import os
+from pathlib import Path
+
+import polars as pl
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .feed_tables import TZ, VEHICLE_LOCATION_SCHEMA
+from .logger import MyLogger
+from .partitions import TIMEZONE, time_range
+
+ARCHIVE_SCHEMA: dict[str, pl.DataType] = {
+    **VEHICLE_LOCATION_SCHEMA,
+    "created_at": pl.Datetime("us", TZ),
+}
+# The generated PostGIS location column is left out, it is derived from these
+COLUMNS = ", ".join(ARCHIVE_SCHEMA)
+COMPRESSION = "zstd"
+
+
+def read_rows(session: Session, table: str, lower: int, upper: int) -> pl.DataFrame:
+    """Rows of `table` with `lower` <= timestamp < `upper`, as an ARCHIVE_SCHEMA frame.
+
+    Streams them with COPY, which is much faster than fetching them as Python
+    objects.
+    """
+    buffer = io.BytesIO()
+    session.connection().connection.cursor().copy_expert(
+        f"COPY (SELECT {COLUMNS} FROM {table} "
+        f"WHERE timestamp >= {int(lower)} AND timestamp < {int(upper)}) "
+        "TO STDOUT WITH (FORMAT csv, HEADER)",
+        buffer,
+    )
+    buffer.seek(0)
+    # Booleans come as t/f and timestamps with a UTC offset, so parse them here
+    text_columns = {
+        name: pl.String
+        for name, dtype in ARCHIVE_SCHEMA.items()
+        if dtype in (pl.Boolean, pl.Datetime)
+    }
+    rows = pl.read_csv(buffer, schema={**ARCHIVE_SCHEMA, **text_columns})
+    return rows.with_columns(
+        pl.col(name) == "t"
+        if ARCHIVE_SCHEMA[name] == pl.Boolean
+        else pl.col(name)
+        .str.to_datetime("%Y-%m-%d %H:%M:%S%.f%#z", time_zone="UTC")
+        .dt.convert_time_zone(TZ)
+        for name in text_columns
+    )
+
+
+class LocationArchive:
+    """Vehicle locations moved out of the database, as Parquet files by day."""
+
+    def __init__(self, root: str) -> None:
+        self.logger = MyLogger().get_logger()
+        self.root = Path(root)
+
+    def _path(self, day: datetime.date, table: str) -> Path:
+        return self.root / f"date={day.isoformat()}" / f"{table}.parquet"
+
+    def export(self, session: Session, table: str) -> int:
+        """Write every row of `table` to the archive, a day at a time.
+
+        Files are written under a temporary name and renamed into place, and an
+        export of the same table replaces them, so an interrupted export can be
+        run again.
+        """
+        first, last = session.execute(
+            text(f"SELECT min(timestamp), max(timestamp) FROM {table}")
+        ).one()
+        if first is None:
+            return 0
+        day = datetime.datetime.fromtimestamp(first, TIMEZONE).date()
+        end = datetime.datetime.fromtimestamp(last, TIMEZONE).date()
+        exported = 0
+        while day <= end:
+            next_day = day + datetime.timedelta(days=1)
+            rows = read_rows(session, table, *time_range(day, next_day))
+            if rows.height:
+                path = self._path(day, table)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                partial = path.with_suffix(".partial")
+                rows.sort("timestamp").write_parquet(partial, compression=COMPRESSION)
+                os.replace(partial, path)
+                exported += rows.height
+            day = next_day
+        self.logger.info(f"Archived {exported} rows of {table} to {self.root}")
+        return exported
+
+    def scan(self, lower: int, upper: int) -> pl.LazyFrame:
+        """Archived rows with `lower` <= timestamp < `upper`."""
+        day = datetime.datetime.fromtimestamp(lower, TIMEZONE).date()
+        end = datetime.datetime.fromtimestamp(upper - 1, TIMEZONE).date()
+        files = []
+        while day <= end:
+            files.extend(sorted(self._path(day, "*").parent.glob("*.parquet")))
+            day += datetime.timedelta(days=1)
+        if not files:
+            return pl.LazyFrame(schema=ARCHIVE_SCHEMA)
+        # Files archived before feed_id was added read it as null
+        return pl.scan_parquet(
+            files,
+            hive_partitioning=False,
+            schema=ARCHIVE_SCHEMA,
+            missing_columns="insert",
+        ).filter(pl.col("timestamp").is_between(lower, upper, closed="left"))
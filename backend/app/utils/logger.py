@@ -1,4 +1,5 @@
 import functools
+import inspect
 import logging
 import time
 from collections.abc import Callable
@@ -25,8 +26,7 @@ def log(
     _func: Callable | None = None, *, my_logger: MyLogger | logging.Logger = None
 ) -> str:
     def decorator_log(func: Callable) -> Callable:
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs) -> str:  # noqa: ANN002, ANN003
+        def log_call(args: tuple, kwargs: dict) -> logging.Logger:
             logger = get_default_logger()
             try:
                 if my_logger is None:
@@ -70,7 +70,33 @@ def log(
                     logger.info(f"function {func.__name__} called")
             except Exception as e:
                 raise e
+            return logger
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs) -> str:
+                logger = log_call(args, kwargs)
+                try:
+                    start_time = time.time()
+
+                    result = await func(*args, **kwargs)
 
+                    elapsed_time = time.time() - start_time
+                    logger.info(
+                        f"function {func.__name__} completed in {elapsed_time:.4f} "
+                        "seconds"
+                    )
+                    return result
+                except Exception:
+                    logger.exception(f"Exception raised in {func.__name__}")
+                    raise
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> str:  # noqa: ANN002, ANN003
+            logger = log_call(args, kwargs)
             try:
                 start_time = time.time()
 
@@ -0,0 +1,14 @@
+from collections.abc import Callable
+from typing import Any
+
+_providers: dict[str, Callable[[], Any]] = {}
+
+
+def register(name: str, provider: Callable[[], Any]) -> None:
+    """Register a callable whose return value is reported under `name`."""
+    _providers[name] = provider
+
+
+def snapshot() -> dict[str, Any]:
+    """Collect the current value of every registered metrics provider."""
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,352 @@
+"""Range partitions of vehicle_locations on its epoch-second `timestamp`.
+
+Each partition holds a day or a week (from Monday) of Auckland time, so queries
+bounded on `timestamp` only scan the partitions they overlap, and old rows can be
+detached a partition at a time instead of deleted. `maintain` creates partitions
+before writes need them and detaches the ones past their age. Rows outside every
+partition go to the default partition instead of failing their batch.
+"""
+
+import datetime
+import re
+from typing import Literal
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+TABLE = "vehicle_locations"
+DEFAULT_PARTITION = f"{TABLE}_default"
+# Holds the rows of a table from before partitioning, see `partition_existing`
+LEGACY_PARTITION = f"{TABLE}_legacy"
+BRIN_INDEX = f"idx_{TABLE}_timestamp_brin"
+TIMEZONE = ZoneInfo("Pacific/Auckland")
+
+Interval = Literal["day", "week"]
+
+_BOUNDS = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+
+def period_start(day: datetime.date, interval: Interval) -> datetime.date:
+    if interval == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def next_period(start: datetime.date, interval: Interval) -> datetime.date:
+    return start + datetime.timedelta(days=7 if interval == "week" else 1)
+
+
+def epoch(day: datetime.date) -> int:
+    """Epoch seconds of midnight starting `day` in Auckland."""
+    return int(datetime.datetime.combine(day, datetime.time(), TIMEZONE).timestamp())
+
+
+def time_range(start: datetime.date, end: datetime.date) -> tuple[int, int]:
+    """Epoch-second bounds (lower, upper) of the Auckland days from `start` to `end`.
+
+    Filter with `timestamp >= lower AND timestamp < upper` rather than converting
+    `timestamp` to a date, which would hide it from its indexes and from
+    partition pruning.
+    """
+    return epoch(start), epoch(end)
+
+
+def week_range(day: datetime.date) -> tuple[int, int]:
+    """`time_range` of the Monday-to-Sunday week holding `day`."""
+    start = period_start(day, "week")
+    return time_range(start, next_period(start, "week"))
+
+
+def partition_name(start: datetime.date) -> str:
+    return f"{TABLE}_p{start:%Y%m%d}"
+
+
+def _bound(value: str) -> int | None:
+    """A partition bound from pg_get_expr, None for MINVALUE and MAXVALUE."""
+    value = value.strip("'")
+    return None if value.endswith("VALUE") else int(value)
+
+
+def is_partitioned(session: Session) -> bool:
+    return bool(
+        session.scalar(
+            text("SELECT relkind = 'p' FROM pg_class WHERE oid = CAST(:t AS regclass)"),
+            {"t": TABLE},
+        )
+    )
+
+
+def partitions(session: Session) -> list[tuple[str, int | None, int | None]]:
+    """(name, lower, upper) of the attached range partitions, oldest first.
+
+    Bounds are epoch seconds, None where a partition is unbounded.
+    """
+    rows = session.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:t AS regclass)"
+        ),
+        {"t": TABLE},
+    ).all()
+    ranges = []
+    for name, bound in rows:
+        match = _BOUNDS.search(bound)
+        if match:  # not the default partition
+            ranges.append((name, _bound(match[1]), _bound(match[2])))
+    return sorted(ranges, key=lambda r: -(2**63) if r[1] is None else r[1])
+
+
+def _default_has_rows(session: Session, lower: int, upper: int) -> bool:
+    if session.scalar(text("SELECT to_regclass(:t)"), {"t": DEFAULT_PARTITION}) is None:
+        return False
+    return bool(
+        session.scalar(
+            text(
+                f"SELECT EXISTS (SELECT FROM {DEFAULT_PARTITION} "
+                "WHERE timestamp >= :lower AND timestamp < :upper)"
+            ),
+            {"lower": lower, "upper": upper},
+        )
+    )
+
+
+def _partition_default_rows(
+    session: Session, name: str, lower: int, upper: int
+) -> None:
+    """Create partition `name` from the rows the default partition holds for it.
+
+    Postgres refuses to add a partition whose bounds the default partition has
+    rows in, which happens when `maintain` has not run for longer than its
+    `ahead` periods. The rows are moved into a new table, which is then attached.
+    """
+    columns = ", ".join(
+        session.scalars(
+            text(
+                "SELECT attname FROM pg_attribute WHERE attrelid = CAST(:t AS regclass) "
+                "AND attnum > 0 AND NOT attisdropped AND attgenerated = '' "
+                "ORDER BY attnum"
+            ),
+            {"t": TABLE},
+        )
+    )
+    session.execute(
+        text(
+            f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS "
+            "INCLUDING GENERATED INCLUDING CONSTRAINTS)"
+        )
+    )
+    session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE timestamp >= {lower} AND timestamp < {upper} "
+            f"RETURNING {columns}) "
+            f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+        )
+    )
+    session.execute(
+        text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ({lower}) TO ({upper})"
+        )
+    )
+
+
+def create_partitions(
+    session: Session, today: datetime.date, interval: Interval, ahead: int
+) -> list[str]:
+    """Create the partitions for the current period and `ahead` more.
+
+    Periods overlapping an existing partition are skipped, so changing `interval`
+    takes effect once the partitions already made have run out. Rows of a period
+    that landed in the default partition are moved to its new partition.
+    """
+    existing = partitions(session)
+    created = []
+    start = period_start(today, interval)
+    for _ in range(ahead + 1):
+        end = next_period(start, interval)
+        lower, upper = epoch(start), epoch(end)
+        overlaps = any(
+            (lo is None or lo < upper) and (hi is None or lower < hi)
+            for _, lo, hi in existing
+        )
+        if not overlaps:
+            name = partition_name(start)
+            if _default_has_rows(session, lower, upper):
+                _partition_default_rows(session, name, lower, upper)
+            else:
+                session.execute(
+                    text(
+                        f"CREATE TABLE {name} PARTITION OF {TABLE} "
+                        f"FOR VALUES FROM ({lower}) TO ({upper})"
+                    )
+                )
+            created.append(name)
+        start = end
+    return created
+
+
+def detach_partitions(session: Session, before: int) -> list[str]:
+    """Detach the partitions holding only rows from before epoch second `before`.
+
+    Detached partitions are left in place as ordinary tables, without their
+    foreign keys, so they do not keep GTFS rows from being replaced.
+    """
+    detached = []
+    for name, _, upper in partitions(session):
+        if upper is not None and upper <= before:
+            session.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            foreign_keys = session.scalars(
+                text(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid = CAST(:t AS regclass) AND contype = 'f'"
+                ),
+                {"t": name},
+            ).all()
+            for constraint in foreign_keys:
+                session.execute(
+                    text(f"ALTER TABLE {name} DROP CONSTRAINT {constraint}")
+                )
+            detached.append(name)
+    return detached
+
+
+def detached_partitions(session: Session) -> list[str]:
+    """Former partitions left as tables by `detach_partitions`."""
+    return list(
+        session.scalars(
+            text(
+                "SELECT relname FROM pg_class "
+                "WHERE relnamespace = 'public'::regnamespace AND relkind = 'r' "
+                "AND NOT relispartition AND relname ~ :pattern ORDER BY relname"
+            ),
+            {"pattern": f"^{TABLE}_(p\\d{{8}}|legacy)$"},
+        )
+    )
+
+
+def add_feed_id(session: Session, feed: str) -> None:
+    """Add feed_id to the table, its detached partitions and its primary key.
+
+    For databases made before feeds were recorded, whose rows all came from `feed`.
+    Detached partitions get it too, as they are archived with the table's columns.
+    """
+    for table in [TABLE, *detached_partitions(session)]:
+        session.execute(
+            text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS feed_id "
+                f"VARCHAR(255) NOT NULL DEFAULT '{feed}'"
+            )
+        )
+        session.execute(text(f"ALTER TABLE {table} ALTER COLUMN feed_id DROP DEFAULT"))
+    pkey = session.scalar(
+        text(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = CAST(:t AS regclass) AND contype = 'p'"
+        ),
+        {"t": TABLE},
+    )
+    session.execute(
+        text(
+            f"ALTER TABLE {TABLE} DROP CONSTRAINT {pkey}, "
+            "ADD PRIMARY KEY (id, timestamp, feed_id)"
+        )
+    )
+
+
+def partition_existing(
+    session: Session, today: datetime.date, interval: Interval
+) -> None:
+    """Turn an unpartitioned vehicle_locations into a partitioned one.
+
+    The existing table becomes its first partition, running to the end of the
+    period of its newest row, so no rows are copied. Its indexes and constraints
+    are re-created on the new table under their own names, and the old ones are
+    attached to them. Attaching checks every row against the partition bound
+    with the table locked, so writes wait for it.
+    """
+    constraints = session.execute(
+        text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = CAST(:t AS regclass) AND contype IN ('p', 'u', 'f') "
+            "ORDER BY contype DESC"
+        ),
+        {"t": TABLE},
+    ).all()
+    indexes = session.execute(
+        text(
+            "SELECT ic.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+            "JOIN pg_class ic ON ic.oid = i.indexrelid "
+            "WHERE i.indrelid = CAST(:t AS regclass)"
+        ),
+        {"t": TABLE},
+    ).all()
+    newest = session.scalar(text(f"SELECT max(timestamp) FROM {TABLE}"))
+    last = (
+        datetime.datetime.fromtimestamp(newest, TIMEZONE).date()
+        if newest is not None
+        else today
+    )
+    upper = epoch(next_period(period_start(last, interval), interval))
+
+    session.execute(text(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_PARTITION}"))
+    for name, _ in indexes:
+        session.execute(text(f"ALTER INDEX {name} RENAME TO {name}_legacy"))
+    session.execute(
+        text(
+            f"CREATE TABLE {TABLE} (LIKE {LEGACY_PARTITION} INCLUDING DEFAULTS "
+            "INCLUDING GENERATED INCLUDING CONSTRAINTS) PARTITION BY RANGE (timestamp)"
+        )
+    )
+    constraint_names = {name for name, _ in constraints}
+    for name, definition in constraints:
+        session.execute(text(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}"))
+    for name, definition in indexes:
+        if name not in constraint_names:
+            session.execute(text(definition))
+    session.execute(
+        text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY_PARTITION} "
+            f"FOR VALUES FROM (MINVALUE) TO ({upper})"
+        )
+    )
+
+
+def maintain(
+    session: Session,
+    today: datetime.date,
+    interval: Interval,
+    ahead: int,
+    detach_after_days: int | None,
+    lock_timeout: str,
+) -> dict[str, list[str]]:
+    """Create the coming partitions and detach expired ones, in one transaction.
+
+    Also adds the BRIN index on `timestamp` to databases made before it existed,
+    which builds it on every partition while holding off writes.
+
+    `lock_timeout` bounds the wait for the table locks these take, which queue
+    the API's reads and writes behind them while they wait.
+    """
+    session.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    if not is_partitioned(session):
+        partition_existing(session, today, interval)
+    session.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} "
+            f"PARTITION OF {TABLE} DEFAULT"
+        )
+    )
+    session.execute(
+        text(
+            f"CREATE INDEX IF NOT EXISTS {BRIN_INDEX} ON {TABLE} "
+            "USING brin (timestamp) WITH (autosummarize = on)"
+        )
+    )
+    changes = {"created": create_partitions(session, today, interval, ahead)}
+    if detach_after_days is not None:
+        cutoff = epoch(today - datetime.timedelta(days=detach_after_days))
+        changes["detached"] = detach_partitions(session, cutoff)
+    return changes
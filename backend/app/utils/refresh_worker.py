@@ -0,0 +1,128 @@
+import datetime
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+from typing import Any
+
+from .helpers import service_day_cache
+from .logger import MyLogger
+
+# spawn rather than fork: the API process has running threads and open pools
+_context = multiprocessing.get_context("spawn")
+
+
+def _refresh(status: multiprocessing.Queue, feed: str, force: bool) -> None:
+    """Worker process entry point: refresh one GTFS feed, reporting to `status`."""
+    from ..API.gtfs import Controller
+    from ..config import settings
+
+    # Unwind on terminate() rather than die outright, so a build worker is killed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    con = Controller(settings.feed(feed))
+    con.on_progress = lambda phase: status.put({"phase": phase})
+    try:
+        counts = con.refresh_gtfs(force=force)
+    except Exception as e:
+        status.put({"phase": "failed", "error": repr(e)})
+        raise
+    status.put({"phase": "done", "counts": counts})
+
+
+class RefreshWorker:
+    """Runs refreshes of one GTFS feed in a separate process and tracks their progress.
+
+    Only one refresh of the feed runs at a time. `status` is safe to read from any
+    thread.
+    """
+
+    def __init__(self, feed: str) -> None:
+        self.feed = feed
+        self.logger = MyLogger().get_logger()
+        self._lock = threading.Lock()
+        self._process: multiprocessing.Process | None = None
+        self.state: dict[str, Any] = {
+            "running": False,
+            "phase": None,
+            "started_at": None,
+            "finished_at": None,
+            "last_success_at": None,
+            "last_counts": None,
+            "last_error": None,
+        }
+
+    def start(self, force: bool = False) -> threading.Thread | None:
+        """Start a refresh in the background, unless one is already running."""
+        with self._lock:
+            if self.state["running"]:
+                self.logger.info(
+                    f"GTFS refresh of {self.feed} already running, not starting another"
+                )
+                return None
+            self.state |= {
+                "running": True,
+                "phase": "starting",
+                "started_at": datetime.datetime.now(datetime.UTC),
+                "last_error": None,
+            }
+        thread = threading.Thread(
+            target=self._run,
+            args=(force,),
+            name=f"gtfs-refresh-{self.feed}",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def run(self, force: bool = False) -> None:
+        """Run a refresh in the worker process and wait for it to finish."""
+        thread = self.start(force)
+        if thread is not None:
+            thread.join()
+
+    def _run(self, force: bool) -> None:
+        status = _context.Queue()
+        process = _context.Process(
+            target=_refresh,
+            args=(status, self.feed, force),
+            name=f"gtfs-refresh-{self.feed}",
+            daemon=True,
+        )
+        self._process = process
+        process.start()
+        result: dict[str, Any] = {}
+        while process.is_alive() or not status.empty():
+            try:
+                message = status.get(timeout=1)
+            except queue.Empty:
+                continue
+            self.state["phase"] = message["phase"]
+            result = message
+        process.join()
+
+        now = datetime.datetime.now(datetime.UTC)
+        if result.get("phase") == "done":
+            # The worker invalidated its own copy of the cache, not ours
+            service_day_cache.invalidate()
+            self.state |= {"last_success_at": now, "last_counts": result["counts"]}
+            self.logger.info(
+                f"GTFS refresh of {self.feed} finished: {result['counts']}"
+            )
+        else:
+            error = result.get("error", f"worker exited with {process.exitcode}")
+            self.state |= {"phase": "failed", "last_error": error}
+            self.logger.error(f"GTFS refresh of {self.feed} failed: {error}")
+        self.state |= {"running": False, "finished_at": now}
+        self._process = None
+
+    def stop(self, timeout: float = 10) -> None:
+        process = self._process
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+
+    def status(self) -> dict[str, Any]:
+        return dict(self.state)
@@ -0,0 +1,243 @@
+"""Blue/green loading of a set of tables through PostgreSQL schemas.
+
+A new version of the tables is loaded into a shadow schema with the live tables'
+columns, then gets their indexes and constraints, and is moved into `public` in one
+short transaction. The tables it replaces are moved into an archive schema, so an
+earlier version can be swapped back in.
+"""
+
+import datetime
+import io
+import re
+
+import polars as pl
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+SHADOW_PREFIX = "gtfs_shadow_"
+ARCHIVE_PREFIX = "gtfs_archive_"
+# Copied into each archive, so a rollback restores the metadata of its version
+METADATA_TABLE = "gtfs_metadata"
+COPY_CHUNK_ROWS = 100_000
+
+
+def version_schema(prefix: str) -> str:
+    stamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d%H%M%S%f")
+    return f"{prefix}{stamp}"
+
+
+def list_schemas(session: Session, prefix: str) -> list[str]:
+    """Schemas named `prefix`..., newest first."""
+    return list(
+        session.scalars(
+            text(
+                "SELECT nspname FROM pg_namespace WHERE starts_with(nspname, :prefix) "
+                "ORDER BY nspname DESC"
+            ),
+            {"prefix": prefix},
+        )
+    )
+
+
+def drop_schemas(session: Session, schemas: list[str]) -> None:
+    for schema in schemas:
+        session.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+
+
+def create_shadow(session: Session, schema: str, tables: list[str]) -> None:
+    """Create empty copies of `tables` in `schema`, without indexes or foreign keys."""
+    session.execute(text(f'CREATE SCHEMA "{schema}"'))
+    for table in tables:
+        session.execute(
+            text(
+                f'CREATE TABLE "{schema}".{table} (LIKE public.{table} '
+                "INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+        )
+
+
+def copy_rows(session: Session, schema: str, table: str, rows: pl.DataFrame) -> None:
+    """COPY `rows` into `schema`.`table`, a slice at a time."""
+    cursor = session.connection().connection.cursor()
+    columns = ", ".join(rows.columns)
+    for chunk in rows.iter_slices(n_rows=COPY_CHUNK_ROWS):
+        buffer = io.BytesIO()
+        chunk.write_csv(buffer, include_header=False)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY "{schema}".{table} ({columns}) FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+
+
+def _index_definitions(session: Session, table: str) -> list[tuple[str, str, str]]:
+    """(index name, CREATE INDEX statement, constraint type) of a live table."""
+    return session.execute(
+        text(
+            "SELECT ic.relname, pg_get_indexdef(i.indexrelid),"
+            " coalesce(con.contype, '') FROM pg_index i JOIN pg_class ic ON ic.oid = i.indexrelid"
+            " LEFT JOIN pg_constraint con ON con.conindid = i.indexrelid"
+            " AND con.conrelid = i.indrelid AND con.contype IN ('p', 'u')"
+            " WHERE i.indrelid = CAST(:table AS regclass)"
+        ),
+        {"table": f"public.{table}"},
+    ).all()
+
+
+def _foreign_keys(
+    session: Session, where: str, params: dict
+) -> list[tuple[str, str, str]]:
+    """(table, constraint name, definition) of the foreign keys matching `where`.
+
+    Run with `public` as the only schema on the search path, so references to
+    tables in it come back unqualified and resolve against the caller's path.
+    """
+    session.execute(text("SET LOCAL search_path TO public"))
+    return session.execute(
+        text(
+            "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)"
+            f" FROM pg_constraint WHERE contype = 'f' AND {where}"
+        ),
+        params,
+    ).all()
+
+
+def build_indexes(session: Session, schema: str, tables: list[str]) -> None:
+    """Give the shadow tables the indexes and constraints of the live tables.
+
+    Indexes are built after the rows are loaded, which is much faster than keeping
+    them up to date row by row. Foreign keys between the tables point at their
+    shadow copies.
+    """
+    for table in tables:
+        for name, definition, contype in _index_definitions(session, table):
+            definition = re.sub(
+                r" ON (ONLY )?\S+ USING ", f' ON "{schema}".{table} USING ', definition
+            )
+            session.execute(text(definition))
+            if contype:
+                kind = "PRIMARY KEY" if contype == "p" else "UNIQUE"
+                session.execute(
+                    text(
+                        f'ALTER TABLE "{schema}".{table} ADD CONSTRAINT {name} '
+                        f"{kind} USING INDEX {name}"
+                    )
+                )
+    foreign_keys = _foreign_keys(
+        session,
+        "conrelid = ANY(CAST(:tables AS regclass[]))",
+        {"tables": [f"public.{table}" for table in tables]},
+    )
+    session.execute(text(f'SET LOCAL search_path TO "{schema}", public'))
+    for table, name, definition in foreign_keys:
+        session.execute(
+            text(f'ALTER TABLE "{schema}".{table} ADD CONSTRAINT {name} {definition}')
+        )
+    for table in tables:
+        session.execute(text(f'ANALYZE "{schema}".{table}'))
+
+
+def _leaf_partitions(session: Session, table: str) -> list[str]:
+    """The partitions holding the rows of `table`, none if it is not partitioned."""
+    return list(
+        session.scalars(
+            text(
+                "SELECT relid::regclass::text FROM pg_partition_tree(:table) "
+                "WHERE isleaf AND level > 0"
+            ),
+            {"table": table},
+        )
+    )
+
+
+def swap(
+    session: Session, source: str, retire_to: str, tables: list[str], lock_timeout: str
+) -> list[tuple[str, str, str, list[str]]]:
+    """Move `tables` from `source` into `public`, and the live ones into `retire_to`.
+
+    Foreign keys from other tables (vehicle_locations -> trips) follow the table
+    they were created on, so they are re-created against the new tables as NOT
+    VALID, which needs no scan. PostgreSQL 16 cannot add those to a partitioned
+    table, so there they go on each partition and the table's own is added back
+    once they are valid. Returns them as (table, constraint, definition,
+    partitions) for `validate` once this transaction has committed. If `source`
+    holds a copy of the metadata table, as archives do, it replaces the live
+    metadata. `source` is dropped.
+    """
+    session.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    live = [f"public.{table}" for table in tables]
+    referencing = [
+        (table, name, definition, _leaf_partitions(session, table))
+        for table, name, definition in _foreign_keys(
+            session,
+            "confrelid = ANY(CAST(:live AS regclass[]))"
+            " AND NOT conrelid = ANY(CAST(:live AS regclass[]))"
+            " AND conparentid = 0",
+            {"live": live},
+        )
+    ]
+    session.execute(text("RESET search_path"))
+
+    session.execute(text(f'CREATE SCHEMA "{retire_to}"'))
+    session.execute(
+        text(
+            f'CREATE TABLE "{retire_to}".{METADATA_TABLE} AS '
+            f"TABLE public.{METADATA_TABLE}"
+        )
+    )
+    for table in tables:
+        session.execute(text(f'ALTER TABLE public.{table} SET SCHEMA "{retire_to}"'))
+        session.execute(text(f'ALTER TABLE "{source}".{table} SET SCHEMA public'))
+    for table, name, definition, partitions in referencing:
+        if partitions:
+            session.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+        for child in partitions or [table]:
+            session.execute(
+                text(
+                    f"ALTER TABLE {child} DROP CONSTRAINT IF EXISTS {name}, "
+                    f"ADD CONSTRAINT {name} {definition} NOT VALID"
+                )
+            )
+
+    has_metadata = session.scalar(
+        text("SELECT to_regclass(:table) IS NOT NULL"),
+        {"table": f'"{source}".{METADATA_TABLE}'},
+    )
+    if has_metadata:
+        session.execute(text(f"DELETE FROM public.{METADATA_TABLE}"))
+        session.execute(
+            text(
+                f"INSERT INTO public.{METADATA_TABLE} "
+                f'SELECT * FROM "{source}".{METADATA_TABLE}'
+            )
+        )
+    session.execute(text(f'DROP SCHEMA "{source}" CASCADE'))
+    return referencing
+
+
+def validate(
+    session: Session, constraints: list[tuple[str, str, str, list[str]]]
+) -> list[str]:
+    """VALIDATE constraints added NOT VALID, without blocking writes to the tables.
+
+    A partitioned table then gets its own constraint back, which takes over its
+    partitions' valid ones without checking their rows again. A constraint that
+    existing rows fail is left NOT VALID, which still checks new rows, and its
+    name is returned.
+    """
+    failed = []
+    for table, name, definition, partitions in constraints:
+        try:
+            with session.begin_nested():
+                for child in partitions or [table]:
+                    session.execute(
+                        text(f"ALTER TABLE {child} VALIDATE CONSTRAINT {name}")
+                    )
+                if partitions:
+                    session.execute(
+                        text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+                    )
+        except IntegrityError:
+            failed.append(name)
+    return failed
@@ -0,0 +1,161 @@
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import polars as pl
+from sqlalchemy.exc import SQLAlchemyError
+
+from .logger import MyLogger
+
+
+class WriteBehindQueue:
+    """Bounded queue of row batches drained into the database by a writer thread.
+
+    `put` blocks for up to `put_timeout` seconds when the queue is full, so a slow
+    database pushes back on the producer. Batches that cannot be queued in time, or
+    that fail to write, are appended to the NDJSON file at `spill_path` (when set).
+    The writer replays that file once writes succeed again.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[pl.DataFrame], None],
+        schema: dict[str, pl.DataType],
+        *,
+        max_batches: int,
+        batch_rows: int,
+        flush_interval: float,
+        put_timeout: float,
+        spill_path: str | None = None,
+        replay_interval: float = 30,
+    ) -> None:
+        self.logger: logging.Logger = MyLogger().get_logger()
+        self._write = write
+        self._schema = schema
+        self._queue: queue.Queue[pl.DataFrame] = queue.Queue(maxsize=max_batches)
+        self._batch_rows = batch_rows
+        self._flush_interval = flush_interval
+        self._put_timeout = put_timeout
+        self._spill_path = Path(spill_path) if spill_path else None
+        self._spill_lock = threading.Lock()
+        self._replay_interval = replay_interval
+        self._next_replay = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+        self.counters = {
+            "flushed_rows": 0,
+            "failed_flushes": 0,
+            "spilled_rows": 0,
+            "replayed_rows": 0,
+            "dropped_rows": 0,
+            "last_batch_rows": 0,
+            "last_flush_seconds": 0.0,
+        }
+
+    def _ensure_started(self) -> None:
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="write-behind", daemon=True
+                )
+                self._thread.start()
+
+    def put(self, rows: pl.DataFrame) -> None:
+        """Queue a batch for writing, spilling it to disk if the queue stays full."""
+        self._ensure_started()
+        try:
+            self._queue.put(rows, timeout=self._put_timeout)
+        except queue.Full:
+            self.logger.warning(
+                f"Write-behind queue full for {self._put_timeout}s, spilling batch"
+            )
+            self._spill(rows)
+
+    def _spill(self, rows: pl.DataFrame) -> None:
+        if self._spill_path is None:
+            self.counters["dropped_rows"] += len(rows)
+            self.logger.error(f"No spill file configured, dropped {len(rows)} rows")
+            return
+        with self._spill_lock:
+            self._spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._spill_path.open("a") as f:
+                f.write(rows.write_ndjson())
+        self.counters["spilled_rows"] += len(rows)
+
+    def _replay(self) -> None:
+        """Write spilled rows back in batches, keeping the file if any batch fails.
+
+        Rows already written before a failure are written again on the next attempt,
+        which relies on the writer ignoring conflicts.
+        """
+        if self._spill_path is None:
+            return
+        replay_path = self._spill_path.with_suffix(".replay")
+        with self._spill_lock:
+            if not replay_path.exists():
+                if not self._spill_path.exists():
+                    return
+                # New spills go to a fresh file while this one is replayed
+                self._spill_path.rename(replay_path)
+
+        spilled = pl.read_ndjson(replay_path, schema=self._schema)
+        for offset in range(0, len(spilled), self._batch_rows):
+            self._write(spilled.slice(offset, self._batch_rows))
+        replay_path.unlink()
+        # Only now, as a failed replay writes every batch again
+        self.counters["replayed_rows"] += len(spilled)
+        self.logger.info(f"Replayed {len(spilled)} spilled rows")
+
+    def _next_batch(self) -> pl.DataFrame | None:
+        try:
+            frames = [self._queue.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return None
+        n_rows = len(frames[0])
+        while n_rows < self._batch_rows:
+            try:
+                frames.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            n_rows += len(frames[-1])
+        return pl.concat(frames)
+
+    def _flush(self, batch: pl.DataFrame) -> bool:
+        start = time.perf_counter()
+        try:
+            self._write(batch)
+        except SQLAlchemyError as e:
+            self.counters["failed_flushes"] += 1
+            self.logger.warning(f"Write-behind flush failed, spilling batch: {e}")
+            self._spill(batch)
+            return False
+        self.counters["flushed_rows"] += len(batch)
+        self.counters["last_batch_rows"] = len(batch)
+        self.counters["last_flush_seconds"] = time.perf_counter() - start
+        return True
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch is not None and not self._flush(batch):
+                continue
+            if time.monotonic() < self._next_replay:
+                continue
+            try:
+                self._replay()
+            except (SQLAlchemyError, OSError) as e:
+                self._next_replay = time.monotonic() + self._replay_interval
+                self.logger.warning(f"Replaying spilled rows failed, will retry: {e}")
+
+    def close(self, timeout: float | None = None) -> None:
+        """Stop accepting work and wait for the writer to drain the queue."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict[str, float]:
+        return {"queue_depth": self._queue.qsize(), **self.counters}
@@ -0,0 +1,104 @@
+"""Load test: /health latency while /trips is under concurrent load.
+
+Serves the app with uvicorn and two extra routes: `/bench/blocking-trips`, which calls
+the synchronous trips controller from an `async def` handler (how the routes used
+to work), and the real `/trips`, which awaits the asyncpg controller. For each, it
+runs CONCURRENCY workers requesting trips while probing `/health` every
+PROBE_INTERVAL seconds, then reports the /health latency percentiles.
+
+Needs a database initialised from `data/init.sql`, loaded with GTFS data, and the
+usual POSTGRES_* env vars.
+
+Run from `backend/`:  uv run python -m benchmarks.api_latency
+"""
+
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+os.environ.setdefault("SUBSCRIPTION_KEY", "stub")
+
+from app.API.trips import Controller
+from app.main import app
+from app.schemas.trips import Trip
+
+PORT = 8765
+CONCURRENCY = 32
+DURATION = 10.0
+PROBE_INTERVAL = 0.05
+TRIPS_LIMIT = 2000
+
+sync_con = Controller()
+
+
+@app.get("/bench/blocking-trips")
+async def blocking_trips(limit: int | None = None) -> list[Trip]:
+    return sync_con.get_trips(limit=limit)
+
+
+async def load(client: httpx.AsyncClient, path: str, stop: asyncio.Event) -> int:
+    requests = 0
+    while not stop.is_set():
+        await client.get(path, params={"limit": TRIPS_LIMIT})
+        requests += 1
+    return requests
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event) -> list[float]:
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(PROBE_INTERVAL)
+    return latencies
+
+
+async def run(path: str) -> None:
+    limits = httpx.Limits(max_connections=CONCURRENCY + 1)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=60
+    ) as client:
+        await client.get(path, params={"limit": TRIPS_LIMIT})  # warm up the pools
+        stop = asyncio.Event()
+        workers = [
+            asyncio.create_task(load(client, path, stop)) for _ in range(CONCURRENCY)
+        ]
+        prober = asyncio.create_task(probe(client, stop))
+        await asyncio.sleep(DURATION)
+        stop.set()
+        requests = sum(await asyncio.gather(*workers))
+        latencies = sorted(await prober)
+
+    # Inclusive, as a starved prober may only get a handful of samples
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(
+        f"{path:<22} trips {requests / DURATION:7.1f} req/s  "
+        f"/health n {len(latencies):4d}  p50 {q[49] * 1000:7.1f}ms  "
+        f"p99 {q[98] * 1000:7.1f}ms  max {latencies[-1] * 1000:7.1f}ms"
+    )
+
+
+def main() -> None:
+    server = uvicorn.Server(
+        uvicorn.Config(app, port=PORT, log_level="warning", lifespan="off")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    for path in ("/bench/blocking-trips", "/trips"):
+        asyncio.run(run(path))
+
+    server.should_exit = True
+    thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Full-week scans of vehicle locations from Postgres vs the Parquet archive.
+
+Fills a week-long vehicle_locations partition with synthetic rows (VEHICLES
+vehicles reporting every POLL_SECONDS), then reads the whole week and runs a
+per-route aggregate over it, first from Postgres and then, after the partition is
+archived, from Parquet. Reports the best of REPEATS runs and the size on disk.
+
+Creates and archives a partition in BENCH_WEEK, so point it at a scratch database
+initialised from `data/init.sql`, with the usual POSTGRES_* env vars.
+
+Run from `backend/`:  uv run python -m benchmarks.archive_scan
+"""
+
+import datetime
+import os
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import polars as pl
+from sqlalchemy import text
+
+os.environ.setdefault("SUBSCRIPTION_KEY", "stub")
+
+from app.API.history import Controller
+from app.utils import partitions
+from app.utils.location_archive import LocationArchive
+
+VEHICLES = 1_000
+POLL_SECONDS = 60
+N_TRIPS = 2_000
+REPEATS = 3
+# A Monday long before any real rows
+BENCH_WEEK = datetime.date(2020, 1, 6)
+AGGREGATE_SQL = text(
+    "SELECT route_id, count(*), avg(delay), avg(speed) FROM vehicle_locations "
+    "WHERE timestamp >= :lower AND timestamp < :upper GROUP BY route_id"
+)
+
+
+def best_of(run: Callable[[], int]) -> tuple[float, int]:
+    times, rows = [], 0
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        rows = run()
+        times.append(time.perf_counter() - start)
+    return min(times), rows
+
+
+def fill(con: Controller, lower: int) -> str:
+    with con.get_session() as session:
+        (name,) = partitions.create_partitions(session, BENCH_WEEK, "week", 0)
+        session.execute(
+            text(
+                "INSERT INTO calendar VALUES ('bench', 1, 1, 1, 1, 1, 1, 1, 'bench') "
+                "ON CONFLICT DO NOTHING"
+            )
+        )
+        session.execute(
+            text(
+                "INSERT INTO trips (trip_id, route_id, service_id, direction_id, "
+                "shape_id, feed_id) SELECT 'bench-trip-' || i, 'BENCH-' || i % 100, "
+                "'bench', i % 2, 'bench', 'bench' FROM generate_series(0, :n - 1) i "
+                "ON CONFLICT DO NOTHING"
+            ),
+            {"n": N_TRIPS},
+        )
+        session.execute(
+            text(
+                "INSERT INTO vehicle_locations (id, trip_id, occupancy_status, "
+                "bearing, latitude, longitude, speed, timestamp, start_time, "
+                "route_id, is_deleted, stop_sequence, stop_id, vehicle_id, label, "
+                "delay, feed_id) SELECT v, 'bench-trip-' || (v + t) % :trips, v % 7, "
+                "(t * 7) % 360, -36.85 + v / 1e5, 174.76 + v / 1e5, (t % 20) * 0.5, "
+                ":lower + t * :poll, to_timestamp(:lower + t * :poll), "
+                "'BENCH-' || (v + t) % :trips % 100, false, t % 40, 'bench-stop', "
+                "'bench-' || v, 'Bench ' || v, (v * t) % 600 - 120, 'bench' "
+                "FROM generate_series(0, :vehicles - 1) v, "
+                "generate_series(0, 7 * 86400 / :poll - 1) t"
+            ),
+            {
+                "lower": lower,
+                "poll": POLL_SECONDS,
+                "vehicles": VEHICLES,
+                "trips": N_TRIPS,
+            },
+        )
+        session.commit()
+        session.execute(text(f"ANALYZE {name}"))
+        session.commit()
+    return name
+
+
+def main() -> None:
+    lower, upper = partitions.week_range(BENCH_WEEK)
+    start = datetime.datetime.fromtimestamp(lower, partitions.TIMEZONE)
+    end = datetime.datetime.fromtimestamp(upper, partitions.TIMEZONE)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        con = Controller()
+        con.archive = LocationArchive(tmp)
+        name = fill(con, lower)
+        try:
+            with con.get_session() as session:
+                pg_bytes = session.scalar(
+                    text("SELECT pg_total_relation_size(CAST(:t AS regclass))"),
+                    {"t": name},
+                )
+
+            def pg_aggregate() -> int:
+                with con.get_session() as session:
+                    return len(
+                        session.execute(
+                            AGGREGATE_SQL, {"lower": lower, "upper": upper}
+                        ).all()
+                    )
+
+            def parquet_aggregate() -> int:
+                return (
+                    con.archive.scan(lower, upper)
+                    .group_by("route_id")
+                    .agg(pl.len(), pl.col("delay").mean(), pl.col("speed").mean())
+                    .collect()
+                    .height
+                )
+
+            def read_week() -> int:
+                return con.read_locations(start, end).height
+
+            results = {
+                "postgres read": best_of(read_week),
+                "postgres aggregate": best_of(pg_aggregate),
+            }
+
+            with con.get_session() as session:
+                session.execute(
+                    text(f"ALTER TABLE {partitions.TABLE} DETACH PARTITION {name}")
+                )
+                session.commit()
+            archive_start = time.perf_counter()
+            con._archive_table(name)
+            archive_s = time.perf_counter() - archive_start
+            parquet_bytes = sum(f.stat().st_size for f in Path(tmp).rglob("*.parquet"))
+
+            results |= {
+                "parquet read": best_of(read_week),
+                "parquet aggregate": best_of(parquet_aggregate),
+            }
+        finally:
+            with con.get_session() as session:
+                session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                session.execute(text("DELETE FROM trips WHERE service_id = 'bench'"))
+                session.execute(text("DELETE FROM calendar WHERE service_id = 'bench'"))
+                session.commit()
+
+    rows = results["postgres read"][1]
+    print(f"{rows:,} rows in the week, archived in {archive_s:.2f}s")
+    print(
+        f"on disk: postgres {pg_bytes / 2**20:,.0f} MiB (with indexes), "
+        f"parquet {parquet_bytes / 2**20:,.0f} MiB"
+    )
+    for label, (seconds, n) in results.items():
+        print(f"{label:<19} {seconds:7.3f}s  {n:>11,} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Measure cold-start time to the first healthy and ready responses.
+
+Starts the API with uvicorn once per GTFS startup mode and polls `/health` and
+`/ready` until each answers 200, printing the time from process start. With
+"blocking" the app serves nothing until the refresh is done. With "background"
+/health should answer as soon as the app has imported.
+
+Needs the same environment as the backend container (POSTGRES_*, SUBSCRIPTION_KEY,
+SAVE_TIME, UPDATE_TRIPS_TIME, JOURNEYS) and a reachable database.
+
+Run from `backend/`:  uv run python -m benchmarks.cold_start
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+PORT = 8766
+MODES = ("blocking", "background")
+TIMEOUT = 600
+
+
+def wait_for(
+    client: httpx.Client, path: str, start: float, process: subprocess.Popen
+) -> float:
+    while time.perf_counter() - start < TIMEOUT:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited with {process.returncode}")
+        try:
+            if client.get(path).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{path} not ready after {TIMEOUT}s")
+
+
+def main() -> None:
+    for mode in MODES:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(PORT)],
+            env={**os.environ, "GTFS_STARTUP_REFRESH": mode},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{PORT}", timeout=5) as client:
+                healthy = wait_for(client, "/health", start, process)
+                ready = wait_for(client, "/ready", start, process)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{mode:<10} first /health {healthy:7.2f}s  first /ready {ready:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Time polls of the realtime feeds.
+
+Spins up a local stub of the AT realtime API where each feed takes DELAY seconds to
+respond, then times `Controller._fetch_feeds` against it. The poll should take about
+one DELAY (the slower feed) rather than the sum of both. tests/test_vehicles.py
+checks that the requests overlap and that polls reuse connections.
+
+Run from `backend/`:  uv run python -m benchmarks.concurrent_fetch
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+for key, value in {
+    "SUBSCRIPTION_KEY": "stub",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "stub",
+    "POSTGRES_USER": "stub",
+    "POSTGRES_PW": "stub",
+}.items():
+    os.environ.setdefault(key, value)
+
+from app.API.vehicles import Controller
+from app.config import FeedConfig
+from app.utils.http import run_async
+
+DELAY = 0.5
+PAYLOAD = json.dumps(
+    {"status": "OK", "response": {"header": {"timestamp": 0}, "entity": []}}
+).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        time.sleep(DELAY)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+def main() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stub = f"http://127.0.0.1:{server.server_port}"
+    con = Controller(
+        [
+            FeedConfig(
+                name="stub",
+                url=f"{stub}/gtfs.zip",
+                vehicle_positions_url=f"{stub}/vehiclelocations",
+                trip_updates_url=f"{stub}/tripupdates",
+            )
+        ]
+    )
+
+    for attempt in range(3):
+        start = time.perf_counter()
+        run_async(con._fetch_feeds())
+        elapsed = time.perf_counter() - start
+        print(
+            f"poll {attempt}: {elapsed:.3f}s (sequential would be >= {2 * DELAY:.3f}s)"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
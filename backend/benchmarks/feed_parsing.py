@@ -0,0 +1,178 @@
+"""Compare parse time and peak memory of the realtime feed ingest modes.
+
+Modes: per-entity Pydantic validation of the JSON feeds, the columnar Polars parser
+for the JSON feeds, and the GTFS-Realtime protobuf decoder.
+
+The recorded `data/responses/vehicle_location.json` holds a single entity, so it is
+replicated (with distinct vehicle and trip ids) up to fleet size, and a matching
+trip updates feed is synthesised. All modes must produce the same rows, up to the
+float32 precision GTFS-Realtime uses for positions.
+
+Run from `backend/`:  uv run python -m benchmarks.feed_parsing [n_vehicles]
+"""
+
+import copy
+import json
+import math
+import os
+import pathlib
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from google.protobuf import json_format
+from google.transit import gtfs_realtime_pb2
+
+for key, value in {
+    "SUBSCRIPTION_KEY": "stub",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "stub",
+    "POSTGRES_USER": "stub",
+    "POSTGRES_PW": "stub",
+}.items():
+    os.environ.setdefault(key, value)
+
+from app.API.vehicles import Controller
+from app.utils.feed_tables import (
+    join_vehicle_locations,
+    trip_update_table,
+    vehicle_table,
+)
+from app.utils.gtfs_realtime import decode_vehicle_locations, parse_feed
+
+RECORDED = pathlib.Path(__file__).parents[2] / "data/responses/vehicle_location.json"
+REPEATS = 5
+
+
+def build_feeds(n_vehicles: int) -> tuple[dict, dict]:
+    recorded = json.loads(RECORDED.read_text())
+    template = recorded["response"]["entity"][0]
+    vehicles, trip_updates = [], []
+    for i in range(n_vehicles):
+        entity = copy.deepcopy(template)
+        trip_id = f"{entity['vehicle']['trip']['trip_id']}-{i}"
+        entity["id"] = str(10000 + i)
+        entity["vehicle"]["trip"]["trip_id"] = trip_id
+        entity["vehicle"]["vehicle"]["id"] = entity["id"]
+        vehicles.append(entity)
+        trip_updates.append(
+            {
+                "id": entity["id"],
+                "trip_update": {
+                    "trip": entity["vehicle"]["trip"],
+                    "stop_time_update": [
+                        {
+                            "stop_sequence": i % 40 + 1,
+                            "stop_id": f"{7000 + i % 40}-abcd1234",
+                            "schedule_relationship": 0,
+                            "departure": {"delay": 60, "time": 1769856200},
+                        }
+                    ],
+                    "vehicle": entity["vehicle"]["vehicle"],
+                    "timestamp": entity["vehicle"]["timestamp"],
+                    "delay": 60,
+                },
+                "is_deleted": False,
+            }
+        )
+    header = recorded["response"]["header"]
+    return (
+        {"status": "OK", "response": {"header": header, "entity": vehicles}},
+        {"status": "OK", "response": {"header": header, "entity": trip_updates}},
+    )
+
+
+def to_protobuf(feed: dict) -> bytes:
+    response = copy.deepcopy(feed["response"])
+    response["header"]["timestamp"] = int(response["header"]["timestamp"])
+    for entity in response["entity"]:
+        if "vehicle" in entity:
+            position = entity["vehicle"]["position"]
+            position["bearing"] = float(position["bearing"])
+    message = json_format.ParseDict(
+        response, gtfs_realtime_pb2.FeedMessage(), ignore_unknown_fields=True
+    )
+    return message.SerializeToString()
+
+
+def same_rows(json_rows: list[dict], other_rows: list[dict]) -> bool:
+    json_rows = sorted(json_rows, key=lambda r: r["trip_id"])
+    other_rows = sorted(other_rows, key=lambda r: r["trip_id"])
+    return len(json_rows) == len(other_rows) and all(
+        a.keys() == b.keys()
+        and all(
+            math.isclose(a[k], b[k], rel_tol=1e-6)
+            if isinstance(a[k], float)
+            else a[k] == b[k]
+            for k in a
+        )
+        for a, b in zip(json_rows, other_rows, strict=True)
+    )
+
+
+def measure(name: str, fn: Callable[[], list[dict]]) -> list[dict]:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    rows = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<9} best {min(timings) * 1000:8.1f} ms   "
+        f"peak {peak / 2**20:7.1f} MiB   rows {len(rows)}"
+    )
+    return rows
+
+
+def main() -> None:
+    n_vehicles = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    vehicle_feed, trip_update_feed = build_feeds(n_vehicles)
+    trip_ids = {
+        e["vehicle"]["trip"]["trip_id"] for e in vehicle_feed["response"]["entity"]
+    }
+    json_bytes = (
+        json.dumps(vehicle_feed).encode(),
+        json.dumps(trip_update_feed).encode(),
+    )
+    proto_bytes = (to_protobuf(vehicle_feed), to_protobuf(trip_update_feed))
+    print(
+        f"{n_vehicles} vehicles: json {sum(map(len, json_bytes)) / 1024:.0f} KiB, "
+        f"protobuf {sum(map(len, proto_bytes)) / 1024:.0f} KiB"
+    )
+
+    con = Controller()
+
+    def parse_json() -> list[dict]:
+        return [
+            location.model_dump(exclude={"feed_id"})
+            for location in con._parse_json_feeds(
+                json.loads(json_bytes[0]), json.loads(json_bytes[1]), trip_ids
+            )
+        ]
+
+    def parse_columnar() -> list[dict]:
+        return join_vehicle_locations(
+            vehicle_table(json.loads(json_bytes[0])),
+            trip_update_table(json.loads(json_bytes[1])),
+            trip_ids,
+        ).to_dicts()
+
+    def parse_protobuf() -> list[dict]:
+        return decode_vehicle_locations(
+            parse_feed(proto_bytes[0]), parse_feed(proto_bytes[1]), trip_ids
+        )
+
+    json_rows = measure("pydantic", parse_json)
+    columnar_rows = measure("columnar", parse_columnar)
+    proto_rows = measure("protobuf", parse_protobuf)
+    assert same_rows(json_rows, columnar_rows), "Pydantic and columnar rows differ"
+    assert same_rows(json_rows, proto_rows), "JSON and protobuf rows differ"
+
+
+if __name__ == "__main__":
+    main()
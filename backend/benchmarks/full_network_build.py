@@ -0,0 +1,88 @@
+"""Runtime and peak memory of the GTFS build per `gtfs_network_scope`.
+
+Runs the build worker once per scope, "journeys" (trips covering JOURNEYS) and
+"full" (every consecutive stop pair of every trip), and reports wall time, the
+worker's peak RSS and the size of the tables it built.
+
+Uses the feed directory given as the first argument, else the most recently used
+version in the GTFS cache, else a synthetic feed with about as many stop_times rows
+as Auckland's (~4M). No database is needed.
+
+Run from `backend/`:  uv run python -m benchmarks.full_network_build [feed dir]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import polars as pl
+
+for key in ("SUBSCRIPTION_KEY", "POSTGRES_HOST", "POSTGRES_DB", "POSTGRES_USER"):
+    os.environ.setdefault(key, "stub")
+os.environ.setdefault("POSTGRES_PW", "stub")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+
+from app.API.gtfs import APP_ROOT, BUILD_OUTPUTS
+from app.config import settings
+from benchmarks import refresh_latency
+from benchmarks.refresh_latency import cached_feed, make_feed
+
+SCOPES = ("journeys", "full")
+# 400 patterns x 250 trips x 40 stops = 4M stop_times rows
+refresh_latency.TRIPS_PER_PATTERN = 250
+
+
+def run(feed: Path, scope: str) -> None:
+    env = {**os.environ, "GTFS_NETWORK_SCOPE": scope}
+    with tempfile.TemporaryDirectory() as out:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "app.utils.build_worker",
+                str(feed),
+                out,
+                settings.gtfs_feeds[0].name,
+            ],
+            cwd=APP_ROOT,
+            env=env,
+        )
+        # wait4 gives this worker's own rusage, not the max over all children
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise RuntimeError(f"build worker failed for scope {scope!r}")
+        sizes = {
+            name: pl.scan_ipc(Path(out) / f"{name}.arrow")
+            .select(pl.len())
+            .collect()
+            .item()
+            for name in BUILD_OUTPUTS
+        }
+    print(
+        f"{scope:<9} {elapsed:7.2f}s  peak RSS {usage.ru_maxrss / 1024:7.0f} MiB  "
+        + "  ".join(f"{name} {size:,}" for name, size in sizes.items())
+    )
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 1:
+            feed = Path(sys.argv[1])
+        else:
+            feed = cached_feed()
+        if feed is None:
+            feed = Path(tmp)
+            make_feed(feed)
+        stop_times = pl.scan_parquet(feed / "stop_times.parquet").select(pl.len())
+        print(f"feed: {feed} ({stop_times.collect().item():,} stop_times rows)")
+        for scope in SCOPES:
+            run(feed, scope)
+
+
+if __name__ == "__main__":
+    main()
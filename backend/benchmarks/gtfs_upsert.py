@@ -0,0 +1,147 @@
+"""Benchmark the chunked GTFS upsert at key-journeys and all-routes scale.
+
+Writes synthetic `bench-` stops, trips, segments and trip_segments through
+`Controller._upsert` ("chunked") and through the single INSERT it replaced
+("single", in a savepoint that is rolled back), and reports time, rows/s and
+traced peak Python memory per table. The single statement is skipped above
+SINGLE_MAX_ROWS, where it no longer fits in memory. Everything runs in one
+transaction that is rolled back, so the database is left as it was.
+
+Needs a database initialised from `data/init.sql` and the usual POSTGRES_* env vars.
+
+Run from `backend/`:  uv run python -m benchmarks.gtfs_upsert
+"""
+
+import os
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import polars as pl
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("SUBSCRIPTION_KEY", "stub")
+
+from app.API.gtfs import MAX_BIND_PARAMS, Controller
+from app.models.models import Segment, Stop, Trip, TripSegment
+
+# (stops, trips, segments per trip) - roughly the key journeys only, and every
+# route in the Auckland feed
+SCALES = {
+    "key-journeys": (2_000, 5_000, 10),
+    "all-routes": (20_000, 100_000, 30),
+}
+SINGLE_MAX_ROWS = 500_000
+
+
+def make_tables(n_stops: int, n_trips: int, per_trip: int) -> dict:
+    i = pl.col("i")
+    stops = pl.select(i=pl.int_range(n_stops)).select(
+        stop_id=pl.format("bench-stop-{}", i),
+        location_type=pl.lit(0),
+        stop_code=i.cast(pl.String),
+        stop_lat=-36.8 - i / 100_000,
+        stop_lon=174.7 + i / 100_000,
+        stop_name=pl.format("Bench stop {}", i),
+    )
+    trips = pl.select(i=pl.int_range(n_trips)).select(
+        trip_id=pl.format("bench-trip-{}", i),
+        route_id=pl.format("BENCH-{}", i % 500),
+        service_id=pl.lit("bench"),
+        direction_id=i % 2,
+        shape_id=pl.format("bench-shape-{}", i % 2_000),
+    )
+    segments = pl.select(i=pl.int_range(n_stops - 1)).select(
+        segment_id=pl.format("bench-{}-{}", i, i + 1),
+        start_stop_id=pl.format("bench-stop-{}", i),
+        end_stop_id=pl.format("bench-stop-{}", i + 1),
+    )
+    trip_segments = pl.select(i=pl.int_range(n_trips * per_trip)).select(
+        trip_id=pl.format("bench-trip-{}", i // per_trip),
+        segment_id=pl.format(
+            "bench-{}-{}",
+            (i // per_trip * 7 + i % per_trip) % (n_stops - 1),
+            (i // per_trip * 7 + i % per_trip) % (n_stops - 1) + 1,
+        ),
+    )
+    return {
+        model: rows.with_columns(feed_id=pl.lit("bench"))
+        for model, rows in (
+            (Stop, stops),
+            (Trip, trips),
+            (Segment, segments),
+            (TripSegment, trip_segments),
+        )
+    }
+
+
+def single_statement_upsert(session: Session, model: type, rows: pl.DataFrame) -> None:
+    """The upsert before chunking: one INSERT with every row in its VALUES."""
+    stmt = insert(model).values(rows.to_dicts())
+    pk_cols = [col.name for col in model.__table__.primary_key]
+    set_ = {
+        col.name: stmt.excluded[col.name]
+        for col in model.__table__.columns
+        if not col.primary_key and col.name in rows.columns
+    }
+    if set_:
+        stmt = stmt.on_conflict_do_update(index_elements=pk_cols, set_=set_)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=pk_cols)
+    session.execute(stmt)
+
+
+def measure(
+    label: str,
+    write: Callable[..., None],
+    session: Session,
+    model: type,
+    rows: pl.DataFrame,
+) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    write(session, model, rows)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"    {label:<8} {elapsed:8.2f}s {rows.height / elapsed:>10,.0f} rows/s "
+        f"peak {peak / 2**20:7.1f} MiB"
+    )
+
+
+def main() -> None:
+    con = Controller()
+    for scale, sizes in SCALES.items():
+        tables = make_tables(*sizes)
+        print(f"{scale}:")
+        with con.get_session() as session:
+            session.execute(
+                text(
+                    "INSERT INTO calendar VALUES "
+                    "('bench', 1, 1, 1, 1, 1, 1, 1, 'bench') "
+                    "ON CONFLICT DO NOTHING"
+                )
+            )
+            for model, rows in tables.items():
+                params = rows.height * rows.width
+                print(
+                    f"  {model.__tablename__:<14} {rows.height:>9,} rows "
+                    f"(single statement: {params:,} params, "
+                    f"{'over' if params > MAX_BIND_PARAMS else 'under'} "
+                    "the protocol limit)"
+                )
+                if rows.height <= SINGLE_MAX_ROWS:
+                    savepoint = session.begin_nested()
+                    measure("single", single_statement_upsert, session, model, rows)
+                    savepoint.rollback()
+                else:
+                    print("    single   skipped")
+                measure("chunked", con._upsert, session, model, rows)
+            session.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark Phase 1 journey matching as JOURNEYS grows.
+
+Builds a synthetic region-sized `trip_stop_codes` table and times the old
+per-trip Python set loop against `match_journeys` for increasing numbers of
+journeys, checking that both select the same trips. Needs no database.
+
+Run from `backend/`:  uv run python -m benchmarks.journey_matching
+"""
+
+import os
+import random
+import time
+
+import polars as pl
+
+for key in ("SUBSCRIPTION_KEY", "POSTGRES_HOST", "POSTGRES_DB", "POSTGRES_USER"):
+    os.environ.setdefault(key, "stub")
+os.environ.setdefault("POSTGRES_PW", "stub")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+
+from app.API.gtfs import match_journeys
+
+N_TRIPS = 40_000
+STOPS_PER_TRIP = 40
+N_STOP_CODES = 6_000
+JOURNEY_COUNTS = (1, 10, 100, 500)
+
+
+def make_trip_stop_codes(rng: random.Random) -> pl.DataFrame:
+    trip_ids, stop_codes, sequences = [], [], []
+    for trip in range(N_TRIPS):
+        # Trips run along a stretch of consecutive stop codes, like a route
+        start = rng.randrange(N_STOP_CODES - STOPS_PER_TRIP)
+        trip_ids += [f"trip-{trip}"] * STOPS_PER_TRIP
+        stop_codes += range(start, start + STOPS_PER_TRIP)
+        sequences += range(1, STOPS_PER_TRIP + 1)
+    return pl.DataFrame(
+        {"trip_id": trip_ids, "stop_code": stop_codes, "stop_sequence": sequences}
+    )
+
+
+def make_journeys(rng: random.Random, n: int) -> list[tuple]:
+    journeys = []
+    for _ in range(n):
+        start = rng.randrange(N_STOP_CODES - 10)
+        journeys.append((start, start + rng.randrange(1, 10)))
+    return journeys
+
+
+def python_loop(trip_stop_codes: pl.DataFrame, journeys: list[tuple]) -> list[str]:
+    """The original Phase 1 matcher."""
+    journey_stop_sets = [set(j) for j in journeys]
+    trip_stop_groups = trip_stop_codes.group_by("trip_id").agg(pl.col("stop_code"))
+    return [
+        row["trip_id"]
+        for row in trip_stop_groups.iter_rows(named=True)
+        if any(jset.issubset(set(row["stop_code"])) for jset in journey_stop_sets)
+    ]
+
+
+def main() -> None:
+    rng = random.Random(0)
+    trip_stop_codes = make_trip_stop_codes(rng)
+    print(f"{trip_stop_codes.height:,} trip stop rows, {N_TRIPS:,} trips")
+    for n in JOURNEY_COUNTS:
+        journeys = make_journeys(rng, n)
+
+        start = time.perf_counter()
+        expected = python_loop(trip_stop_codes, journeys)
+        loop_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matched = match_journeys(trip_stop_codes, journeys).to_list()
+        vector_s = time.perf_counter() - start
+
+        assert sorted(matched) == sorted(expected), "matchers disagree"
+        print(
+            f"{n:>4} journeys  {len(matched):>6,} trips  "
+            f"python loop {loop_s:7.3f}s  match_journeys {vector_s:7.3f}s  "
+            f"({loop_s / vector_s:5.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
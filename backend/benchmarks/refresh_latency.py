@@ -0,0 +1,174 @@
+"""API latency while the GTFS tables are built inline vs in a worker process.
+
+Serves the app with uvicorn and probes `/health` every PROBE_INTERVAL seconds while
+`Controller._build` runs in the API process ("inline") and in the build worker
+("process"), then reports the /health latency percentiles and the build time.
+
+Uses the most recently used feed version in the GTFS cache if there is one, and
+otherwise generates a synthetic feed about the size of the Auckland network, with
+JOURNEYS picked from it. No database is needed.
+
+Run from `backend/`:  uv run python -m benchmarks.refresh_latency
+"""
+
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import polars as pl
+import uvicorn
+
+for key, value in {
+    "SUBSCRIPTION_KEY": "stub",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "stub",
+    "POSTGRES_USER": "stub",
+    "POSTGRES_PW": "stub",
+}.items():
+    os.environ.setdefault(key, value)
+
+from app.API.gtfs import Controller
+from app.config import settings
+from app.main import app
+
+PORT = 8766
+PROBE_INTERVAL = 0.01
+N_STOPS = 8_000
+N_PATTERNS = 400
+STOPS_PER_PATTERN = 40
+TRIPS_PER_PATTERN = 50
+
+
+def make_feed(p: Path) -> None:
+    """Write a synthetic feed in the cache's Parquet layout and set JOURNEYS."""
+    stop = pl.int_range(N_STOPS)
+    pl.select(
+        stop_id=pl.format("stop-{}", stop),
+        location_type=pl.lit(0),
+        stop_code=stop + 1000,
+        stop_lat=-36.8 - stop / 100_000,
+        stop_lon=174.7 + (stop * 7919 % N_STOPS) / 100_000,
+        stop_name=pl.format("Stop {}", stop),
+    ).write_parquet(p / "stops.parquet")
+    pl.DataFrame(
+        {"service_id": ["weekday"], **{d: [1] for d in ("monday", "tuesday")}}
+    ).with_columns(
+        **{d: pl.lit(1) for d in ("wednesday", "thursday", "friday")},
+        saturday=pl.lit(0),
+        sunday=pl.lit(0),
+    ).write_parquet(p / "calendar.parquet")
+
+    # Each pattern visits STOPS_PER_PATTERN stops; its shape passes through them
+    pattern = pl.int_range(N_PATTERNS * STOPS_PER_PATTERN) // STOPS_PER_PATTERN
+    seq = pl.int_range(N_PATTERNS * STOPS_PER_PATTERN) % STOPS_PER_PATTERN
+    pattern_stops = pl.select(
+        pattern=pattern,
+        stop_sequence=seq + 1,
+        stop=(pattern * 131 + seq * 17) % N_STOPS,
+    )
+    pattern_stops.join(
+        pl.read_parquet(p / "stops.parquet").with_row_index("stop"),
+        on=pl.col("stop").cast(pl.UInt32),
+        how="left",
+    ).select(
+        shape_id=pl.format("shape-{}", "pattern"),
+        shape_pt_lat="stop_lat",
+        shape_pt_lon="stop_lon",
+        shape_pt_sequence="stop_sequence",
+    ).write_parquet(p / "shapes.parquet")
+
+    trip = pl.int_range(N_PATTERNS * TRIPS_PER_PATTERN)
+    trips = pl.select(
+        trip=trip,
+        pattern=trip // TRIPS_PER_PATTERN,
+    )
+    trips.select(
+        route_id=pl.format("route-{}", pl.col("pattern") // 2),
+        service_id=pl.lit("weekday"),
+        trip_id=pl.format("trip-{}", "trip"),
+        direction_id=pl.col("pattern") % 2,
+        shape_id=pl.format("shape-{}", "pattern"),
+    ).write_parquet(p / "trips.parquet")
+    trips.join(pattern_stops, on="pattern").select(
+        trip_id=pl.format("trip-{}", "trip"),
+        stop_id=pl.format("stop-{}", "stop"),
+        stop_sequence="stop_sequence",
+    ).write_parquet(p / "stop_times.parquet")
+
+    journeys = [
+        [1000 + (pattern * 131 + seq * 17) % N_STOPS for seq in range(3, 9)]
+        for pattern in range(0, N_PATTERNS, 150)
+    ]
+    os.environ["JOURNEYS"] = json.dumps(journeys)
+
+
+def cached_feed() -> Path | None:
+    root = Path(settings.gtfs_cache_dir) / settings.gtfs_feeds[0].name
+    versions = [p for p in root.glob("*") if (p / "hashes.json").exists()]
+    if not versions or "JOURNEYS" not in os.environ:
+        return None
+    return max(versions, key=lambda p: p.stat().st_mtime)
+
+
+def probe(stop: threading.Event, latencies: list[float]) -> None:
+    with httpx.Client(base_url=f"http://127.0.0.1:{PORT}") as client:
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get("/health")
+            latencies.append(time.perf_counter() - start)
+            time.sleep(PROBE_INTERVAL)
+
+
+def run(con: Controller, feed: Path, mode: str) -> None:
+    settings.gtfs_build_mode = mode
+    latencies: list[float] = []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(stop, latencies))
+    prober.start()
+    time.sleep(0.5)  # baseline before the build starts
+    start = time.perf_counter()
+    relevant_trips, *_ = con._build(feed)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+
+    latencies.sort()
+    q = statistics.quantiles(latencies, n=100)
+    print(
+        f"{mode:<8} build {elapsed:6.2f}s ({len(relevant_trips)} trips)  "
+        f"/health p50 {q[49] * 1000:6.1f}ms  p99 {q[98] * 1000:6.1f}ms  "
+        f"max {latencies[-1] * 1000:6.1f}ms"
+    )
+
+
+def main() -> None:
+    server = uvicorn.Server(
+        uvicorn.Config(app, port=PORT, log_level="warning", lifespan="off")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    con = Controller()
+    with tempfile.TemporaryDirectory() as tmp:
+        feed = cached_feed()
+        if feed is None:
+            feed = Path(tmp)
+            make_feed(feed)
+        print(f"feed: {feed}")
+        for mode in ("inline", "process", "inline", "process"):
+            run(con, feed, mode)
+
+    server.should_exit = True
+    thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark snapping stops to their shapes at full-network scale.
+
+Builds a synthetic Auckland-sized network: shapes wander across the region with
+points every ~20 m, and each shape's stops sit a few metres off its line rather
+than on a shape point. Times `snap_stops` against a brute-force nearest-point
+search, checks both agree, and counts how many stops the old exact-coordinate
+join would have kept. Needs no database.
+
+Run from `backend/`:  uv run python -m benchmarks.stop_snapping
+"""
+
+import math
+import os
+import random
+import time
+
+import polars as pl
+
+for key in ("SUBSCRIPTION_KEY", "POSTGRES_HOST", "POSTGRES_DB", "POSTGRES_USER"):
+    os.environ.setdefault(key, "stub")
+os.environ.setdefault("POSTGRES_PW", "stub")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+
+from app.utils.shapes import distance_m, shape_distances, snap_stops
+
+N_SHAPES = 1_200
+POINTS_PER_SHAPE = 1_000
+STOPS_PER_SHAPE = 40
+STEP_M = 20
+OFFSET_M = 8
+MAX_DISTANCE_M = 100.0
+# Shapes per brute-force batch, so its stop x point table fits in memory
+BRUTE_FORCE_BATCH = 50
+# Roughly central Auckland
+ORIGIN = (-36.85, 174.76)
+
+
+def make_network(rng: random.Random) -> tuple[pl.DataFrame, pl.DataFrame]:
+    deg_lat = STEP_M / 110_574
+    deg_lon = STEP_M / (111_320 * math.cos(math.radians(ORIGIN[0])))
+    shape_cols = {k: [] for k in ("shape_id", "shape_pt_lat", "shape_pt_lon")}
+    shape_cols["shape_pt_sequence"] = []
+    stop_cols = {k: [] for k in ("shape_id", "stop_id", "stop_lat", "stop_lon")}
+    for shape in range(N_SHAPES):
+        lat = ORIGIN[0] + rng.uniform(-0.3, 0.3)
+        lon = ORIGIN[1] + rng.uniform(-0.3, 0.3)
+        heading = rng.uniform(0, 2 * math.pi)
+        line = []
+        for _ in range(POINTS_PER_SHAPE):
+            heading += rng.gauss(0, 0.15)
+            lat += deg_lat * math.sin(heading)
+            lon += deg_lon * math.cos(heading)
+            line.append((lat, lon))
+        shape_id = f"shape-{shape}"
+        shape_cols["shape_id"] += [shape_id] * POINTS_PER_SHAPE
+        shape_cols["shape_pt_lat"] += [p[0] for p in line]
+        shape_cols["shape_pt_lon"] += [p[1] for p in line]
+        shape_cols["shape_pt_sequence"] += range(1, POINTS_PER_SHAPE + 1)
+        # Stops sit between shape points and off to one side of the road
+        for i in sorted(rng.sample(range(POINTS_PER_SHAPE - 1), STOPS_PER_SHAPE)):
+            (lat1, lon1), (lat2, lon2) = line[i], line[i + 1]
+            stop_cols["shape_id"].append(shape_id)
+            stop_cols["stop_id"].append(f"{shape_id}-stop-{i}")
+            stop_cols["stop_lat"].append(
+                (lat1 + lat2) / 2 + rng.uniform(-1, 1) * OFFSET_M / 110_574
+            )
+            stop_cols["stop_lon"].append(
+                (lon1 + lon2) / 2 + rng.uniform(-1, 1) * OFFSET_M / 89_000
+            )
+    return pl.DataFrame(stop_cols), pl.DataFrame(shape_cols)
+
+
+def brute_force(stops: pl.DataFrame, shapes: pl.DataFrame) -> pl.DataFrame:
+    """Compare every stop with every point of its shape, in batches of shapes."""
+    points = shape_distances(shapes)
+    distance = distance_m(
+        pl.col("stop_lat"),
+        pl.col("stop_lon"),
+        pl.col("shape_pt_lat"),
+        pl.col("shape_pt_lon"),
+    )
+    shape_ids = stops["shape_id"].unique().to_list()
+    batches = []
+    for i in range(0, len(shape_ids), BRUTE_FORCE_BATCH):
+        batch = shape_ids[i : i + BRUTE_FORCE_BATCH]
+        batches.append(
+            stops.filter(pl.col("shape_id").is_in(batch))
+            .join(points.filter(pl.col("shape_id").is_in(batch)), on="shape_id")
+            .with_columns(snap_distance_m=distance)
+            .group_by("shape_id", "stop_id")
+            .agg(
+                pl.col("shape_dist_traveled").sort_by("snap_distance_m").first(),
+                pl.col("snap_distance_m").min(),
+            )
+            .filter(pl.col("snap_distance_m") <= MAX_DISTANCE_M)
+        )
+    return pl.concat(batches)
+
+
+def main() -> None:
+    rng = random.Random(0)
+    stops, shapes = make_network(rng)
+    print(f"{shapes.height:,} shape points, {stops.height:,} (shape, stop) pairs")
+
+    start = time.perf_counter()
+    exact = stops.join(
+        shapes,
+        left_on=["shape_id", "stop_lat", "stop_lon"],
+        right_on=["shape_id", "shape_pt_lat", "shape_pt_lon"],
+    )
+    exact_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = brute_force(stops, shapes)
+    brute_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    snapped = snap_stops(stops, shapes, MAX_DISTANCE_M)
+    snap_s = time.perf_counter() - start
+
+    key = ["shape_id", "stop_id"]
+    assert snapped.sort(key)[key].equals(expected.sort(key)[key]), "snappers disagree"
+    assert (
+        snapped.sort(key)["snap_distance_m"] - expected.sort(key)["snap_distance_m"]
+    ).abs().max() < 1e-6, "snappers disagree"
+
+    print(f"exact join   {exact_s:7.3f}s  {exact.height:>7,} stops kept")
+    print(f"brute force  {brute_s:7.3f}s  {expected.height:>7,} stops kept")
+    print(
+        f"snap_stops   {snap_s:7.3f}s  {snapped.height:>7,} stops kept  "
+        f"({brute_s / snap_s:5.1f}x)  "
+        f"max snap {snapped['snap_distance_m'].max():.1f}m"
+    )
+
+
+if __name__ == "__main__":
+    main()
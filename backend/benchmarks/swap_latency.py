@@ -0,0 +1,116 @@
+"""Reader latency while GTFS tables are written per `gtfs_load_mode`.
+
+Builds the full network of a synthetic Auckland-sized feed, loads it, then writes a
+changed version (a tenth of the trips dropped, a tenth re-routed) with each load
+mode in turn. Meanwhile a reader thread runs the trips-for-a-segment lookup every
+PROBE_INTERVAL seconds on its own connection. Reports the write time and the
+reader's latency percentiles.
+
+Replaces the GTFS tables, so point it at a scratch database initialised from
+`data/init.sql`, with the usual POSTGRES_* env vars.
+
+Run from `backend/`:  uv run python -m benchmarks.swap_latency
+"""
+
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import polars as pl
+from sqlalchemy import text
+
+os.environ.setdefault("SUBSCRIPTION_KEY", "stub")
+os.environ["GTFS_NETWORK_SCOPE"] = "full"
+
+from app.API.gtfs import Controller
+from app.config import settings
+from app.models.models import Calendar
+from benchmarks.refresh_latency import make_feed
+
+MODES = ("upsert", "diff", "swap")
+PROBE_INTERVAL = 0.01
+READER_QUERY = text(
+    "SELECT t.trip_id, t.route_id FROM trips t "
+    "JOIN trip_segments ts ON ts.trip_id = t.trip_id WHERE ts.segment_id = :segment"
+)
+
+
+def changed(relevant_trips: pl.DataFrame, segments: pl.DataFrame, run: int) -> tuple:
+    """A tenth of the trips dropped and another tenth moved to a new route."""
+    n = pl.col("trip_id").str.extract(r"(\d+)$").cast(pl.Int64)
+    keep = (n + run) % 10 != 0
+    trips = relevant_trips.filter(keep).with_columns(
+        route_id=pl.when((n + run) % 10 == 1)
+        .then(pl.format("{}-r{}", "route_id", pl.lit(run)))
+        .otherwise("route_id")
+    )
+    return trips, segments.join(trips.select("trip_id"), on="trip_id", how="semi")
+
+
+def probe(
+    con: Controller, segment: str, stop: threading.Event, latencies: list[float]
+) -> None:
+    with con.engine.connect() as conn:
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn.execute(READER_QUERY, {"segment": segment}).all()
+            conn.commit()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(PROBE_INTERVAL)
+
+
+def write(con: Controller, tables: list, mode: str) -> None:
+    settings.gtfs_load_mode = mode
+    if mode == "swap":
+        con._swap_gtfs(tables, {})
+        return
+    with con.get_session() as session:
+        for model, rows in tables:
+            con._sync_table(session, model, rows, delete_stale=mode == "diff")
+        session.commit()
+
+
+def main() -> None:
+    con = Controller()
+    with tempfile.TemporaryDirectory() as tmp:
+        make_feed(Path(tmp))
+        relevant_trips, segments, key_segments, calendar, stops = con._build_dataframes(
+            Path(tmp)
+        )
+    segment = segments["segment_id"][0]
+    print(f"{relevant_trips.height:,} trips, {segments.height:,} trip_segments")
+
+    def tables(run: int) -> list:
+        trips, trip_segments = changed(relevant_trips, segments, run)
+        return [
+            (Calendar, con._feed_rows(calendar)),
+            *con._network_tables(trips, trip_segments, key_segments, stops),
+        ]
+
+    write(con, tables(0), "swap")
+    for run, mode in enumerate(MODES * 2, start=1):
+        run_tables = tables(run)
+        latencies: list[float] = []
+        stop = threading.Event()
+        prober = threading.Thread(target=probe, args=(con, segment, stop, latencies))
+        prober.start()
+        time.sleep(0.5)  # baseline before the write starts
+        start = time.perf_counter()
+        write(con, run_tables, mode)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+
+        latencies.sort()
+        q = statistics.quantiles(latencies, n=100)
+        print(
+            f"{mode:<7} write {elapsed:6.2f}s  reader p50 {q[49] * 1000:6.1f}ms  "
+            f"p99 {q[98] * 1000:6.1f}ms  max {latencies[-1] * 1000:7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark the executemany INSERT against the COPY + staging-table merge.
+
+Needs a database initialised from `data/init.sql` and the usual POSTGRES_* env vars.
+Rows are written against throwaway `bench-` trips, which are removed afterwards.
+
+Run from `backend/`:  uv run python -m benchmarks.vehicle_location_writer
+"""
+
+import datetime
+import os
+import time
+
+import polars as pl
+from sqlalchemy import text
+
+os.environ.setdefault("SUBSCRIPTION_KEY", "stub")
+
+from app.API.vehicles import Controller
+from app.utils.feed_tables import VEHICLE_LOCATION_SCHEMA
+
+BATCH_SIZES = (1_000, 10_000, 100_000)
+N_TRIPS = 50
+ID_BASE = 2_000_000_000
+
+
+def make_batch(n_rows: int, id_offset: int) -> pl.DataFrame:
+    start_time = datetime.datetime(2026, 1, 31, 23, 45)
+    i = pl.col("i")
+    return (
+        pl.DataFrame({"i": range(n_rows)})
+        .select(
+            id=ID_BASE + id_offset + i,
+            trip_id=pl.format("bench-trip-{}", i % N_TRIPS),
+            occupancy_status=i % 3,
+            bearing=(i % 360).cast(pl.Float64),
+            latitude=-36.8 - (i % 1000) / 10_000,
+            longitude=174.7 + (i % 1000) / 10_000,
+            speed=(i % 20).cast(pl.Float64),
+            timestamp=1_769_856_117 + i,
+            start_time=pl.lit(start_time).dt.replace_time_zone("Pacific/Auckland"),
+            route_id=pl.lit("BENCH-1"),
+            direction_id=i % 2,
+            schedule_relationship=pl.lit(0),
+            is_deleted=pl.lit(False),
+            stop_sequence=i % 40 + 1,
+            stop_id=pl.format("bench-stop-{}", i % 40),
+            stop_schedule_relationship=pl.lit(0),
+            departure_delay=pl.lit(60),
+            departure_time=1_769_856_200 + i,
+            departure_uncertainty=pl.lit(None),
+            vehicle_id=(i % 1500).cast(pl.String),
+            label=pl.format("NB{}", i % 1500),
+            license_plate=pl.lit(None),
+            delay=pl.lit(60),
+            feed_id=pl.lit("bench"),
+        )
+        .cast(VEHICLE_LOCATION_SCHEMA)
+    )
+
+
+def main() -> None:
+    con = Controller()
+    with con.get_session() as session:
+        session.execute(
+            text(
+                "INSERT INTO calendar VALUES ('bench', 1, 1, 1, 1, 1, 1, 1, 'bench') "
+                "ON CONFLICT DO NOTHING"
+            )
+        )
+        for i in range(N_TRIPS):
+            session.execute(
+                text(
+                    "INSERT INTO trips (trip_id, route_id, service_id, direction_id, "
+                    "shape_id, feed_id) "
+                    "VALUES (:trip_id, 'BENCH-1', 'bench', 0, 'bench', 'bench') "
+                    "ON CONFLICT DO NOTHING"
+                ),
+                {"trip_id": f"bench-trip-{i}"},
+            )
+        session.commit()
+
+    try:
+        id_offset = 0
+        for n_rows in BATCH_SIZES:
+            for name, write in (("insert", con._insert_rows), ("copy", con._copy_rows)):
+                batch = make_batch(n_rows, id_offset)
+                id_offset += n_rows
+                start = time.perf_counter()
+                write(batch)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{n_rows:>7} rows  {name:<6} {elapsed:8.3f}s  "
+                    f"{n_rows / elapsed:>10,.0f} rows/s"
+                )
+    finally:
+        with con.get_session() as session:
+            session.execute(
+                text("DELETE FROM vehicle_locations WHERE trip_id LIKE 'bench-trip-%'")
+            )
+            session.execute(text("DELETE FROM trips WHERE service_id = 'bench'"))
+            session.execute(text("DELETE FROM calendar WHERE service_id = 'bench'"))
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
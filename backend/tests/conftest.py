@@ -0,0 +1,46 @@
+import os
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+# The app reads these on import. The stubs let tests that need no database import
+# it, and tests that do skip when the POSTGRES_* vars don't reach one.
+for key, value in {
+    "SUBSCRIPTION_KEY": "stub",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "stub",
+    "POSTGRES_USER": "stub",
+    "POSTGRES_PW": "stub",
+}.items():
+    os.environ.setdefault(key, value)
+
+from app.utils.db import get_engine
+
+
+@pytest.fixture(scope="session")
+def database() -> None:
+    """Skip unless POSTGRES_* point at a database initialised from data/init.sql."""
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except OperationalError as e:
+        pytest.skip(f"PostgreSQL is unavailable: {e.orig}")
+
+
+@pytest.fixture
+def service(database: None) -> Iterator[str]:
+    """A calendar service for test trips, removed with its trips afterwards."""
+    with get_engine().begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO calendar VALUES ('test', 1, 1, 1, 1, 1, 1, 1, 'test') "
+                "ON CONFLICT DO NOTHING"
+            )
+        )
+    yield "test"
+    with get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM trips WHERE service_id = 'test'"))
+        conn.execute(text("DELETE FROM calendar WHERE service_id = 'test'"))
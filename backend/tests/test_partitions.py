@@ -0,0 +1,200 @@
+import datetime
+import time
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.utils import partitions
+from app.utils.db import BaseDatabase
+
+HOUR = 3600
+# A Monday long before any real rows
+PLAN_WEEK = datetime.date(2020, 1, 6)
+RANGE_SQL = "timestamp >= :lower AND timestamp < :upper"
+
+
+def utc(*args: int) -> int:
+    return int(datetime.datetime(*args, tzinfo=datetime.UTC).timestamp())
+
+
+@pytest.fixture(params=["UTC", "America/New_York", "Pacific/Auckland"])
+def process_tz(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[None]:
+    """Run under each of these local timezones, which must not matter."""
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.usefixtures("process_tz")
+@pytest.mark.parametrize(
+    ("day", "expected"),
+    [
+        # NZDT, UTC+13
+        (datetime.date(2026, 1, 1), utc(2025, 12, 31, 11)),
+        # NZST, UTC+12
+        (datetime.date(2026, 7, 1), utc(2026, 6, 30, 12)),
+    ],
+)
+def test_epoch_is_auckland_midnight(day: datetime.date, expected: int):
+    assert partitions.epoch(day) == expected
+
+
+@pytest.mark.usefixtures("process_tz")
+@pytest.mark.parametrize(
+    ("day", "hours"),
+    [
+        (datetime.date(2026, 6, 1), 24),
+        # Daylight saving ends, the clocks go back an hour
+        (datetime.date(2026, 4, 5), 25),
+        # Daylight saving starts, the clocks go forward an hour
+        (datetime.date(2026, 9, 27), 23),
+    ],
+)
+def test_time_range_covers_the_auckland_day(day: datetime.date, hours: int):
+    lower, upper = partitions.time_range(day, day + datetime.timedelta(days=1))
+
+    assert lower == partitions.epoch(day)
+    assert upper - lower == hours * HOUR
+
+
+@pytest.mark.parametrize("offset", range(7))
+def test_week_range_runs_monday_to_monday(offset: int):
+    monday = datetime.date(2026, 6, 1)
+
+    lower, upper = partitions.week_range(monday + datetime.timedelta(days=offset))
+
+    assert lower == partitions.epoch(monday)
+    assert upper == partitions.epoch(monday + datetime.timedelta(days=7))
+
+
+@pytest.fixture(scope="module")
+def plan_session(database: None) -> Iterator[Session]:
+    """Two week partitions from PLAN_WEEK, filled by 20 vehicles polled each minute."""
+    week = partitions.partition_name(PLAN_WEEK)
+    next_week = partitions.partition_name(PLAN_WEEK + datetime.timedelta(days=7))
+    with BaseDatabase().get_session() as session:
+        try:
+            names = partitions.create_partitions(session, PLAN_WEEK, "week", 1)
+            session.execute(
+                text(
+                    "INSERT INTO calendar VALUES "
+                    "('test-plans', 1, 1, 1, 1, 1, 1, 1, 'test') "
+                    "ON CONFLICT DO NOTHING"
+                )
+            )
+            session.execute(
+                text(
+                    "INSERT INTO trips (trip_id, route_id, service_id, direction_id, "
+                    "shape_id, feed_id) VALUES ('test-plans', 'TEST', 'test-plans', "
+                    "0, 'test', 'test') ON CONFLICT DO NOTHING"
+                )
+            )
+            # Time-major, like the poller writes them
+            session.execute(
+                text(
+                    "INSERT INTO vehicle_locations (id, trip_id, latitude, longitude, "
+                    "speed, timestamp, start_time, route_id, is_deleted, "
+                    "stop_sequence, stop_id, vehicle_id, label, delay, feed_id) "
+                    "SELECT v, 'test-plans', -36.85, 174.76, 0, :lower + t * 60, "
+                    "to_timestamp(:lower + t * 60), 'TEST', false, 0, 'test', "
+                    "'test-' || v, 'Test ' || v, 0, 'test' "
+                    "FROM generate_series(0, (:upper - :lower) / 60 - 1) t, "
+                    "generate_series(0, 19) v ORDER BY t, v"
+                ),
+                {
+                    "lower": partitions.epoch(PLAN_WEEK),
+                    "upper": partitions.epoch(PLAN_WEEK + datetime.timedelta(days=14)),
+                },
+            )
+            # Summarise the BRIN ranges now rather than waiting for autovacuum
+            session.execute(
+                text(
+                    "SELECT brin_summarize_new_values(i.indexrelid) FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid "
+                    "JOIN pg_am am ON am.oid = c.relam WHERE am.amname = 'brin' "
+                    "AND i.indrelid = ANY(CAST(:names AS regclass[]))"
+                ),
+                {"names": names},
+            )
+            for name in names:
+                session.execute(text(f"ANALYZE {name}"))
+            session.commit()
+            yield session
+        finally:
+            session.rollback()
+            session.execute(text(f"DROP TABLE IF EXISTS {week}, {next_week}"))
+            session.execute(text("DELETE FROM trips WHERE service_id = 'test-plans'"))
+            session.execute(
+                text("DELETE FROM calendar WHERE service_id = 'test-plans'")
+            )
+            session.commit()
+
+
+def plan_nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(session: Session, where: str, params: dict) -> list[dict]:
+    """The nodes of the plan for a count over `where`."""
+    ((result,),) = session.execute(
+        text(
+            "EXPLAIN (FORMAT JSON) "
+            f"SELECT count(*) FROM {partitions.TABLE} WHERE {where}"
+        ),
+        params,
+    ).all()
+    return list(plan_nodes(result[0]["Plan"]))
+
+
+def index_methods(session: Session, nodes: list[dict]) -> set[str]:
+    """Access methods (btree, brin) of the indexes the plan reads."""
+    names = [node["Index Name"] for node in nodes if "Index Name" in node]
+    return set(
+        session.scalars(
+            text(
+                "SELECT am.amname FROM pg_class c JOIN pg_am am ON am.oid = c.relam "
+                "WHERE c.relname = ANY(:names)"
+            ),
+            {"names": names},
+        )
+    )
+
+
+def hour_range() -> dict[str, int]:
+    lower = partitions.epoch(PLAN_WEEK + datetime.timedelta(days=2))
+    return {"lower": lower, "upper": lower + HOUR}
+
+
+def test_week_range_scans_only_its_partition(plan_session: Session):
+    lower, upper = partitions.week_range(PLAN_WEEK)
+
+    nodes = explain(plan_session, RANGE_SQL, {"lower": lower, "upper": upper})
+
+    assert {node["Relation Name"] for node in nodes if "Relation Name" in node} == {
+        partitions.partition_name(PLAN_WEEK)
+    }
+
+
+def test_hour_range_uses_an_index(plan_session: Session):
+    nodes = explain(plan_session, RANGE_SQL, hour_range())
+
+    assert "Seq Scan" not in {node["Node Type"] for node in nodes}
+    assert index_methods(plan_session, nodes)
+
+
+def test_hour_range_uses_brin_without_the_btree(plan_session: Session):
+    plan_session.execute(text("DROP INDEX idx_vehicle_locations_timestamp"))
+    try:
+        nodes = explain(plan_session, RANGE_SQL, hour_range())
+        assert index_methods(plan_session, nodes) == {"brin"}
+    finally:
+        # Puts the index back
+        plan_session.rollback()
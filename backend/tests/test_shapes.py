@@ -0,0 +1,164 @@
+import math
+import random
+
+import polars as pl
+import pytest
+
+from app.utils.shapes import (
+    METRES_PER_DEG_LAT,
+    METRES_PER_DEG_LON,
+    distance_m,
+    shape_distances,
+    snap_stops,
+)
+
+# Roughly central Auckland
+ORIGIN = (-36.85, 174.76)
+DEG_LON = 1 / (METRES_PER_DEG_LON * math.cos(math.radians(ORIGIN[0])))
+DEG_LAT = 1 / METRES_PER_DEG_LAT
+
+
+def east_west_shape(shape_id: str, n_points: int, step_m: float) -> pl.DataFrame:
+    """A straight shape running east from ORIGIN with a point every `step_m`."""
+    return pl.DataFrame(
+        {
+            "shape_id": [shape_id] * n_points,
+            "shape_pt_lat": [ORIGIN[0]] * n_points,
+            "shape_pt_lon": [ORIGIN[1] + i * step_m * DEG_LON for i in range(n_points)],
+            "shape_pt_sequence": list(range(1, n_points + 1)),
+        }
+    )
+
+
+def stops_at(shape_id: str, offsets: dict[str, tuple[float, float]]) -> pl.DataFrame:
+    """Stops at (metres east, metres north) of ORIGIN."""
+    return pl.DataFrame(
+        {
+            "shape_id": [shape_id] * len(offsets),
+            "stop_id": list(offsets),
+            "stop_lat": [ORIGIN[0] + north * DEG_LAT for _, north in offsets.values()],
+            "stop_lon": [ORIGIN[1] + east * DEG_LON for east, _ in offsets.values()],
+        }
+    )
+
+
+def brute_force(
+    stops: pl.DataFrame, shapes: pl.DataFrame, max_m: float
+) -> pl.DataFrame:
+    distance = distance_m(
+        pl.col("stop_lat"),
+        pl.col("stop_lon"),
+        pl.col("shape_pt_lat"),
+        pl.col("shape_pt_lon"),
+    )
+    return (
+        stops.join(shape_distances(shapes), on="shape_id")
+        .with_columns(snap_distance_m=distance)
+        .filter(pl.col("snap_distance_m") <= max_m)
+        .group_by("shape_id", "stop_id")
+        .agg(
+            pl.col("shape_dist_traveled").sort_by("snap_distance_m").first(),
+            pl.col("snap_distance_m").min(),
+        )
+    )
+
+
+def by_stop(snapped: pl.DataFrame) -> dict[str, tuple[float, float]]:
+    return {
+        row["stop_id"]: (row["shape_dist_traveled"], row["snap_distance_m"])
+        for row in snapped.iter_rows(named=True)
+    }
+
+
+def test_stops_between_points_snap_to_the_nearest():
+    shapes = east_west_shape("s", 11, 50)
+    stops = stops_at("s", {"near-2": (110, 5), "near-3": (140, -5), "end": (500, 0)})
+
+    snapped = by_stop(snap_stops(stops, shapes, 100))
+
+    assert snapped.keys() == {"near-2", "near-3", "end"}
+    assert snapped["near-2"][0] == pytest.approx(100, rel=1e-3)
+    assert snapped["near-3"][0] == pytest.approx(150, rel=1e-3)
+    assert snapped["end"][0] == pytest.approx(500, rel=1e-3)
+    assert snapped["near-2"][1] == pytest.approx(math.hypot(10, 5), rel=1e-2)
+    assert snapped["end"][1] == pytest.approx(0, abs=1e-6)
+
+
+def test_stops_beyond_the_cutoff_are_left_out():
+    shapes = east_west_shape("s", 11, 50)
+    stops = stops_at("s", {"inside": (250, 95), "outside": (250, 105)})
+
+    snapped = by_stop(snap_stops(stops, shapes, 100))
+
+    assert set(snapped) == {"inside"}
+    assert snapped["inside"][1] <= 100
+
+
+def test_stops_only_snap_to_their_own_shape():
+    shapes = pl.concat([east_west_shape("a", 11, 50), east_west_shape("b", 3, 50)])
+    # 300 m along "a", past the end of "b"
+    stops = pl.concat([stops_at("a", {"x": (300, 0)}), stops_at("b", {"x": (300, 0)})])
+
+    snapped = snap_stops(stops, shapes, 100)
+
+    assert snapped["shape_id"].to_list() == ["a"]
+    assert snapped["shape_dist_traveled"][0] == pytest.approx(300, rel=1e-3)
+
+
+@pytest.mark.parametrize("empty", ["stops", "shapes", "both"])
+def test_empty_inputs_give_an_empty_frame(empty: str):
+    shapes = east_west_shape("s", 3, 50)
+    stops = stops_at("s", {"x": (0, 0)})
+    if empty in ("stops", "both"):
+        stops = stops.clear()
+    if empty in ("shapes", "both"):
+        shapes = shapes.clear()
+
+    snapped = snap_stops(stops, shapes, 100)
+
+    assert snapped.is_empty()
+    assert snapped.columns == [
+        "shape_id",
+        "stop_id",
+        "shape_dist_traveled",
+        "snap_distance_m",
+    ]
+
+
+def test_matches_brute_force_on_winding_shapes():
+    rng = random.Random(0)
+    shape_rows, stop_rows = [], []
+    for shape in range(20):
+        lat, lon, heading = ORIGIN[0], ORIGIN[1] + shape * 0.01, rng.uniform(0, 6)
+        for seq in range(200):
+            heading += rng.gauss(0, 0.3)
+            lat += 20 * DEG_LAT * math.sin(heading)
+            lon += 20 * DEG_LON * math.cos(heading)
+            shape_rows.append((f"s{shape}", lat, lon, seq))
+            if seq % 10 == 5:
+                # Up to 150 m off the line, so some fall outside the cutoff
+                stop_rows.append(
+                    (
+                        f"s{shape}",
+                        f"s{shape}-{seq}",
+                        lat + rng.uniform(-150, 150) * DEG_LAT,
+                        lon + rng.uniform(-150, 150) * DEG_LON,
+                    )
+                )
+    shapes = pl.DataFrame(
+        shape_rows,
+        schema=["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"],
+        orient="row",
+    )
+    stops = pl.DataFrame(
+        stop_rows, schema=["shape_id", "stop_id", "stop_lat", "stop_lon"], orient="row"
+    )
+
+    snapped = by_stop(snap_stops(stops, shapes, 100))
+    expected = by_stop(brute_force(stops, shapes, 100))
+
+    assert 0 < len(expected) < len(stop_rows)
+    assert snapped.keys() == expected.keys()
+    for stop_id, (dist, snap) in expected.items():
+        assert snapped[stop_id][0] == pytest.approx(dist)
+        assert snapped[stop_id][1] == pytest.approx(snap)
@@ -0,0 +1,56 @@
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.utils import table_swap
+from app.utils.db import BaseDatabase
+
+
+@pytest.fixture
+def session(database: None) -> Iterator[Session]:
+    """A parent table and a child with a NOT VALID foreign key to it."""
+    with BaseDatabase().get_session() as session:
+        session.execute(text("CREATE TABLE test_swap_parent (id INTEGER PRIMARY KEY)"))
+        session.execute(text("CREATE TABLE test_swap_child (parent_id INTEGER)"))
+        session.execute(text("INSERT INTO test_swap_parent VALUES (1)"))
+        session.execute(text("INSERT INTO test_swap_child VALUES (1), (2)"))
+        session.execute(
+            text(
+                "ALTER TABLE test_swap_child ADD CONSTRAINT fk_test_swap "
+                "FOREIGN KEY (parent_id) REFERENCES test_swap_parent (id) NOT VALID"
+            )
+        )
+        session.commit()
+        try:
+            yield session
+        finally:
+            session.rollback()
+            session.execute(text("DROP TABLE test_swap_child, test_swap_parent"))
+            session.commit()
+
+
+def is_valid(session: Session) -> bool:
+    return session.scalar(
+        text("SELECT convalidated FROM pg_constraint WHERE conname = 'fk_test_swap'")
+    )
+
+
+def test_validate_returns_constraints_rows_fail(session: Session):
+    constraint = ("test_swap_child", "fk_test_swap", "", [])
+
+    assert table_swap.validate(session, [constraint]) == ["fk_test_swap"]
+    session.commit()
+
+    assert not is_valid(session)
+
+
+def test_validate_validates_constraints_rows_pass(session: Session):
+    session.execute(text("DELETE FROM test_swap_child WHERE parent_id = 2"))
+    constraint = ("test_swap_child", "fk_test_swap", "", [])
+
+    assert table_swap.validate(session, [constraint]) == []
+    session.commit()
+
+    assert is_valid(session)
@@ -0,0 +1,37 @@
+from collections.abc import Iterator
+
+import pytest
+
+from app.API.trips import Controller
+from app.schemas.trips import Trip
+
+
+@pytest.fixture
+def controller(service: str) -> Iterator[Controller]:
+    con = Controller()
+    con.create_trip(
+        Trip(
+            trip_id="test-b:test-trip",
+            feed_id="test-b",
+            route_id="test-b:TEST-1",
+            service_id=service,
+            direction_id=0,
+            shape_id="test",
+        )
+    )
+    yield con
+
+
+def test_update_keeps_the_trips_feed(controller: Controller, service: str):
+    update = Trip(
+        trip_id="test-b:test-trip",
+        route_id="test-b:TEST-1",
+        service_id=service,
+        direction_id=1,
+        shape_id="test",
+    )
+
+    assert controller.update_trip("test-b:test-trip", update)
+
+    trip = controller.get_trip("test-b:test-trip")
+    assert (trip.feed_id, trip.direction_id) == ("test-b", 1)
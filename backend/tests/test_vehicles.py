@@ -0,0 +1,192 @@
+import json
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+from urllib.parse import urlsplit
+
+import polars as pl
+import pytest
+from sqlalchemy import text
+
+from app.API.vehicles import Controller
+from app.config import FeedConfig, settings
+from app.utils.http import get_stats, run_async
+
+# 2000-01-01, before any partition the app makes, so rows land in the default one
+TIMESTAMP = 946_684_800
+VEHICLE_ID = "4325"
+FEEDS = [
+    FeedConfig(
+        name="test-a",
+        url="http://a.test/gtfs.zip",
+        vehicle_positions_url="http://a.test/vehiclelocations",
+        trip_updates_url="http://a.test/tripupdates",
+    ),
+    FeedConfig(
+        name="test-b",
+        url="http://b.test/gtfs.zip",
+        namespace="test-b",
+        vehicle_positions_url="http://b.test/vehiclelocations",
+        trip_updates_url="http://b.test/tripupdates",
+    ),
+]
+
+
+def payloads(trip_id: str) -> tuple[dict, dict]:
+    """Legacy JSON vehicle positions and trip updates with one vehicle on `trip_id`."""
+    trip = {
+        "trip_id": trip_id,
+        "start_time": "23:45:00",
+        "start_date": "20260131",
+        "schedule_relationship": 0,
+        "route_id": "TEST-1",
+        "direction_id": 0,
+    }
+    vehicle = {"id": VEHICLE_ID, "label": f"NB{VEHICLE_ID}"}
+    position = {
+        "id": VEHICLE_ID,
+        "vehicle": {
+            "trip": trip,
+            "position": {"latitude": -36.85, "longitude": 174.76, "speed": 0},
+            "timestamp": TIMESTAMP,
+            "vehicle": vehicle,
+        },
+        "is_deleted": False,
+    }
+    trip_update = {
+        "id": VEHICLE_ID,
+        "trip_update": {
+            "trip": trip,
+            "stop_time_update": [
+                {"stop_sequence": 1, "stop_id": "test-stop", "departure": {"delay": 0}}
+            ],
+            "vehicle": vehicle,
+            "timestamp": TIMESTAMP,
+            "delay": 0,
+        },
+        "is_deleted": False,
+    }
+    header = {"timestamp": TIMESTAMP}
+    return (
+        {"status": "OK", "response": {"header": header, "entity": [position]}},
+        {"status": "OK", "response": {"header": header, "entity": [trip_update]}},
+    )
+
+
+@pytest.fixture
+def controller(service: str) -> Iterator[Controller]:
+    con = Controller(FEEDS)
+    with con.get_session() as session:
+        session.execute(
+            text(
+                "INSERT INTO trips (trip_id, route_id, service_id, direction_id, "
+                "shape_id, feed_id) VALUES "
+                "('test-trip', 'TEST-1', :service, 0, 'test', 'test-a'), "
+                "('test-b:test-trip', 'test-b:TEST-1', :service, 0, 'test', 'test-b')"
+            ),
+            {"service": service},
+        )
+        session.commit()
+    yield con
+    con.write_queue.close()
+    with con.get_session() as session:
+        session.execute(
+            text("DELETE FROM vehicle_locations WHERE feed_id IN ('test-a', 'test-b')")
+        )
+        session.commit()
+
+
+@pytest.mark.parametrize("writer", ["copy", "insert"])
+def test_feeds_sharing_a_vehicle_id_keep_both_rows(
+    controller: Controller, writer: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(settings, "vehicle_location_writer", writer)
+    trip_ids = frozenset({"test-trip", "test-b:test-trip"})
+
+    controller._write_locations(
+        pl.concat(
+            controller._feed_locations(feed, *payloads("test-trip"), trip_ids)
+            for feed in controller.feeds
+        )
+    )
+
+    with controller.get_session() as session:
+        rows = session.execute(
+            text(
+                "SELECT feed_id, trip_id, route_id FROM vehicle_locations "
+                "WHERE id = :id AND timestamp = :ts ORDER BY feed_id"
+            ),
+            {"id": int(VEHICLE_ID), "ts": TIMESTAMP},
+        ).all()
+    assert rows == [
+        ("test-a", "test-trip", "TEST-1"),
+        ("test-b", "test-b:test-trip", "test-b:TEST-1"),
+    ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves an empty feed after DELAY seconds, recording when each path was busy."""
+
+    DELAY = 0.2
+    PAYLOAD = json.dumps({"status": "OK", "response": {"entity": []}}).encode()
+    spans: ClassVar[dict[str, tuple[float, float]]] = {}
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        start = time.perf_counter()
+        time.sleep(self.DELAY)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(self.PAYLOAD)
+        self.spans[self.path] = (start, time.perf_counter())
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+@pytest.fixture(scope="module")
+def stub_controller() -> Iterator[Controller]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub = f"http://127.0.0.1:{server.server_port}"
+    con = Controller(
+        [
+            FeedConfig(
+                name="stub",
+                url=f"{stub}/gtfs.zip",
+                vehicle_positions_url=f"{stub}/vehiclelocations",
+                trip_updates_url=f"{stub}/tripupdates",
+            )
+        ]
+    )
+    yield con
+    con.write_queue.close()
+    server.shutdown()
+
+
+def test_feeds_are_fetched_concurrently(stub_controller: Controller):
+    StubHandler.spans.clear()
+
+    run_async(stub_controller._fetch_feeds())
+
+    (v_start, v_end), (t_start, t_end) = (
+        StubHandler.spans["/vehiclelocations"],
+        StubHandler.spans["/tripupdates"],
+    )
+    assert min(v_end, t_end) > max(v_start, t_start)
+
+
+def test_polls_reuse_connections(stub_controller: Controller):
+    host = urlsplit(stub_controller.feeds[0].vehicle_positions_url).netloc
+    run_async(stub_controller._fetch_feeds())
+    before = get_stats()[host]
+
+    run_async(stub_controller._fetch_feeds())
+
+    after = get_stats()[host]
+    assert after["requests"] - before["requests"] == 2
+    assert after["new_connections"] == before["new_connections"]
@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import polars as pl
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.utils.write_behind import WriteBehindQueue
+
+
+class Writer:
+    """Fails the writes numbered in `failing` (from 0), keeps the others' ids."""
+
+    def __init__(self, failing: set[int]) -> None:
+        self.failing = failing
+        self.calls = 0
+        self.written: list[int] = []
+
+    def __call__(self, rows: pl.DataFrame) -> None:
+        self.calls += 1
+        if self.calls - 1 in self.failing:
+            raise OperationalError("INSERT", None, Exception("connection lost"))
+        self.written.extend(rows["id"])
+
+
+def make_queue(write: Writer, spill_path: Path) -> WriteBehindQueue:
+    return WriteBehindQueue(
+        write,
+        {"id": pl.Int64},
+        max_batches=1,
+        batch_rows=2,
+        flush_interval=0.1,
+        put_timeout=0.1,
+        spill_path=str(spill_path),
+    )
+
+
+def test_replayed_rows_are_counted_once_the_replay_succeeds(tmp_path: Path):
+    # The second batch of the first replay fails
+    writer = Writer(failing={1})
+    queue = make_queue(writer, tmp_path / "spill.ndjson")
+    queue._spill(pl.DataFrame({"id": [1, 2, 3, 4]}))
+
+    with pytest.raises(OperationalError):
+        queue._replay()
+    assert queue.counters["replayed_rows"] == 0
+
+    queue._replay()
+    assert queue.counters["replayed_rows"] == 4
+    assert writer.written == [1, 2, 1, 2, 3, 4]
+    assert not any(tmp_path.iterdir())
+
+
+def test_failed_flushes_are_spilled(tmp_path: Path):
+    writer = Writer(failing={0})
+    queue = make_queue(writer, tmp_path / "spill.ndjson")
+
+    assert not queue._flush(pl.DataFrame({"id": [1, 2]}))
+
+    assert queue.counters["failed_flushes"] == 1
+    assert queue.counters["spilled_rows"] == 2
@@ -7,10 +7,12 @@ CREATE TABLE
         thursday INTEGER NOT NULL,
         friday INTEGER NOT NULL,
         saturday INTEGER NOT NULL,
-        sunday INTEGER NOT NULL
+        sunday INTEGER NOT NULL,
+        feed_id VARCHAR(255) NOT NULL
     );
 
 CREATE INDEX IF NOT EXISTS idx_calendar_service_id ON calendar (service_id);
+CREATE INDEX IF NOT EXISTS idx_calendar_feed_id ON calendar (feed_id);
 
 CREATE TABLE
     IF NOT EXISTS stops (
@@ -19,18 +21,26 @@ CREATE TABLE
         stop_code VARCHAR(255) NOT NULL,
         stop_lat DOUBLE PRECISION NOT NULL,
         stop_lon DOUBLE PRECISION NOT NULL,
-        stop_name VARCHAR(255) NOT NULL
+        stop_name VARCHAR(255) NOT NULL,
+        feed_id VARCHAR(255) NOT NULL
     );
 
+CREATE INDEX IF NOT EXISTS idx_stops_feed_id ON stops (feed_id);
+
 CREATE TABLE
     IF NOT EXISTS segments (
         segment_id VARCHAR(255) PRIMARY KEY,
         start_stop_id VARCHAR(255) NOT NULL,
         end_stop_id VARCHAR(255) NOT NULL,
+        feed_id VARCHAR(255) NOT NULL,
+        -- Metres along the shape between the two stops, NULL for the full-network scope
+        length_m DOUBLE PRECISION,
         CONSTRAINT fk_segments_start_stop FOREIGN KEY (start_stop_id) REFERENCES stops (stop_id) ON DELETE CASCADE,
         CONSTRAINT fk_segments_end_stop FOREIGN KEY (end_stop_id) REFERENCES stops (stop_id) ON DELETE CASCADE
     );
 
+CREATE INDEX IF NOT EXISTS idx_segments_feed_id ON segments (feed_id);
+
 CREATE TABLE
     IF NOT EXISTS trips (
         trip_id VARCHAR(255) PRIMARY KEY,
@@ -39,12 +49,14 @@ CREATE TABLE
         direction_id INTEGER NOT NULL,
         shape_id VARCHAR(255) NOT NULL,
         created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        feed_id VARCHAR(255) NOT NULL,
         CONSTRAINT fk_trips_service_id FOREIGN KEY (service_id) REFERENCES calendar (service_id)
     );
 
 CREATE INDEX IF NOT EXISTS idx_trips_trip_id ON trips (trip_id);
 CREATE INDEX IF NOT EXISTS idx_trips_route_id ON trips (route_id);
 CREATE INDEX IF NOT EXISTS idx_trips_service_id ON trips (service_id);
+CREATE INDEX IF NOT EXISTS idx_trips_feed_id ON trips (feed_id);
 
 CREATE TABLE
     IF NOT EXISTS vehicle_locations (
@@ -72,13 +84,21 @@ CREATE TABLE
         license_plate VARCHAR(255),
         delay INTEGER NOT NULL,
         created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-        PRIMARY KEY (id, timestamp),
+        -- Vehicle ids are only unique within a feed
+        feed_id VARCHAR(255) NOT NULL,
+        PRIMARY KEY (id, timestamp, feed_id),
         CONSTRAINT fk_vehicle_locations_trip_id FOREIGN KEY (trip_id) REFERENCES trips (trip_id)
-    );
+    ) PARTITION BY RANGE (timestamp);
+
+-- The API creates day or week partitions ahead of time, rows outside all of them land here
+CREATE TABLE
+    IF NOT EXISTS vehicle_locations_default PARTITION OF vehicle_locations DEFAULT;
 
 CREATE INDEX IF NOT EXISTS idx_vehicle_locations_trip_id ON vehicle_locations (trip_id);
 CREATE INDEX IF NOT EXISTS idx_vehicle_locations_route_id ON vehicle_locations (route_id);
 CREATE INDEX IF NOT EXISTS idx_vehicle_locations_timestamp ON vehicle_locations (timestamp);
+-- Rows arrive in timestamp order, so a BRIN index covers long ranges cheaply
+CREATE INDEX IF NOT EXISTS idx_vehicle_locations_timestamp_brin ON vehicle_locations USING BRIN (timestamp) WITH (autosummarize = on);
 CREATE INDEX IF NOT EXISTS idx_vehicle_locations_start_time ON vehicle_locations (start_time);
 
 CREATE EXTENSION IF NOT EXISTS postgis;
@@ -91,14 +111,28 @@ GENERATED ALWAYS AS (
 
 CREATE INDEX IF NOT EXISTS idx_vehicle_locations_location ON vehicle_locations USING GIST (location);
 
+-- Bulk writes COPY into this unlogged table, then merge into vehicle_locations
+CREATE UNLOGGED TABLE
+    IF NOT EXISTS vehicle_locations_staging (LIKE vehicle_locations INCLUDING DEFAULTS);
+
 CREATE TABLE
     IF NOT EXISTS trip_segments (
         trip_id VARCHAR(255) NOT NULL,
         segment_id VARCHAR(255) NOT NULL,
+        feed_id VARCHAR(255) NOT NULL,
         PRIMARY KEY (trip_id, segment_id),
         CONSTRAINT fk_trip_segments_trip_id FOREIGN KEY (trip_id) REFERENCES trips (trip_id) ON DELETE CASCADE,
         CONSTRAINT fk_trip_segments_segment_id FOREIGN KEY (segment_id) REFERENCES segments (segment_id) ON DELETE CASCADE
     );
 
 CREATE INDEX IF NOT EXISTS idx_trip_segments_trip_id ON trip_segments (trip_id);
-CREATE INDEX IF NOT EXISTS idx_trip_segments_segment_id ON trip_segments (segment_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_trip_segments_segment_id ON trip_segments (segment_id);
+CREATE INDEX IF NOT EXISTS idx_trip_segments_feed_id ON trip_segments (feed_id);
+
+-- Validators and file hashes of the last applied GTFS feed, so unchanged feeds are skipped
+CREATE TABLE
+    IF NOT EXISTS gtfs_metadata (
+        key VARCHAR(255) PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
@@ -7,6 +7,7 @@ import psycopg2
 from psycopg2.extras import RealDictCursor, execute_values
 import argparse
 import datetime
+from zoneinfo import ZoneInfo
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,6 +34,8 @@ CONNECTION_PARAMS = {
 }
 
 API_BASE = "http://100.111.121.51:8081"
+# vehicle_locations is partitioned by Auckland day or week
+TIMEZONE = ZoneInfo("Pacific/Auckland")
 
 
 def parse_args():
@@ -54,8 +57,20 @@ def query(sql: str, params=None) -> pl.DataFrame:
         rows = cur.fetchall()
     return pl.DataFrame([dict(r) for r in rows])
 
+def epoch_range(start: datetime.date, end: datetime.date) -> tuple[int, int]:
+    """Epoch seconds of Auckland midnight on `start` and on `end`.
+
+    Compare vl.timestamp against these rather than converting it to a date, so
+    its indexes and partition pruning still apply.
+    """
+    return tuple(
+        int(datetime.datetime.combine(day, datetime.time(), TIMEZONE).timestamp())
+        for day in (start, end)
+    )
+
 def get_locations_data(week_start: datetime.date) -> pl.DataFrame:
     week_end = week_start + datetime.timedelta(days=7)
+    lower, upper = epoch_range(week_start, week_end)
     log.info(
         "Connected to %s:%s db=%s | loading week %s → %s",
         CONNECTION_PARAMS["host"], CONNECTION_PARAMS["port"], CONNECTION_PARAMS["database"],
@@ -91,9 +106,8 @@ def get_locations_data(week_start: datetime.date) -> pl.DataFrame:
         JOIN trip_segments ts ON ts.trip_id = vl.trip_id
         JOIN segments s       ON s.segment_id = ts.segment_id
                              AND s.start_stop_id = vl.stop_id
-        WHERE to_timestamp(vl.timestamp)::date >= %(week_start)s
-          AND to_timestamp(vl.timestamp)::date <  %(week_end)s
-    """, {"week_start": week_start, "week_end": week_end})
+        WHERE vl.timestamp >= %(lower)s AND vl.timestamp < %(upper)s
+    """, {"lower": lower, "upper": upper})
 
     log.info("matched_locations (after segment join): %d rows, %d cols", *matched_locations.shape)
     return matched_locations